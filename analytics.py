@@ -0,0 +1,347 @@
+"""
+Incremental rolling analytics of the price and imbalance series.
+
+Every series is reduced to one row of moments per day (count, mean and sum of squared
+deviations, merged with Chan's parallel formulas), kept in the analytics_daily table. The
+rolling mean and standard deviation of every window are computed from those daily rows
+and kept in analytics_rolling. Saving a day only recomputes the moments of that day and
+the rolling values of the next `window` days, so a refresh costs O(new data) instead of
+re-reading the whole history.
+
+Series:
+    day_ahead_price   Day-ahead price (day_ahead.price).
+    cro               Imbalance settlement price (balancing_market.CRO); its rolling
+                      standard deviation is the imbalance price volatility.
+    spread            Hourly day-ahead price minus the intraday average price.
+
+Kept free of heavy imports so that it can be used by the API as well as by the ingest scripts.
+
+Usage:
+    python analytics.py refresh [--database energy.db] [--start YYYY-MM-DD] [--end YYYY-MM-DD]
+    python analytics.py rebuild [--database energy.db]
+"""
+import argparse
+import math
+import sqlite3
+import time
+from datetime import date, timedelta
+
+from metrics import METRICS
+
+WINDOWS = (7, 30)
+
+# Dates per IN (...) query, below SQLite's default limit of host parameters
+_CHUNK = 500
+
+ANALYTICS_REFRESH_SECONDS = METRICS.histogram(
+    'energy_analytics_refresh_seconds', "Duration of an incremental refresh of the rolling "
+    "analytics", ('series',))
+
+
+class Series:
+    """
+    Hourly values of one analytics series.
+
+    Args:
+        tables (tuple): Tables the series is computed from.
+        query (str): Query of (date_value, value) rows, extended with a date filter.
+    """
+
+    def __init__(self, tables: tuple, query: str):
+        self.tables = tables
+        self.query = query
+
+    def values_by_date(self, connection: sqlite3.Connection, days: list) -> dict:
+        """
+        Read the numeric values of the given days.
+
+        Returns:
+            dict: {date_value: [value, ...]} of the days with at least one value.
+        """
+        values = {}
+        for start in range(0, len(days), _CHUNK):
+            chunk = days[start:start + _CHUNK]
+            rows = connection.execute(
+                f"{self.query} WHERE date_value IN ({', '.join('?' * len(chunk))})", chunk)
+            for date_value, value in rows:
+                # Skips NULLs and the text left by old ingests of unparsed values
+                if isinstance(value, (int, float)):
+                    values.setdefault(date_value, []).append(value)
+        return values
+
+
+SERIES = {
+    'day_ahead_price': Series(
+        ('day_ahead',),
+        "SELECT date_value, price FROM day_ahead "
+        "INNER JOIN date ON date.date_id = day_ahead.date_id"),
+    'cro': Series(
+        ('balancing_market',),
+        "SELECT date_value, CRO FROM balancing_market "
+        "INNER JOIN date ON date.date_id = balancing_market.date_id"),
+    'spread': Series(
+        ('day_ahead', 'intra_day'),
+        "SELECT date_value, day_ahead.price - intra_day.intraday_avg_price FROM day_ahead "
+        "INNER JOIN intra_day ON intra_day.date_id = day_ahead.date_id "
+        "AND intra_day.hour_of_day = day_ahead.hour_of_day "
+        "INNER JOIN date ON date.date_id = day_ahead.date_id"),
+}
+
+
+def moments(values: list) -> tuple:
+    """
+    Count, mean and sum of squared deviations of a list of values (Welford).
+    """
+    n, mean, m2 = 0, 0.0, 0.0
+    for value in values:
+        n += 1
+        delta = value - mean
+        mean += delta / n
+        m2 += delta * (value - mean)
+    return n, mean, m2
+
+
+def merge(left: tuple, right: tuple) -> tuple:
+    """
+    Combine the moments of two disjoint sets of values (Chan et al.).
+    """
+    n_left, mean_left, m2_left = left
+    n_right, mean_right, m2_right = right
+    n = n_left + n_right
+    if n == 0:
+        return 0, 0.0, 0.0
+    delta = mean_right - mean_left
+    mean = mean_left + delta * n_right / n
+    return n, mean, m2_left + m2_right + delta * delta * n_left * n_right / n
+
+
+def _day(value: str) -> date:
+    return date.fromisoformat(value)
+
+
+def ensure_schema(connection: sqlite3.Connection):
+    """
+    Create the analytics_daily and analytics_rolling tables if they do not exist.
+
+    Called by the writers (setup, migration, ingest, rebuild) only, so that reading the
+    analytics never writes to the database.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the database of the data tables.
+    """
+    in_transaction = connection.in_transaction
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS analytics_daily "
+        "(series TEXT NOT NULL, date_value DATE NOT NULL, n INTEGER NOT NULL, "
+        "mean REAL NOT NULL, m2 REAL NOT NULL, PRIMARY KEY (series, date_value))")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS analytics_rolling "
+        "(series TEXT NOT NULL, window_days INTEGER NOT NULL, date_value DATE NOT NULL, "
+        "days INTEGER NOT NULL, n INTEGER NOT NULL, mean REAL, std REAL, "
+        "PRIMARY KEY (series, window_days, date_value))")
+    # A transaction of the caller is left for the caller to commit
+    if not in_transaction:
+        connection.commit()
+
+
+class RollingAnalytics:
+    """
+    Daily moments and rolling statistics of the series, stored in the database.
+
+    The tables are created by ensure_schema(); rolling() also works on databases without
+    them, e.g. read-only ones that were never refreshed.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the database of the data tables.
+        windows (tuple): Lengths of the rolling windows in days.
+    """
+
+    def __init__(self, connection: sqlite3.Connection, windows: tuple = WINDOWS):
+        self.connection = connection
+        self.windows = windows
+
+    def watermark(self, series: str) -> str:
+        """
+        Last day with daily moments of a series, None if it was never refreshed.
+        """
+        return self.connection.execute(
+            "SELECT MAX(date_value) FROM analytics_daily WHERE series = ?", (series,)
+        ).fetchone()[0]
+
+    def pending_days(self, series: str) -> list:
+        """
+        Days saved since the last refresh of a series, including the last refreshed day,
+        which may have been saved partially.
+        """
+        watermark = self.watermark(series)
+        rows = self.connection.execute(
+            "SELECT date_value FROM date WHERE date_value >= ? ORDER BY date_value",
+            (watermark or '',))
+        return [row[0] for row in rows]
+
+    def update_daily(self, series: str, days: list):
+        """
+        Recompute the daily moments of the given days, removing the days without values.
+        """
+        values = SERIES[series].values_by_date(self.connection, days)
+        self.connection.executemany(
+            "INSERT INTO analytics_daily (series, date_value, n, mean, m2) "
+            "VALUES (?, ?, ?, ?, ?) ON CONFLICT (series, date_value) "
+            "DO UPDATE SET n = excluded.n, mean = excluded.mean, m2 = excluded.m2",
+            [(series, day, *moments(day_values)) for day, day_values in values.items()])
+        empty = [(series, day) for day in days if day not in values]
+        self.connection.executemany(
+            "DELETE FROM analytics_daily WHERE series = ? AND date_value = ?", empty)
+
+    def update_rolling(self, series: str, days: list):
+        """
+        Recompute the rolling statistics of every window that contains one of the days.
+
+        The windows ending in each run of affected days are computed from the daily moments
+        of that run and of the `window - 1` days before it, never from the whole history.
+        """
+        changed = sorted({_day(day) for day in days})
+        for window in self.windows:
+            for first, last in _runs(changed, window):
+                self._update_run(series, window, first, last)
+
+    def _update_run(self, series: str, window: int, first: date, last: date):
+        start = first - timedelta(days=window - 1)
+        daily = {_day(day): (n, mean, m2) for day, n, mean, m2 in self.connection.execute(
+            "SELECT date_value, n, mean, m2 FROM analytics_daily "
+            "WHERE series = ? AND date_value BETWEEN ? AND ?",
+            (series, start.isoformat(), last.isoformat()))}
+        rows, removed = [], []
+        day = first
+        while day <= last:
+            if day not in daily:
+                removed.append((series, window, day.isoformat()))
+            else:
+                total, days = (0, 0.0, 0.0), 0
+                for offset in range(window):
+                    other = daily.get(day - timedelta(days=offset))
+                    if other is not None:
+                        total = merge(total, other)
+                        days += 1
+                n, mean, m2 = total
+                std = math.sqrt(m2 / (n - 1)) if n > 1 else None
+                rows.append((series, window, day.isoformat(), days, n, mean, std))
+            day += timedelta(days=1)
+        self.connection.executemany(
+            "INSERT INTO analytics_rolling (series, window_days, date_value, days, n, mean, std) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (series, window_days, date_value) "
+            "DO UPDATE SET days = excluded.days, n = excluded.n, mean = excluded.mean, "
+            "std = excluded.std", rows)
+        self.connection.executemany(
+            "DELETE FROM analytics_rolling "
+            "WHERE series = ? AND window_days = ? AND date_value = ?", removed)
+
+    def refresh(self, days: list = None, tables: tuple = None, commit: bool = True) -> dict:
+        """
+        Bring the analytics up to date after days were saved.
+
+        Args:
+            days (list): Saved days (YYYY-MM-DD); by default every day since the last refresh.
+            tables (tuple): Tables that were saved; only the series computed from them are
+                refreshed. All series by default.
+            commit (bool): Commit every series; False leaves the changes in the transaction
+                of the caller.
+
+        Returns:
+            dict: Number of refreshed days per series.
+        """
+        refreshed = {}
+        for name, series in SERIES.items():
+            if tables is not None and not set(series.tables) & set(tables):
+                continue
+            with ANALYTICS_REFRESH_SECONDS.time(series=name):
+                pending = self.pending_days(name) if days is None else list(days)
+                if pending:
+                    self.update_daily(name, pending)
+                    self.update_rolling(name, pending)
+                if commit:
+                    self.connection.commit()
+            refreshed[name] = len(pending)
+        return refreshed
+
+    def rebuild(self) -> dict:
+        """
+        Drop the stored analytics and compute them from the whole history.
+        """
+        ensure_schema(self.connection)
+        self.connection.execute("DELETE FROM analytics_daily")
+        self.connection.execute("DELETE FROM analytics_rolling")
+        return self.refresh()
+
+    def rolling(self, series: str, window: int, start: str = None, end: str = None) -> list:
+        """
+        Read the stored rolling statistics of a series.
+
+        Args:
+            series (str): Name of the series, one of SERIES.
+            window (int): Length of the window in days, one of the windows.
+            start (str): First day (YYYY-MM-DD), inclusive.
+            end (str): Last day (YYYY-MM-DD), inclusive.
+
+        Returns:
+            list: Rows of (date_value, days, n, mean, std) ordered by date, empty if the
+            analytics were never computed.
+        """
+        if not self.connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'analytics_rolling'"
+        ).fetchone():
+            return []
+        return self.connection.execute(
+            "SELECT date_value, days, n, mean, std FROM analytics_rolling "
+            "WHERE series = ? AND window_days = ? AND date_value BETWEEN ? AND ? "
+            "ORDER BY date_value",
+            (series, window, start or '0000-00-00', end or '9999-99-99')).fetchall()
+
+
+def _runs(days: list, window: int) -> list:
+    """
+    Group sorted changed days into runs of affected window ends, [day, day + window - 1]
+    for every changed day, merging runs that overlap or touch.
+    """
+    runs = []
+    for day in days:
+        last = day + timedelta(days=window - 1)
+        if runs and day <= runs[-1][1] + timedelta(days=1):
+            runs[-1][1] = max(runs[-1][1], last)
+        else:
+            runs.append([day, last])
+    return [tuple(run) for run in runs]
+
+
+def refresh_saved(connection: sqlite3.Connection, table: str, day: str,
+                  commit: bool = True) -> dict:
+    """
+    Refresh the series computed from a table after one of its days was saved.
+    """
+    if not any(table in series.tables for series in SERIES.values()):
+        return {}
+    return RollingAnalytics(connection).refresh([day], (table,), commit)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incremental rolling analytics")
+    parser.add_argument('command', choices=['refresh', 'rebuild'])
+    parser.add_argument('--database', default='energy.db')
+    parser.add_argument('--start', help="first day to recompute (YYYY-MM-DD)")
+    parser.add_argument('--end', help="last day to recompute (YYYY-MM-DD)")
+    options = parser.parse_args()
+
+    database = sqlite3.connect(options.database)
+    ensure_schema(database)
+    analytics = RollingAnalytics(database)
+    started = time.perf_counter()
+    if options.command == 'rebuild':
+        result = analytics.rebuild()
+    elif options.start:
+        first = _day(options.start)
+        last = _day(options.end) if options.end else date.today()
+        result = analytics.refresh([(first + timedelta(days=offset)).isoformat()
+                                    for offset in range((last - first).days + 1)])
+    else:
+        result = analytics.refresh()
+    print(f"{options.command}: {result} days in {time.perf_counter() - started:.2f}s")
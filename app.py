@@ -1,30 +1,209 @@
-from flask import Flask, g, jsonify
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
+import os
 import sqlite3
-import json
+import time
+from analytics import SERIES, WINDOWS, RollingAnalytics
+from chart_data import CACHE as CHART_CACHE, DEFAULT_POINTS, MAX_POINTS
 from database import Database
+from endpoints import ENDPOINTS, TableEndpoint, group_by_date, parse_batch, select_batch
+from metrics import API_BYTES, API_ROWS, API_STAGE_SECONDS, METRICS
+from profiling import MODES, enabled_mode, requests_allowed, start_session
+from schema import TABLES
 
 app = Flask(__name__)
 CORS(app)
 DATABASE = 'energy.db'
+# Directory of the memory-mapped hot store (see hot_store.py); the store is disabled if unset.
+HOT_STORE_DIR = os.environ.get('HOT_STORE_DIR')
+_hot_store = None
+# Directory of the read-only snapshots (see snapshot.py); DATABASE is read directly if unset.
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR')
+_snapshots = None
 
 
 def get_db() -> Database:
     """
    Retrieve the database connection from the Flask application context.
 
+   With SNAPSHOT_DIR set, the connection is opened read-only on the newest published
+   snapshot, so a new version is used from the next request on.
+
    Returns:
    Database: The database connection.
    """
     db = getattr(g, '_database', None)
     if db is None:
-        db = g._database = Database(DATABASE)
+        snapshot = current_snapshot()
+        if snapshot is not None:
+            from snapshot import connect
+            db = g._database = Database(snapshot, connect(snapshot))
+        else:
+            db = g._database = Database(DATABASE)
     return db
 
 
+def current_snapshot():
+    """
+    Path to the newest published snapshot.
+
+    Returns:
+    str: The snapshot file, or None if SNAPSHOT_DIR is not set or nothing was published yet.
+    """
+    global _snapshots
+    if not SNAPSHOT_DIR:
+        return None
+    if _snapshots is None:
+        from snapshot import SnapshotDirectory
+        _snapshots = SnapshotDirectory(SNAPSHOT_DIR)
+    return _snapshots.current()
+
+
+def database_version():
+    """
+    Value changing whenever the data read by the API changes: the snapshot file, which is
+    never modified, or the modification time of DATABASE.
+    """
+    return current_snapshot() or os.stat(DATABASE).st_mtime_ns
+
+
+def get_hot_store():
+    """
+    Retrieve the memory-mapped hot store shared by all requests of this worker.
+
+    The store is built from the database on first use if it does not exist yet and is
+    re-opened whenever an ingest run has refreshed it.
+
+    Returns:
+    HotStore: The hot store, or None if HOT_STORE_DIR is not set.
+    """
+    global _hot_store
+    if not HOT_STORE_DIR:
+        return None
+    if _hot_store is None:
+        from hot_store import open_or_build
+        _hot_store = open_or_build(HOT_STORE_DIR, DATABASE)
+    else:
+        _hot_store.reload_if_changed()
+    return _hot_store
+
+
+def observe_request(started: float, queried: float, rows: int, response: Response):
+    """
+    Record the query and serialization time, rows and bytes of a data endpoint.
+
+    Args:
+    started (float): time.perf_counter() at the start of the request.
+    queried (float): time.perf_counter() after the query.
+    rows (int): Number of rows returned by the query.
+    response (Response): The serialized response.
+    """
+    endpoint = request.endpoint
+    API_STAGE_SECONDS.observe(queried - started, endpoint=endpoint, stage='query')
+    API_STAGE_SECONDS.observe(time.perf_counter() - queried, endpoint=endpoint, stage='serialize')
+    API_ROWS.inc(rows, endpoint=endpoint)
+    API_BYTES.inc(response.content_length or 0, endpoint=endpoint)
+
+
+@app.before_request
+def start_request_profile():
+    """
+    Profile the request if ENERGY_PROFILE enables the api scope, or if it sends the
+    X-Energy-Profile header and ENERGY_PROFILE_REQUESTS allows it (see profiling.py).
+    """
+    mode = request.headers.get('X-Energy-Profile') if requests_allowed() else None
+    if mode not in MODES:
+        mode = enabled_mode('api')
+    if mode is not None:
+        g._profiler = start_session(f"api-{request.endpoint}", 'api', mode=mode)
+
+
+@app.after_request
+def stop_request_profile(response: Response) -> Response:
+    """
+    Write the profile of the request. Profiler.stop() prints the full path on the server;
+    the client only gets the file name, in the X-Energy-Profile-File header.
+    """
+    profiler = g.pop('_profiler', None)
+    if profiler is not None:
+        response.headers['X-Energy-Profile-File'] = os.path.basename(profiler.stop())
+    return response
+
+
+@app.teardown_request
+def close_request_profile(error: BaseException = None):
+    """
+    Stop a profile that stop_request_profile() did not reach, when the view or an
+    after_request handler raised, so that the cProfile session of the worker thread is
+    disabled and later requests can be profiled again.
+    """
+    profiler = g.pop('_profiler', None)
+    if profiler is not None:
+        profiler.stop()
+
+
+@app.route("/metrics")
+def fetch_metrics():
+    return Response(METRICS.render(), mimetype='text/plain; version=0.0.4')
+
+
 # Add your setup_command function here to create tables
 
-def fetch_data_endpoint(query: str, endpoint_name: str, key_names: list[str]) -> jsonify:
+def fetch_table(endpoint: TableEndpoint, date: str = None) -> jsonify:
+    """
+    Serve all rows of a table, or the rows of one day if a date is given.
+
+    Args:
+    endpoint (TableEndpoint): Routes and queries of the table (see endpoints.py).
+    date (str): Date to filter the results.
+
+    Returns:
+    jsonify: Flask JSON response containing the organized data.
+    """
+    if date is None:
+        return fetch_data_endpoint(endpoint.query, endpoint.name, endpoint.key_names,
+                                   table=endpoint.table)
+    return fetch_data_endpoint_by_date(endpoint.query_by_date, endpoint.date_name,
+                                       endpoint.key_names, date, table=endpoint.table)
+
+
+def fetch_table_batch(endpoint: TableEndpoint) -> jsonify:
+    """
+    Serve the rows of a list of days, optionally restricted to some hours, in one response.
+
+    The days and hours are read from the comma separated "dates" and "hours" query
+    parameters, or from the "dates" and "hours" lists of a JSON body for long lists.
+
+    Args:
+    endpoint (TableEndpoint): Routes and queries of the table (see endpoints.py).
+
+    Returns:
+    jsonify: Flask JSON response grouped by date like the by-date endpoint, 400 for invalid
+    dates or hours.
+    """
+    body = request.get_json(silent=True) if request.method == 'POST' else None
+    source = body if isinstance(body, dict) else request.args
+    try:
+        days, hours = parse_batch(source.get('dates', []), source.get('hours'))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    started = time.perf_counter()
+    store = get_hot_store()
+    if store is not None and store.has_table(endpoint.table):
+        results = [row for day in days for row in store.select_by_date(endpoint.table, day)
+                   if not hours or row[2] in hours]
+    else:
+        results = select_batch(get_db().connection, endpoint, days, hours)
+    queried = time.perf_counter()
+
+    response = jsonify(group_by_date(results, endpoint.date_name, endpoint.key_names))
+    observe_request(started, queried, len(results), response)
+    return response
+
+
+def fetch_data_endpoint(query: str, endpoint_name: str, key_names: list[str],
+                        table: str = None) -> jsonify:
     """
    Fetch data from the database based on the provided query and organize it by date.
 
@@ -32,39 +211,31 @@ def fetch_data_endpoint(query: str, endpoint_name: str, key_names: list[str]) ->
    query (str): SQL query to fetch data.
    endpoint_name (str): Name of the endpoint.
    key_names (list[str]): List of key names for the records.
+   table (str): Table queried, used to answer from the hot store when it is enabled.
 
    Returns:
    jsonify: Flask JSON response containing the organized data.
    """
-    db = get_db()
-    results = db.select_data(query)
+    started = time.perf_counter()
+    store = get_hot_store() if table else None
+    if store is not None and store.has_table(table):
+        results = store.select_range(table)
+    else:
+        db = get_db()
+        results = db.select_data(query)
+    queried = time.perf_counter()
 
     # Organize the data by date
-    data_by_date = {}
-    for result in results:
-        date_key = result[1]
-        record = {key_names[i]: result[i] for i in range(len(key_names)) if
-                  key_names[i] is not "date"}
-        if date_key in data_by_date:
-            data_by_date[date_key].append(record)
-        else:
-            data_by_date[date_key] = [record]
-
-    # Convert the dictionary to a list of dictionaries
-    data = [{'date': date, 'records': records} for date, records in data_by_date.items()]
-
-    # Use json.dumps with sort_keys parameter
-    ordered_json_data = json.dumps({f'{endpoint_name}_data': data}, sort_keys=False)
-
+    response = jsonify(group_by_date(results, endpoint_name, key_names))
     # Set the content type to 'application/json'
-    response = jsonify(json.loads(ordered_json_data))
     response.headers['Content-Type'] = 'application/json'
 
+    observe_request(started, queried, len(results), response)
     return response
 
 
 def fetch_data_endpoint_by_date(query: str, endpoint_name: str, key_names: list[str],
-                                date: str) -> jsonify:
+                                date: str, table: str = None) -> jsonify:
     """
     Fetch data from the database based on the provided query, organize it by date,
     and filter by a specific date.
@@ -74,216 +245,163 @@ def fetch_data_endpoint_by_date(query: str, endpoint_name: str, key_names: list[
     endpoint_name (str): Name of the endpoint.
     key_names (list[str]): List of key names for the records.
     date (str): Date to filter the results.
+    table (str): Table queried, used to answer from the hot store when it is enabled.
 
     Returns:
     jsonify: Flask JSON response containing the organized data for the specified date.
     """
-    db = get_db()
-    results = db.select_data_by_date(query, date)
+    started = time.perf_counter()
+    store = get_hot_store() if table else None
+    if store is not None and store.has_table(table):
+        results = store.select_by_date(table, date)
+    else:
+        db = get_db()
+        results = db.select_data_by_date(query, date)
+    queried = time.perf_counter()
 
     # Organize the data by date
-    data_by_date = {}
-    for result in results:
-        date_key = result[1]
-        record = {key_names[i]: result[i] for i in range(len(key_names)) if
-                  key_names[i] is not "date"}
-        if date_key in data_by_date:
-            data_by_date[date_key].append(record)
-        else:
-            data_by_date[date_key] = [record]
-
-    # Convert the dictionary to a list of dictionaries
-    data = [{'date': date, 'records': records} for date, records in data_by_date.items()]
-
-    # Use json.dumps with sort_keys parameter
-    ordered_json_data = json.dumps({f'{endpoint_name}_data': data}, sort_keys=False)
-
+    response = jsonify(group_by_date(results, endpoint_name, key_names))
     # Set the content type to 'application/json'
-    response = jsonify(json.loads(ordered_json_data))
     response.headers['Content-Type'] = 'application/json'
 
+    observe_request(started, queried, len(results), response)
     return response
 
 
 @app.route("/days-ahead")
 def fetch_days_ahead():
-    query = "SELECT day_ahead_id, date_value, hour_of_day, price " \
-            "FROM day_ahead " \
-            "INNER JOIN date ON date.date_id = day_ahead.date_id"
-    return fetch_data_endpoint(query, 'days_head',
-                               ['id', 'date', 'hour', 'price'])
+    return fetch_table(ENDPOINTS['day_ahead'])
 
 
 @app.route("/intra-days")
 def fetch_intra_days():
-    query = "SELECT intra_day_id, date_value, hour_of_day, " \
-            "intraday_avg_price, intraday_min_price, intraday_max_price " \
-            "FROM intra_day " \
-            "INNER JOIN date ON date.date_id = intra_day.date_id"
-    return fetch_data_endpoint(query, 'intra_day',
-                               ['id', 'date', 'hour', 'avg_price', 'min_price', 'max_price'])
+    return fetch_table(ENDPOINTS['intra_day'])
 
 
 @app.route("/current-daily-plans")
 def fetch_current_daily_plans():
-    query = "SELECT current_daily_plan_id, date_value, hour_of_day, " \
-            "NationalPowerDemand, TotalProductionCapacity_KSE, TotalProductionCapacity_JGWa, " \
-            "TotalProductionCapacity_JGFWa, TotalProductionCapacity_JGMa, TotalProductionCapacity_JGPVa, " \
-            "TotalGeneration_ActiveJG, TotalGeneration_JGWa, TotalGeneration_JGFWa, TotalGeneration_JGMa, " \
-            "TotalGeneration_JGPVa, TotalGeneration_NonParticipatingUnits, WindPowerGeneration, PVPowerGeneration, " \
-            "TotalChargingCapacity_JGMa, NationalParallelExchangeBalance, NationalNonParallelExchangeBalance, " \
-            "ExcessCapacityAboveDemand, ExcessCapacityBelowDemand, TotalCapacityFromUtilizedLoadReductionOffers_JGOa " \
-            "FROM current_daily_plan " \
-            "INNER JOIN date ON date.date_id = current_daily_plan.date_id"
-    return fetch_data_endpoint(query, 'current_daily_plan',
-                               ['id', 'date', 'hour', 'NationalPowerDemand',
-                                'TotalProductionCapacity_KSE', 'TotalProductionCapacity_JGWa',
-                                'TotalProductionCapacity_JGFWa', 'TotalProductionCapacity_JGMa',
-                                'TotalProductionCapacity_JGPVa', 'TotalGeneration_ActiveJG',
-                                'TotalGeneration_JGWa', 'TotalGeneration_JGFWa',
-                                'TotalGeneration_JGMa', 'TotalGeneration_JGPVa',
-                                'TotalGeneration_NonParticipatingUnits', 'WindPowerGeneration',
-                                'PVPowerGeneration', 'TotalChargingCapacity_JGMa',
-                                'NationalParallelExchangeBalance',
-                                'NationalNonParallelExchangeBalance',
-                                'ExcessCapacityAboveDemand', 'ExcessCapacityBelowDemand',
-                                'TotalCapacityFromUtilizedLoadReductionOffers_JGOa'])
+    return fetch_table(ENDPOINTS['current_daily_plan'])
 
 
 @app.route("/balancing-markets")
 def fetch_balancing_markets():
-    query = "SELECT balancing_market_id, date_value, hour_of_day, " \
-            "CRO, CROs, CROz, AggregatedMarketParticipantsContractingStatus, Imbalance " \
-            "FROM balancing_market " \
-            "INNER JOIN date ON date.date_id = balancing_market.date_id"
-    return fetch_data_endpoint(query, 'balancing_market',
-                               ['id', 'date', 'hour', 'CRO', 'CROs', 'CROz',
-                                'AggregatedMarketParticipantsContractingStatus', 'Imbalance'])
+    return fetch_table(ENDPOINTS['balancing_market'])
 
 
 @app.route("/five-years-plans")
 def fetch_five_years_plans():
-    query = "SELECT five_years_plan_id, date_value, hour_of_day, " \
-            "GridDemandForecast, RequiredPowerReserve, SurplusCapacityAvailableForTSO, " \
-            "GenerationCapacitySurplusForTSO, AvailableCapacityBalancingMarketUnits, " \
-            "AvailableForTSOCapacityBalancingMarketUnits, PredictedGenerationBalancingMarket, " \
-            "ForecastedGenerationNonBalancingMarket, WindTotalGenerationForecast, " \
-            "PhotovoltaicTotalGenerationForecast, PlannedCrossBorderElectricityExchange, " \
-            "ForecastedUnavailabilityTransmissionAndDistribution, " \
-            "GenerationCapacityUnavailabilityThermalUnitsBalancingMarket, " \
-            "PredictedGenerationNonCoveredByCapacityMarketObligation, CapacityMarketObligationAllUnits " \
-            "FROM five_years_plan " \
-            "INNER JOIN date ON date.date_id = five_years_plan.date_id"
-    return fetch_data_endpoint(query, 'five_years_plan',
-                               ['id', 'date', 'hour', 'GridDemandForecast',
-                                'RequiredPowerReserve', 'SurplusCapacityAvailableForTSO',
-                                'GenerationCapacitySurplusForTSO',
-                                'AvailableCapacityBalancingMarketUnits',
-                                'AvailableForTSOCapacityBalancingMarketUnits',
-                                'PredictedGenerationBalancingMarket',
-                                'ForecastedGenerationNonBalancingMarket',
-                                'WindTotalGenerationForecast',
-                                'PhotovoltaicTotalGenerationForecast',
-                                'PlannedCrossBorderElectricityExchange',
-                                'ForecastedUnavailabilityTransmissionAndDistribution',
-                                'GenerationCapacityUnavailabilityThermalUnitsBalancingMarket',
-                                'PredictedGenerationNonCoveredByCapacityMarketObligation',
-                                'CapacityMarketObligationAllUnits'])
+    return fetch_table(ENDPOINTS['five_years_plan'])
 
 
 @app.route("/days-ahead/<date>")
 def fetch_days_ahead_by_date(date):
-    query = "SELECT day_ahead_id, date_value, hour_of_day, price " \
-            "FROM day_ahead " \
-            "INNER JOIN date ON date.date_id = day_ahead.date_id " \
-            "WHERE date_value = ?"
-    return fetch_data_endpoint_by_date(query, 'day_ahead', ['id', 'date', 'hour', 'price'], date)
+    return fetch_table(ENDPOINTS['day_ahead'], date)
 
 
 @app.route("/intra-days/<date>")
 def fetch_intra_days_by_date(date):
-    query = "SELECT intra_day_id, date_value, hour_of_day, " \
-            "intraday_avg_price, intraday_min_price, intraday_max_price " \
-            "FROM intra_day " \
-            "INNER JOIN date ON date.date_id = intra_day.date_id " \
-            "WHERE date_value = ?"
-    return fetch_data_endpoint_by_date(query, 'intra_day',
-                                       ['id', 'date', 'hour', 'avg_price', 'min_price',
-                                        'max_price'], date)
+    return fetch_table(ENDPOINTS['intra_day'], date)
 
 
 @app.route("/current-daily-plans/<date>")
 def fetch_current_daily_plans_by_date(date):
-    query = "SELECT current_daily_plan_id, date_value, hour_of_day, " \
-            "NationalPowerDemand, TotalProductionCapacity_KSE, TotalProductionCapacity_JGWa, " \
-            "TotalProductionCapacity_JGFWa, TotalProductionCapacity_JGMa, TotalProductionCapacity_JGPVa, " \
-            "TotalGeneration_ActiveJG, TotalGeneration_JGWa, TotalGeneration_JGFWa, TotalGeneration_JGMa, " \
-            "TotalGeneration_JGPVa, TotalGeneration_NonParticipatingUnits, WindPowerGeneration, PVPowerGeneration, " \
-            "TotalChargingCapacity_JGMa, NationalParallelExchangeBalance, NationalNonParallelExchangeBalance, " \
-            "ExcessCapacityAboveDemand, ExcessCapacityBelowDemand, TotalCapacityFromUtilizedLoadReductionOffers_JGOa " \
-            "FROM current_daily_plan " \
-            "INNER JOIN date ON date.date_id = current_daily_plan.date_id " \
-            "WHERE date_value = ?"
-    return fetch_data_endpoint_by_date(query, 'current_daily_plan',
-                                       ['id', 'date', 'hour', 'NationalPowerDemand',
-                                        'TotalProductionCapacity_KSE',
-                                        'TotalProductionCapacity_JGWa',
-                                        'TotalProductionCapacity_JGFWa',
-                                        'TotalProductionCapacity_JGMa',
-                                        'TotalProductionCapacity_JGPVa', 'TotalGeneration_ActiveJG',
-                                        'TotalGeneration_JGWa', 'TotalGeneration_JGFWa',
-                                        'TotalGeneration_JGMa', 'TotalGeneration_JGPVa',
-                                        'TotalGeneration_NonParticipatingUnits',
-                                        'WindPowerGeneration',
-                                        'PVPowerGeneration', 'TotalChargingCapacity_JGMa',
-                                        'NationalParallelExchangeBalance',
-                                        'NationalNonParallelExchangeBalance',
-                                        'ExcessCapacityAboveDemand', 'ExcessCapacityBelowDemand',
-                                        'TotalCapacityFromUtilizedLoadReductionOffers_JGOa'], date)
+    return fetch_table(ENDPOINTS['current_daily_plan'], date)
 
 
 @app.route("/balancing-markets/<date>")
 def fetch_balancing_markets_by_date(date):
-    query = "SELECT balancing_market_id, date_value, hour_of_day, " \
-            "CRO, CROs, CROz, AggregatedMarketParticipantsContractingStatus, Imbalance " \
-            "FROM balancing_market " \
-            "INNER JOIN date ON date.date_id = balancing_market.date_id " \
-            "WHERE date_value = ?"
-    return fetch_data_endpoint_by_date(query, 'balancing_market',
-                                       ['id', 'date', 'hour', 'CRO', 'CROs', 'CROz',
-                                        'AggregatedMarketParticipantsContractingStatus',
-                                        'Imbalance'], date)
+    return fetch_table(ENDPOINTS['balancing_market'], date)
 
 
 @app.route("/five-years-plans/<date>")
 def fetch_five_years_plans_by_date(date):
-    query = "SELECT five_years_plan_id, date_value, hour_of_day, " \
-            "GridDemandForecast, RequiredPowerReserve, SurplusCapacityAvailableForTSO, " \
-            "GenerationCapacitySurplusForTSO, AvailableCapacityBalancingMarketUnits, " \
-            "AvailableForTSOCapacityBalancingMarketUnits, PredictedGenerationBalancingMarket, " \
-            "ForecastedGenerationNonBalancingMarket, WindTotalGenerationForecast, " \
-            "PhotovoltaicTotalGenerationForecast, PlannedCrossBorderElectricityExchange, " \
-            "ForecastedUnavailabilityTransmissionAndDistribution, " \
-            "GenerationCapacityUnavailabilityThermalUnitsBalancingMarket, " \
-            "PredictedGenerationNonCoveredByCapacityMarketObligation, CapacityMarketObligationAllUnits " \
-            "FROM five_years_plan " \
-            "INNER JOIN date ON date.date_id = five_years_plan.date_id " \
-            "WHERE date_value = ?"
-    return fetch_data_endpoint_by_date(query, 'five_years_plan',
-                                       ['id', 'date', 'hour', 'GridDemandForecast',
-                                        'RequiredPowerReserve', 'SurplusCapacityAvailableForTSO',
-                                        'GenerationCapacitySurplusForTSO',
-                                        'AvailableCapacityBalancingMarketUnits',
-                                        'AvailableForTSOCapacityBalancingMarketUnits',
-                                        'PredictedGenerationBalancingMarket',
-                                        'ForecastedGenerationNonBalancingMarket',
-                                        'WindTotalGenerationForecast',
-                                        'PhotovoltaicTotalGenerationForecast',
-                                        'PlannedCrossBorderElectricityExchange',
-                                        'ForecastedUnavailabilityTransmissionAndDistribution',
-                                        'GenerationCapacityUnavailabilityThermalUnitsBalancingMarket',
-                                        'PredictedGenerationNonCoveredByCapacityMarketObligation',
-                                        'CapacityMarketObligationAllUnits'], date)
+    return fetch_table(ENDPOINTS['five_years_plan'], date)
+
+
+@app.route("/days-ahead/batch", methods=['GET', 'POST'])
+def fetch_days_ahead_batch():
+    return fetch_table_batch(ENDPOINTS['day_ahead'])
+
+
+@app.route("/intra-days/batch", methods=['GET', 'POST'])
+def fetch_intra_days_batch():
+    return fetch_table_batch(ENDPOINTS['intra_day'])
+
+
+@app.route("/current-daily-plans/batch", methods=['GET', 'POST'])
+def fetch_current_daily_plans_batch():
+    return fetch_table_batch(ENDPOINTS['current_daily_plan'])
+
+
+@app.route("/balancing-markets/batch", methods=['GET', 'POST'])
+def fetch_balancing_markets_batch():
+    return fetch_table_batch(ENDPOINTS['balancing_market'])
+
+
+@app.route("/five-years-plans/batch", methods=['GET', 'POST'])
+def fetch_five_years_plans_batch():
+    return fetch_table_batch(ENDPOINTS['five_years_plan'])
+
+
+@app.route("/analytics")
+def fetch_analytics_series():
+    return jsonify({'series': list(SERIES), 'windows': list(WINDOWS)})
+
+
+@app.route("/analytics/<series>")
+def fetch_analytics(series):
+    """
+    Serve the rolling mean and standard deviation of a series (see analytics.py).
+
+    Query parameters:
+    window: Length of the window in days, 7 by default.
+    start, end: First and last day (YYYY-MM-DD), inclusive.
+
+    Returns:
+    jsonify: Flask JSON response with one record per day, 404 for an unknown series or window.
+    """
+    window = request.args.get('window', WINDOWS[0], type=int)
+    if series not in SERIES or window not in WINDOWS:
+        return jsonify({'error': f"Unknown series {series!r} or window {window}"}), 404
+    started = time.perf_counter()
+    results = RollingAnalytics(get_db().connection).rolling(
+        series, window, request.args.get('start'), request.args.get('end'))
+    queried = time.perf_counter()
+    keys = ['date', 'days', 'n', 'mean', 'std']
+    response = jsonify({'series': series, 'window': window,
+                        'analytics_data': [dict(zip(keys, result)) for result in results]})
+    observe_request(started, queried, len(results), response)
+    return response
+
+
+@app.route("/chart-data/<table>/<column>")
+def fetch_chart_data(table, column):
+    """
+    Serve a column downsampled for charts (see chart_data.py).
+
+    Query parameters:
+    start, end: First and last day (YYYY-MM-DD), inclusive.
+    points: Maximum number of points, 1000 by default.
+    method: "lttb" (default) or "minmax".
+
+    Returns:
+    jsonify: Flask JSON response with the x (time) and y (value) arrays, 404 for an unknown
+    column and 400 for invalid parameters.
+    """
+    if column not in TABLES.get(table, {}).get('columns', ()):
+        return jsonify({'error': f"Unknown column {table}.{column}"}), 404
+    points = min(max(request.args.get('points', DEFAULT_POINTS, type=int), 3), MAX_POINTS)
+    started = time.perf_counter()
+    try:
+        data = CHART_CACHE.get(get_db().connection, database_version(), table, column,
+                               request.args.get('start'), request.args.get('end'), points,
+                               request.args.get('method', 'lttb'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    queried = time.perf_counter()
+    response = jsonify(data)
+    observe_request(started, queried, len(data['x']), response)
+    return response
 
 
 if __name__ == '__main__':
@@ -0,0 +1,70 @@
+"""
+On-disk archive of the raw documents downloaded by the fetchers.
+
+When RAW_ARCHIVE_DIR is set, every download is stored as <root>/<source name>/<YYYY-MM-DD>/
+<document>, exactly as returned by DataFetcher.download(). A later fetch of the same day
+replaces its documents, so the archive holds the latest revision. reprocess.py rebuilds the
+database from the archive without contacting PSE or TGE.
+"""
+import os
+from datetime import datetime
+
+
+class PayloadArchive:
+    """
+    Raw documents of every (source, day).
+
+    Args:
+        root (str): Directory of the archive.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def directory(self, name: str, day: datetime) -> str:
+        return os.path.join(self.root, name, day.strftime('%Y-%m-%d'))
+
+    def save(self, name: str, day: datetime, payload: dict):
+        """
+        Store the documents of a day, replacing each one atomically.
+
+        Args:
+            name (str): Name of the source, DataFetcher.name.
+            day (datetime): Day of the documents.
+            payload (dict): Document name -> content (bytes).
+        """
+        directory = self.directory(name, day)
+        os.makedirs(directory, exist_ok=True)
+        for document, content in payload.items():
+            path = os.path.join(directory, document)
+            with open(f"{path}.tmp", 'wb') as file:
+                file.write(content)
+            os.replace(f"{path}.tmp", path)
+
+    def load(self, name: str, day: datetime) -> dict:
+        """
+        Read the documents of a day.
+
+        Returns:
+            dict: Document name -> content (bytes), empty if the day is not archived.
+        """
+        directory = self.directory(name, day)
+        payload = {}
+        if not os.path.isdir(directory):
+            return payload
+        for document in sorted(os.listdir(directory)):
+            if document.endswith('.tmp'):
+                continue
+            with open(os.path.join(directory, document), 'rb') as file:
+                payload[document] = file.read()
+        return payload
+
+    def days(self, name: str) -> list:
+        """
+        Returns:
+            list: Archived days of a source, sorted.
+        """
+        directory = os.path.join(self.root, name)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(datetime.strptime(day, '%Y-%m-%d') for day in os.listdir(directory))
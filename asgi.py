@@ -0,0 +1,174 @@
+"""
+Asynchronous (ASGI) serving path of the API.
+
+The data endpoints of endpoints.py are served natively by an asyncio event loop. SQLite
+queries and the JSON serialization run in a bounded pool of threads, each holding its own
+read-only connection, so many small concurrent requests wait on the database without
+holding a server thread each and the database never sees more than ASGI_DB_CONCURRENCY
+queries at once. Every other route (batches, /metrics, CORS preflight, errors) is passed
+to the Flask app of app.py through asgiref's WSGI adapter, so both serving paths answer
+the same API with byte-identical bodies.
+
+Settings (environment):
+    ASGI_HOST, ASGI_PORT          Listening address, default 127.0.0.1:8000.
+    ASGI_WORKERS                  Server processes, default the number of CPUs.
+    ASGI_DB_CONCURRENCY           Query threads per process, default 8.
+    ASGI_LIMIT_CONCURRENCY        Open connections per process before answering 503.
+    ASGI_BACKLOG                  Pending TCP connections, default 2048.
+    SNAPSHOT_DIR                  Serve the read-only snapshots of snapshot.py.
+    METRICS_MULTIPROC_DIR         Sum /metrics over the workers (see metrics.py).
+
+Usage:
+    python asgi.py
+    uvicorn asgi:app --workers 4 --no-access-log
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.wsgi import WsgiToAsgi
+
+import app as flask_api
+from endpoints import ENDPOINTS, TableEndpoint, render
+from metrics import API_BYTES, API_ROWS, API_STAGE_SECONDS
+from snapshot import connect
+
+DB_CONCURRENCY = int(os.environ.get('ASGI_DB_CONCURRENCY', '8'))
+
+ROUTES = {endpoint.path: endpoint for endpoint in ENDPOINTS.values()}
+
+
+class ReadPool:
+    """
+    Threads running the read queries of the event loop, each with its own read-only
+    SQLite connection. With SNAPSHOT_DIR set the connections are opened on the newest
+    snapshot and each thread reopens its connection between queries when a new one is
+    published.
+
+    Args:
+        database_name (str): Path to the SQLite database.
+        size (int): Number of threads, i.e. of queries running at once.
+    """
+
+    def __init__(self, database_name: str, size: int = DB_CONCURRENCY):
+        self.database_name = database_name
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='sqlite-read')
+        self.local = threading.local()
+
+    def connection(self) -> sqlite3.Connection:
+        snapshot = flask_api.current_snapshot()
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None and getattr(self.local, 'snapshot', None) != snapshot:
+            connection.close()
+            connection = None
+        if connection is None:
+            if snapshot is not None:
+                connection = connect(snapshot)
+            else:
+                connection = sqlite3.connect(f"file:{self.database_name}?mode=ro", uri=True)
+            self.local.connection = connection
+            self.local.snapshot = snapshot
+        return connection
+
+    async def run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+class EnergyAPI:
+    """
+    ASGI application serving the data endpoints natively and the rest through Flask.
+    """
+
+    def __init__(self):
+        self.flask = WsgiToAsgi(flask_api.app)
+        self.pool = None
+
+    def _start(self):
+        if self.pool is None:
+            self.pool = ReadPool(flask_api.DATABASE)
+
+    def query(self, endpoint: TableEndpoint, date: str = None) -> bytes:
+        """
+        Query and serialize one table, in a thread of the read pool.
+
+        Args:
+            endpoint (TableEndpoint): Routes and queries of the table.
+            date (str): Date to filter the results, None for all rows.
+
+        Returns:
+            bytes: The JSON body.
+        """
+        started = time.perf_counter()
+        store = flask_api.get_hot_store()
+        if store is not None and store.has_table(endpoint.table):
+            results = (store.select_range(endpoint.table) if date is None
+                       else store.select_by_date(endpoint.table, date))
+        elif date is None:
+            results = self.pool.connection().execute(endpoint.query).fetchall()
+        else:
+            results = self.pool.connection().execute(endpoint.query_by_date, (date,)).fetchall()
+        queried = time.perf_counter()
+        if date is None:
+            body = render(results, endpoint.name, endpoint.key_names)
+            label = endpoint.view_name
+        else:
+            body = render(results, endpoint.date_name, endpoint.key_names)
+            label = f"{endpoint.view_name}_by_date"
+        API_STAGE_SECONDS.observe(queried - started, endpoint=label, stage='query')
+        API_STAGE_SECONDS.observe(time.perf_counter() - queried, endpoint=label,
+                                  stage='serialize')
+        API_ROWS.inc(len(results), endpoint=label)
+        API_BYTES.inc(len(body), endpoint=label)
+        return body
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self._start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.pool is not None:
+                    self.pool.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        parts = scope['path'].split('/')[1:]
+        endpoint = ROUTES.get(parts[0])
+        if scope['type'] != 'http' or scope['method'] != 'GET' or endpoint is None \
+                or len(parts) > 2 or not all(parts) or parts[1:] == ['batch']:
+            await self.flask(scope, receive, send)
+            return
+        # Servers without lifespan support
+        self._start()
+        body = await self.pool.run(self.query, endpoint, parts[1] if len(parts) == 2 else None)
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'application/json'),
+                                (b'content-length', str(len(body)).encode()),
+                                (b'access-control-allow-origin', b'*')]})
+        await send({'type': 'http.response.body', 'body': body})
+
+
+app = EnergyAPI()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    limit = os.environ.get('ASGI_LIMIT_CONCURRENCY')
+    uvicorn.run('asgi:app', host=os.environ.get('ASGI_HOST', '127.0.0.1'),
+                port=int(os.environ.get('ASGI_PORT', '8000')),
+                workers=int(os.environ.get('ASGI_WORKERS', os.cpu_count() or 1)),
+                limit_concurrency=int(limit) if limit else None,
+                backlog=int(os.environ.get('ASGI_BACKLOG', '2048')),
+                timeout_keep_alive=30, access_log=False, proxy_headers=True)
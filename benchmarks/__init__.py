@@ -0,0 +1,4 @@
+"""
+Benchmarks for the fetch, ingest and API paths. Run the modules from the project root,
+e.g. ``python -m benchmarks.hot_store``.
+"""
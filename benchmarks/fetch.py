@@ -0,0 +1,83 @@
+"""
+Load test of the fetchers against the local mock server (see mock_server.py).
+
+Fetches every source for a range of days concurrently and reports the throughput, the
+requests seen by the server (including retries, 429 and 503 responses) and the final
+limits of the adaptive concurrency.
+
+Usage:
+    python -m benchmarks.fetch [--days 30] [--workers 8] [--latency 0.05] [--error-rate 0.02]
+"""
+import argparse
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from werkzeug.serving import make_server
+
+import fetcher
+import mock_server
+from rate_limit import LIMITERS
+from resilience import BREAKERS
+from save import SOURCES, fetch_result
+
+
+def start_mock_server() -> tuple:
+    """
+    Serve the mock server from a background thread on a free port.
+
+    Returns:
+        tuple: The server and its base URL.
+    """
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, mock_server.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--workers', type=int, default=8, help="concurrent (source, day) jobs")
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--jitter', type=float, default=0.05)
+    parser.add_argument('--error-rate', type=float, default=0.02)
+    parser.add_argument('--server-rate', type=float, default=None, help="server requests/s")
+    parser.add_argument('--client-rate', type=float, default=100, help="client requests/s")
+    parser.add_argument('--max-concurrency', type=int, default=16)
+    options = parser.parse_args()
+
+    server, base_url = start_mock_server()
+    mock_server.config = mock_server.MockConfig(options.latency, options.jitter,
+                                                options.error_rate, options.server_rate)
+    fetcher.PSE_BASE_URL = fetcher.TGE_BASE_URL = base_url
+    LIMITERS.limits = {base_url.split('//')[1]: {
+        'rate': options.client_rate, 'burst': int(options.client_rate),
+        'initial_concurrency': 2, 'max_concurrency': options.max_concurrency}}
+
+    start = datetime(2024, 1, 1)
+    jobs = [(start + timedelta(days=day), source)
+            for day in range(options.days) for source in SOURCES]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=options.workers) as executor:
+        results = list(executor.map(lambda job: fetch_result(*job), jobs))
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+
+    failed = [result for result in results if not result.ok]
+    print(f"{len(jobs)} jobs in {elapsed:.1f}s ({len(jobs) / elapsed:.1f} jobs/s), "
+          f"{len(failed)} failed")
+    print(f"server: {mock_server.stats}")
+    for host, report in LIMITERS.report().items():
+        print(f"limiter {host}: {report}")
+    for host, report in BREAKERS.report().items():
+        print(f"breaker {host}: {report}")
+    for result in failed[:10]:
+        print(f"failed: {result.to_dict()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Recorded PSE and TGE documents used by the parse benchmarks.
+
+Documents are stored as benchmarks/fixtures/<date>/<source name>/<document>, exactly as
+returned by DataFetcher.download(), so the benchmarks parse the payloads offline.
+
+The committed days (an ordinary day and the 25-hour DST day) are PLACEHOLDERS: they were
+generated by mock_server.py, not captured from PSE and TGE, and each of them is marked by a
+PLACEHOLDER file. The mock documents are much smaller and simpler than the real exports and
+pages, so parse timings measured on them only check the parsers against the mock formats
+and do not stand for the real BeautifulSoup and read_csv costs. Recording a day without
+--mock stores the documents of the real sites and removes its marker.
+
+Usage:
+    python -m benchmarks.fixtures [--mock] 2023-12-27 [2023-12-28 ...]
+"""
+import os
+import sys
+from datetime import datetime
+
+import fetcher
+from registry import FETCHERS, DataFetcherFactory
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+# Marks a day whose documents were generated by mock_server.py instead of the real sites
+PLACEHOLDER_FILE = 'PLACEHOLDER'
+PLACEHOLDER_NOTE = ("Placeholder documents generated by mock_server.py, not captured from PSE "
+                    "and TGE.\nReplace them with `python -m benchmarks.fixtures <date>`.\n")
+
+
+def all_sources() -> list:
+    return FETCHERS.sources()
+
+
+def record(date: datetime, root: str = FIXTURES_DIR, placeholder: bool = False) -> list:
+    """
+    Download the documents of every source for a date and store them as fixtures.
+
+    Args:
+        date (datetime): The date to record.
+        root (str): Directory of the fixtures.
+        placeholder (bool): The documents come from mock_server.py; the day is marked with
+            a PLACEHOLDER file, which is removed when the day is recorded from the real sites.
+
+    Returns:
+        list: Names of the recorded sources.
+    """
+    day_dir = os.path.join(root, date.strftime('%Y-%m-%d'))
+    marker = os.path.join(day_dir, PLACEHOLDER_FILE)
+    if placeholder:
+        os.makedirs(day_dir, exist_ok=True)
+        with open(marker, 'w', encoding='utf-8') as file:
+            file.write(PLACEHOLDER_NOTE)
+    recorded = []
+    for source in all_sources():
+        fetcher = DataFetcherFactory().create_data_fetcher(source, date)
+        try:
+            payload = fetcher.download()
+        except Exception as e:
+            print(f"{fetcher.name} {date:%Y-%m-%d}: not recorded ({e})")
+            continue
+        directory = os.path.join(day_dir, fetcher.name)
+        os.makedirs(directory, exist_ok=True)
+        for document, content in payload.items():
+            with open(os.path.join(directory, document), 'wb') as file:
+                file.write(content)
+        recorded.append(fetcher.name)
+    # Sources that were not recorded again keep their mock documents
+    if not placeholder and recorded and len(recorded) == len(all_sources()) \
+            and os.path.exists(marker):
+        os.remove(marker)
+    return recorded
+
+
+def record_from_mock(dates: list, root: str = FIXTURES_DIR) -> dict:
+    """
+    Record the documents served by mock_server.py for the given dates.
+
+    Args:
+        dates (list): Dates (datetime) to record.
+        root (str): Directory of the fixtures.
+
+    Returns:
+        dict: Date -> names of the recorded sources.
+    """
+    from benchmarks.fetch import start_mock_server
+    server, base_url = start_mock_server()
+    previous = fetcher.PSE_BASE_URL, fetcher.TGE_BASE_URL
+    fetcher.PSE_BASE_URL = fetcher.TGE_BASE_URL = base_url
+    try:
+        return {date: record(date, root, placeholder=True) for date in dates}
+    finally:
+        fetcher.PSE_BASE_URL, fetcher.TGE_BASE_URL = previous
+        server.shutdown()
+
+
+def load(root: str = FIXTURES_DIR) -> list:
+    """
+    Load all recorded fixtures.
+
+    Args:
+        root (str): Directory of the fixtures.
+
+    Returns:
+        list: Tuples of (date, source, payload, placeholder) where payload is document
+            name -> bytes and placeholder tells that the day was generated by mock_server.py.
+    """
+    sources = {DataFetcherFactory().create_data_fetcher(source, datetime.now()).name: source
+               for source in all_sources()}
+    fixtures = []
+    if not os.path.isdir(root):
+        return fixtures
+    for day in sorted(os.listdir(root)):
+        day_dir = os.path.join(root, day)
+        if not os.path.isdir(day_dir):
+            continue
+        placeholder = os.path.exists(os.path.join(day_dir, PLACEHOLDER_FILE))
+        for name in sorted(os.listdir(day_dir)):
+            if name not in sources:
+                continue
+            payload = {}
+            for document in os.listdir(os.path.join(day_dir, name)):
+                with open(os.path.join(day_dir, name, document), 'rb') as file:
+                    payload[document] = file.read()
+            fixtures.append((datetime.strptime(day, '%Y-%m-%d'), sources[name], payload,
+                             placeholder))
+    return fixtures
+
+
+if __name__ == "__main__":
+    arguments = [argument for argument in sys.argv[1:] if argument != '--mock']
+    days_to_record = [datetime.strptime(argument, '%Y-%m-%d')
+                      for argument in arguments or [datetime.now().strftime('%Y-%m-%d')]]
+    if '--mock' in sys.argv[1:]:
+        recorded_sources = record_from_mock(days_to_record)
+    else:
+        recorded_sources = {day: record(day) for day in days_to_record}
+    for day_recorded, names in recorded_sources.items():
+        print(f"{day_recorded:%Y-%m-%d}: recorded {', '.join(names) or 'nothing'}"
+              + (" (placeholder)" if '--mock' in sys.argv[1:] else ""))
@@ -0,0 +1,79 @@
+"""
+Compares the memory-mapped hot store with the SQLite read path used by app.py.
+
+Usage:
+    python -m benchmarks.hot_store [days]
+"""
+import sys
+import tempfile
+import time
+import os
+from datetime import date, timedelta
+
+from benchmarks.synthetic import build_synthetic_database
+from database import Database
+from hot_store import HotStore, HotStoreWriter
+from schema import select_query
+
+
+def _timeit(function, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def run(days: int = 5 * 365, repeat: int = 50) -> list:
+    """
+    Run the comparison on a synthetic database.
+
+    Args:
+        days (int): Number of days in the synthetic database.
+        repeat (int): Number of repetitions of each query.
+
+    Returns:
+        list: Tuples of (query, table, sqlite ms, hot store ms).
+    """
+    start = date(2019, 1, 1)
+    with tempfile.TemporaryDirectory() as directory:
+        database_name = build_synthetic_database(os.path.join(directory, 'energy.db'), days, start)
+        started = time.perf_counter()
+        HotStoreWriter(database_name, os.path.join(directory, 'store')).build()
+        print(f"Built hot store for {days} days in {time.perf_counter() - started:.2f}s")
+        store = HotStore(os.path.join(directory, 'store'))
+        db = Database(database_name)
+        middle = (start + timedelta(days=days // 2)).isoformat()
+        month_end = (start + timedelta(days=days // 2 + 30)).isoformat()
+        results = []
+        for table in ('day_ahead', 'current_daily_plan'):
+            query = select_query(table)
+            column = store.meta['tables'][table]['columns'][0]
+            cases = [
+                ('by-date',
+                 lambda: db.select_data_by_date(f"{query} WHERE date_value = ?", middle),
+                 lambda: store.select_by_date(table, middle)),
+                ('30-day range',
+                 lambda: db.cursor.execute(f"{query} WHERE date_value BETWEEN ? AND ?",
+                                           (middle, month_end)).fetchall(),
+                 lambda: store.select_range(table, middle, month_end)),
+                ('full-table',
+                 lambda: db.select_data(query),
+                 lambda: store.select_range(table)),
+                ('mean per hour',
+                 lambda: db.select_data(f"SELECT hour_of_day, AVG({column}) FROM {table} "
+                                        f"GROUP BY hour_of_day"),
+                 lambda: store.aggregate(table, column, by='hour')),
+            ]
+            for name, sqlite_call, store_call in cases:
+                count = repeat if name != 'full-table' else max(repeat // 10, 1)
+                results.append((name, table, _timeit(sqlite_call, count),
+                                _timeit(store_call, count)))
+        del db
+    return results
+
+
+if __name__ == "__main__":
+    rows = run(int(sys.argv[1])) if len(sys.argv) > 1 else run()
+    print(f"{'query':<15}{'table':<20}{'sqlite ms':>12}{'hot store ms':>14}")
+    for query_name, table_name, sqlite_ms, store_ms in rows:
+        print(f"{query_name:<15}{table_name:<20}{sqlite_ms:>12.3f}{store_ms:>14.3f}")
@@ -0,0 +1,315 @@
+"""
+Offline benchmark suite of the fetch, ingest and API paths.
+
+Suites:
+    parse   Parse time of every fetcher on the recorded documents (see benchmarks/fixtures.py);
+            days generated by the mock server are reported as placeholders.
+    ingest  Time to save N days of every source into an empty database.
+    api     Latency and throughput of every API endpoint on a synthetic multi-year database.
+    startup Import time of the API in a fresh interpreter.
+
+Every run is stored in benchmarks/results/ as JSON together with the git commit, so runs
+can be compared over time.
+
+Usage:
+    python -m benchmarks.run [--suites parse,ingest,api,startup] [--days 365] [--years 5]
+    python -m benchmarks.run compare OLD.json NEW.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from analytics import RollingAnalytics
+from benchmarks import fixtures
+from benchmarks.synthetic import build_synthetic_database, synthetic_frame
+from database import Database
+from registry import DataFetcherFactory
+from save import SOURCES, ingest
+from setup_sqlite import setup_command
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+# Scraping dependencies the API must not import (see registry.py)
+HEAVY_MODULES = ('pandas', 'numpy', 'bs4', 'lxml', 'requests')
+
+
+def bench_parse(repeat: int = 20) -> list:
+    """
+    Time the parse stage of every fetcher on the recorded fixtures.
+
+    Args:
+        repeat (int): Parses of every fixture.
+
+    Returns:
+        list: One result per (source, date) fixture. Results of placeholder fixtures, which
+            were generated by mock_server.py, carry fixture="placeholder" and do not measure
+            the parse cost of the real documents.
+
+    Raises:
+        RuntimeError: If no fixture is recorded, instead of reporting an empty suite.
+    """
+    results = []
+    recorded = fixtures.load()
+    if not recorded:
+        raise RuntimeError(f"parse: no fixtures in {fixtures.FIXTURES_DIR}, record them with "
+                           f"`python -m benchmarks.fixtures [--mock] <date>`")
+    placeholders = sorted({f"{day:%Y-%m-%d}" for day, _, _, placeholder in recorded
+                           if placeholder})
+    if placeholders:
+        print(f"parse: {', '.join(placeholders)} are placeholder documents of the mock server, "
+              f"not real PSE/TGE payloads", file=sys.stderr)
+    for day, source, payload, placeholder in recorded:
+        fetcher = DataFetcherFactory().create_data_fetcher(source, day)
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fetcher.parse(payload)
+            timings.append((time.perf_counter() - started) * 1000)
+        results.append({'suite': 'parse', 'name': f"{fetcher.name} {day:%Y-%m-%d}",
+                        'fixture': 'placeholder' if placeholder else 'recorded',
+                        'bytes': sum(len(content) for content in payload.values()),
+                        'ms': statistics.median(timings)})
+    return results
+
+
+def bench_ingest(days: int = 365) -> list:
+    """
+    Time saving `days` days of every source into an empty database.
+
+    Args:
+        days (int): Number of days per source.
+
+    Returns:
+        list: One result per table.
+    """
+    results = []
+    generator = random.Random(0)
+    start = date(2020, 1, 1)
+    with tempfile.TemporaryDirectory() as directory:
+        for source, (table, _) in SOURCES.items():
+            database_name = os.path.join(directory, f"{table}.db")
+            setup_command(database_name)
+            db = Database(database_name)
+            frames = [synthetic_frame(source, start + timedelta(days=day), generator)
+                      for day in range(days)]
+            started = time.perf_counter()
+            rows = sum(ingest(db, source, frame) for frame in frames)
+            elapsed = time.perf_counter() - started
+            del db
+            results.append({'suite': 'ingest', 'name': table, 'days': days,
+                            'ms_per_day': elapsed / days * 1000, 'rows_per_s': rows / elapsed})
+    return results
+
+
+# Days per request of the batch endpoints
+BATCH_DAYS = 30
+
+
+def sample_url(rule: str, start: date, days: int, generator: random.Random) -> str:
+    """
+    URL requesting a route with realistic parameters.
+
+    Args:
+        rule (str): Route of the Flask app, e.g. /days-ahead/<date>.
+        start (date): First day of the synthetic database.
+        days (int): Number of days of the synthetic database.
+        generator (random.Random): Source of the random days, series and columns.
+
+    Returns:
+        str: The URL, or None for a route whose parameters are unknown; such routes are
+        skipped instead of being timed on their error responses.
+    """
+    from analytics import SERIES, WINDOWS
+    from schema import TABLES
+
+    def day() -> str:
+        return (start + timedelta(days=generator.randrange(days))).isoformat()
+
+    url = rule.replace('<date>', day()).replace('<series>', generator.choice(list(SERIES)))
+    if '<table>' in url:
+        table = generator.choice(list(TABLES))
+        url = url.replace('<table>', table).replace(
+            '<column>', generator.choice(TABLES[table]['columns']))
+    if '<' in url:
+        return None
+    if url.endswith('/batch'):
+        url += '?dates=' + ','.join(sorted({day() for _ in range(BATCH_DAYS)}))
+    elif rule.startswith('/analytics/'):
+        url += f"?window={generator.choice(WINDOWS)}"
+    return url
+
+
+def bench_api(years: int = 5, requests: int = 200) -> list:
+    """
+    Measure latency and throughput of every API endpoint on a synthetic database.
+
+    Args:
+        years (int): Years of hourly data in the synthetic database.
+        requests (int): Requests per endpoint; full-table endpoints get a tenth.
+
+    Returns:
+        list: One result per endpoint.
+    """
+    import app as api
+    results = []
+    days = years * 365
+    start = date(2019, 1, 1)
+    generator = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory:
+        database_name = build_synthetic_database(os.path.join(directory, 'energy.db'), days, start)
+        # The analytics endpoints serve the stored rolling statistics
+        db = Database(database_name)
+        RollingAnalytics(db.connection).rebuild()
+        del db
+        previous = api.DATABASE, api.HOT_STORE_DIR, api.SNAPSHOT_DIR
+        api.DATABASE, api.HOT_STORE_DIR, api.SNAPSHOT_DIR = database_name, None, None
+        try:
+            client = api.app.test_client()
+            for rule in api.app.url_map.iter_rules():
+                if 'GET' not in rule.methods or rule.endpoint == 'static':
+                    continue
+                if sample_url(rule.rule, start, days, generator) is None:
+                    print(f"api: skipped {rule.rule}, its parameters are unknown")
+                    continue
+                # Full-table endpoints read every row, the others a few days
+                full_table = '<' not in rule.rule and not rule.rule.endswith('/batch') \
+                    and rule.rule != '/metrics'
+                count = max(requests // 10, 1) if full_table else requests
+                timings = []
+                response_bytes = 0
+                for _ in range(count):
+                    url = sample_url(rule.rule, start, days, generator)
+                    started = time.perf_counter()
+                    response = client.get(url)
+                    timings.append(time.perf_counter() - started)
+                    if response.status_code != 200:
+                        raise RuntimeError(f"api: {url} answered {response.status_code}")
+                    response_bytes += len(response.data)
+                timings.sort()
+                results.append({'suite': 'api', 'name': rule.rule, 'requests': count,
+                                'p50_ms': timings[len(timings) // 2] * 1000,
+                                'p95_ms': timings[int(len(timings) * 0.95)] * 1000,
+                                'requests_per_s': count / sum(timings),
+                                'bytes_per_response': response_bytes // count})
+        finally:
+            api.DATABASE, api.HOT_STORE_DIR, api.SNAPSHOT_DIR = previous
+    return results
+
+
+def bench_startup(repeat: int = 5) -> list:
+    """
+    Time importing the API in a fresh interpreter.
+
+    Args:
+        repeat (int): Number of interpreters started.
+
+    Returns:
+        list: One result with the median import time and the heavy modules it loaded.
+    """
+    code = "import sys, time; started = time.perf_counter(); import app; " \
+           "print(time.perf_counter() - started); " \
+           f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    timings = []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, '-W', 'ignore', '-c', code], cwd=root,
+                                         text=True).splitlines()
+        timings.append(float(output[0]) * 1000)
+    heavy = output[1] if len(output) > 1 else ''
+    if heavy:
+        print(f"startup: the API imported {heavy}")
+    return [{'suite': 'startup', 'name': 'app', 'ms': statistics.median(timings),
+             'heavy_modules': heavy}]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def save_run(results: list, directory: str = RESULTS_DIR) -> str:
+    """
+    Store the results of a run as JSON.
+
+    Args:
+        results (list): Results of the suites.
+        directory (str): Directory of the results.
+
+    Returns:
+        str: Path of the stored file.
+    """
+    os.makedirs(directory, exist_ok=True)
+    commit = git_commit()
+    run = {'timestamp': datetime.now().isoformat(timespec='seconds'), 'commit': commit,
+           'python': platform.python_version(), 'machine': platform.platform(),
+           'results': results}
+    path = os.path.join(directory, f"{datetime.now():%Y%m%d-%H%M%S}-{commit}.json")
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(run, file, indent=2)
+    return path
+
+
+def compare(old_path: str, new_path: str):
+    """
+    Print the relative change of every metric between two stored runs.
+
+    Args:
+        old_path (str): Path of the older run.
+        new_path (str): Path of the newer run.
+    """
+    runs = []
+    for path in (old_path, new_path):
+        with open(path, encoding='utf-8') as file:
+            runs.append({(result['suite'], result['name']): result
+                         for result in json.load(file)['results']})
+    old, new = runs
+    for key in sorted(set(old) & set(new)):
+        for metric, value in new[key].items():
+            if metric in ('suite', 'name') or not isinstance(value, (int, float)):
+                continue
+            before = old[key].get(metric)
+            if not before:
+                continue
+            print(f"{key[0]:<8}{key[1]:<40}{metric:<20}{before:>12.3f}{value:>12.3f}"
+                  f"{(value - before) / before * 100:>+9.1f}%")
+
+
+def main(arguments: list):
+    if arguments[:1] == ['compare']:
+        compare(arguments[1], arguments[2])
+        return
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--suites', default='parse,ingest,api,startup')
+    parser.add_argument('--days', type=int, default=365, help="days per source for ingest")
+    parser.add_argument('--years', type=int, default=5, help="years of data for api")
+    parser.add_argument('--requests', type=int, default=200, help="requests per endpoint")
+    options = parser.parse_args(arguments)
+    suites = {'parse': lambda: bench_parse(),
+              'ingest': lambda: bench_ingest(options.days),
+              'api': lambda: bench_api(options.years, options.requests),
+              'startup': lambda: bench_startup()}
+    results = []
+    for suite in options.suites.split(','):
+        suite_results = suites[suite]()
+        for result in suite_results:
+            metrics = ", ".join(f"{key}={value:.3f}" if isinstance(value, float)
+                                else f"{key}={value}" for key, value in result.items()
+                                if key not in ('suite', 'name'))
+            print(f"{suite:<8}{result['name']:<40}{metrics}")
+        results.extend(suite_results)
+    print(f"Results stored in {save_run(results)}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
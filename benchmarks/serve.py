@@ -0,0 +1,158 @@
+"""
+Load test of the WSGI (Flask, app.py) and ASGI (asgi.py) serving paths.
+
+Both servers run in their own process on the same synthetic database and get the traffic
+of a dashboard: many small concurrent requests for single days of random tables. The
+client keeps one HTTP/1.1 keep-alive connection per simulated user, all driven by one
+asyncio loop, and reports throughput and latency percentiles per server and concurrency.
+
+Usage:
+    python -m benchmarks.serve [--years 5] [--concurrency 1,16,64] [--requests 2000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from benchmarks.run import save_run
+from benchmarks.synthetic import build_synthetic_database
+from endpoints import ENDPOINTS
+
+SERVERS = {
+    # app.run() of app.py: Werkzeug with one thread per request
+    'wsgi': "import app; app.DATABASE = {database!r}; "
+            "app.app.run(port={port}, threaded=True, debug=False)",
+    'asgi': "import uvicorn, app; app.DATABASE = {database!r}; "
+            "uvicorn.run('asgi:app', port={port}, access_log=False, log_level='warning')",
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(kind: str, database_name: str) -> tuple:
+    """
+    Start a server in a subprocess and wait until it accepts connections.
+
+    Returns:
+        tuple: The process and its port.
+    """
+    port = free_port()
+    code = SERVERS[kind].format(database=database_name, port=port)
+    process = subprocess.Popen([sys.executable, '-c', code], stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL,
+                               cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process, port
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"The {kind} server did not start")
+
+
+async def get(reader, writer, path: str) -> tuple:
+    """
+    Send one GET request on a keep-alive connection and read the whole response.
+
+    Returns:
+        tuple: The status code and whether the server keeps the connection open.
+    """
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode('latin-1').split("\r\n")
+    status = int(lines[0].split()[1])
+    headers = dict(line.split(": ", 1) for line in lines[1:] if ": " in line)
+    headers = {name.lower(): value for name, value in headers.items()}
+    await reader.readexactly(int(headers.get('content-length', 0)))
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+async def user(port: int, paths: list, timings: list, errors: list):
+    writer = None
+    try:
+        for path in paths:
+            started = time.perf_counter()
+            # The Werkzeug server closes the connection after every response
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            status, keep_alive = await get(reader, writer, path)
+            timings.append(time.perf_counter() - started)
+            if status != 200:
+                errors.append(status)
+            if not keep_alive:
+                writer.close()
+                writer = None
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+async def load(port: int, concurrency: int, paths: list) -> tuple:
+    timings, errors = [], []
+    started = time.perf_counter()
+    await asyncio.gather(*(user(port, paths[index::concurrency], timings, errors)
+                           for index in range(concurrency)))
+    return timings, errors, time.perf_counter() - started
+
+
+def dashboard_paths(count: int, days: int, start: date) -> list:
+    generator = random.Random(0)
+    endpoints = list(ENDPOINTS.values())
+    return [f"/{generator.choice(endpoints).path}/"
+            f"{start + timedelta(days=generator.randrange(days)):%Y-%m-%d}"
+            for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--concurrency', default='1,16,64')
+    parser.add_argument('--requests', type=int, default=2000, help="requests per run")
+    parser.add_argument('--servers', default='wsgi,asgi')
+    options = parser.parse_args()
+
+    days, start = options.years * 365, date(2019, 1, 1)
+    paths = dashboard_paths(options.requests, days, start)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        database_name = build_synthetic_database(os.path.join(directory, 'energy.db'), days,
+                                                 start)
+        for kind in options.servers.split(','):
+            process, port = start_server(kind, database_name)
+            try:
+                asyncio.run(load(port, 4, paths[:100]))  # warm up
+                for concurrency in map(int, options.concurrency.split(',')):
+                    timings, errors, elapsed = asyncio.run(load(port, concurrency, paths))
+                    timings.sort()
+                    result = {'suite': 'serve', 'name': f"{kind} x{concurrency}",
+                              'requests': len(timings), 'errors': len(errors),
+                              'requests_per_s': len(timings) / elapsed,
+                              'p50_ms': timings[len(timings) // 2] * 1000,
+                              'p95_ms': timings[int(len(timings) * 0.95)] * 1000,
+                              'p99_ms': timings[int(len(timings) * 0.99)] * 1000}
+                    print(f"{result['name']:<12}{result['requests_per_s']:>10.1f} req/s"
+                          f"{result['p50_ms']:>10.2f} ms p50{result['p95_ms']:>10.2f} ms p95"
+                          f"{result['p99_ms']:>10.2f} ms p99{result['errors']:>6} errors")
+                    results.append(result)
+            finally:
+                process.terminate()
+                process.wait()
+    print(f"Results stored in {save_run(results)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Synthetic energy.db generator used by the benchmarks.
+"""
+import os
+import random
+import sqlite3
+from datetime import date, timedelta
+
+import pandas as pd
+
+from registry import ServicesEnergy
+from save import SOURCES
+from schema import TABLES
+from setup_sqlite import setup_command
+from timemodel import hours_in_day, utc_timestamp
+
+
+def build_synthetic_database(database_name: str, days: int, start: date = date(2019, 1, 1),
+                             seed: int = 0) -> str:
+    """
+    Create a database with the project schema and `days` days of random hourly data.
+
+    Args:
+        database_name (str): Path of the database to create. An existing file is replaced.
+        days (int): Number of days to generate.
+        start (date): First generated day.
+        seed (int): Seed of the random generator, so that runs are comparable.
+
+    Returns:
+        str: The path of the created database.
+    """
+    if os.path.exists(database_name):
+        os.remove(database_name)
+    setup_command(database_name)
+    generator = random.Random(seed)
+    with sqlite3.connect(database_name) as connection:
+        connection.executemany("INSERT INTO date (date_value) VALUES (?)",
+                               [((start + timedelta(days=day)).isoformat(),)
+                                for day in range(days)])
+        for table, spec in TABLES.items():
+            placeholders = ", ".join("?" * (len(spec['columns']) + 3))
+            query = f"INSERT INTO {table} (date_id, hour_of_day, utc_timestamp, " \
+                    f"{', '.join(spec['columns'])}) VALUES ({placeholders})"
+            connection.executemany(query, (
+                (day + 1, hour, utc_timestamp(start + timedelta(days=day), hour),
+                 *(round(generator.uniform(-500, 25000), 2) for _ in spec['columns']))
+                for day in range(days)
+                for hour in range(1, hours_in_day(start + timedelta(days=day)) + 1)))
+    return database_name
+
+
+def synthetic_frame(source: int, day: date, generator: random.Random) -> pd.DataFrame:
+    """
+    Create a DataFrame shaped like the output of the fetcher of a source.
+
+    Args:
+        source (int): One of the ServicesEnergy constants.
+        day (date): Day of the data.
+        generator (random.Random): Random generator of the values.
+
+    Returns:
+        pd.DataFrame: Hourly rows indexed by date, with the columns mapped in save.SOURCES.
+    """
+    _, columns = SOURCES[source]
+    hours = hours_in_day(day)
+    data = {}
+    for column, table_column in columns.items():
+        if table_column == 'hour_of_day':
+            data[column] = list(range(1, hours + 1))
+        elif source in (ServicesEnergy.DAY_AHEAD, ServicesEnergy.INTRA_DAY):
+            data[column] = [round(generator.uniform(-500, 2500), 2) for _ in range(hours)]
+        else:
+            # PSE values are float64 columns, like the PSE fetchers return them after normalize()
+            data[column] = [round(generator.uniform(-500, 25000), 3) for _ in range(hours)]
+    return pd.DataFrame(data, index=pd.to_datetime([day.isoformat()] * hours))
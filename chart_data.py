@@ -0,0 +1,264 @@
+"""
+Downsampled series of any table column for charts.
+
+Years of hourly data are reduced on the server to a few thousand points with a
+shape-preserving algorithm:
+    lttb     Largest-Triangle-Three-Buckets, keeps the visually significant points.
+    minmax   The minimum and maximum of every bucket, keeps every peak and trough.
+
+The bucket width is rounded up to a power of two hours, the zoom level of the chart. Requests
+for the same range at the same zoom level share one cached result, which is dropped when the
+database changes.
+
+Kept free of heavy imports so that it can be used by the API as well as by display.py.
+"""
+import math
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+
+from schema import TABLES
+from timemodel import MARKET_TIMEZONE, epoch_hour
+
+METHODS = ('lttb', 'minmax')
+DEFAULT_POINTS = 1000
+MAX_POINTS = 10000
+
+
+def load_series(connection, table: str, column: str, start: str = None,
+                end: str = None) -> list:
+    """
+    Read the hourly values of one column.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the database.
+        table (str): Name of the table, one of schema.TABLES.
+        column (str): Name of a column of the table.
+        start (str): First day (YYYY-MM-DD), inclusive.
+        end (str): Last day (YYYY-MM-DD), inclusive.
+
+    Returns:
+        list: Tuples of (hour number, value) in time order, without missing values. The hour
+        number counts the hours since 1970-01-01 00:00 UTC, so DST days keep the axis regular.
+
+    Raises:
+        ValueError: If the table or column does not exist.
+    """
+    if column not in TABLES.get(table, {}).get('columns', ()):
+        raise ValueError(f"Unknown column {table}.{column}")
+    rows = connection.execute(
+        f"SELECT date_value, hour_of_day, {column} FROM {table} "
+        f"INNER JOIN date ON date.date_id = {table}.date_id "
+        f"WHERE date_value BETWEEN ? AND ? ORDER BY date_value, hour_of_day",
+        (start or '0000-00-00', end or '9999-99-99'))
+    first_hours = {}
+    series = []
+    for date_value, hour, value in rows:
+        if not isinstance(value, (int, float)):
+            continue
+        first = first_hours.get(date_value)
+        if first is None:
+            first = first_hours[date_value] = epoch_hour(date_value)
+        series.append((first + hour - 1, value))
+    return series
+
+
+def lttb(series: list, threshold: int) -> list:
+    """
+    Downsample with Largest-Triangle-Three-Buckets (Steinarsson, 2013).
+
+    Args:
+        series (list): Tuples of (x, y) ordered by x.
+        threshold (int): Number of points to keep, at least 3.
+
+    Returns:
+        list: The kept points, always including the first and the last one.
+    """
+    if threshold >= len(series) or threshold < 3:
+        return list(series)
+    sampled = [series[0]]
+    every = (len(series) - 2) / (threshold - 2)
+    previous = 0
+    for bucket in range(threshold - 2):
+        # Average of the next bucket, the third vertex of the triangles
+        next_start = int((bucket + 1) * every) + 1
+        next_end = min(int((bucket + 2) * every) + 1, len(series))
+        if next_start >= next_end:
+            next_start, next_end = len(series) - 1, len(series)
+        count = next_end - next_start
+        average_x = sum(point[0] for point in series[next_start:next_end]) / count
+        average_y = sum(point[1] for point in series[next_start:next_end]) / count
+
+        previous_x, previous_y = series[previous]
+        best, best_area = None, -1.0
+        for index in range(int(bucket * every) + 1, int((bucket + 1) * every) + 1):
+            x, y = series[index]
+            area = abs((previous_x - average_x) * (y - previous_y)
+                       - (previous_x - x) * (average_y - previous_y))
+            if area > best_area:
+                best, best_area = index, area
+        sampled.append(series[best])
+        previous = best
+    sampled.append(series[-1])
+    return sampled
+
+
+def min_max(series: list, width: int) -> list:
+    """
+    Keep the minimum and the maximum of every bucket of `width` hours, in time order.
+
+    Args:
+        series (list): Tuples of (hour number, value) ordered by hour.
+        width (int): Width of the buckets in hours; buckets are aligned to hour 0.
+
+    Returns:
+        list: At most two points per bucket.
+    """
+    sampled = []
+    bucket, low, high = None, None, None
+    for point in series:
+        if point[0] // width != bucket:
+            if bucket is not None:
+                sampled.extend(sorted({low, high}))
+            bucket, low, high = point[0] // width, point, point
+        elif point[1] < low[1]:
+            low = point
+        elif point[1] > high[1]:
+            high = point
+    if bucket is not None:
+        sampled.extend(sorted({low, high}))
+    return sampled
+
+
+def zoom_level(hours: int, points: int, method: str) -> int:
+    """
+    Width of the buckets in hours, the smallest power of two giving at most `points` points.
+    """
+    per_bucket = 2 if method == 'minmax' else 1
+    return 2 ** max(0, math.ceil(math.log2(max(hours * per_bucket / points, 1))))
+
+
+def _time(hour: int) -> str:
+    moment = datetime.fromtimestamp(hour * 3600, timezone.utc).astimezone(MARKET_TIMEZONE)
+    return moment.isoformat(sep=' ', timespec='minutes')
+
+
+def downsample(series: list, width: int, method: str = 'lttb') -> dict:
+    """
+    Downsample hourly values to one point (lttb) or two points (minmax) per bucket.
+
+    Args:
+        series (list): Tuples of (hour number, value) returned by load_series().
+        width (int): Width of the buckets in hours, see zoom_level().
+        method (str): One of METHODS.
+
+    Returns:
+        dict: {"resolution_hours": ..., "x": [time, ...], "y": [value, ...]}, the times in
+        local market time with their UTC offset.
+
+    Raises:
+        ValueError: If the method is not supported.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unsupported method: {method}")
+    if width == 1 or not series:
+        sampled = series
+    elif method == 'minmax':
+        sampled = min_max(series, width)
+    else:
+        sampled = lttb(series, math.ceil((series[-1][0] - series[0][0] + 1) / width))
+    return {'resolution_hours': width, 'x': [_time(hour) for hour, _ in sampled],
+            'y': [value for _, value in sampled]}
+
+
+def _span(series: list) -> int:
+    return series[-1][0] - series[0][0] + 1 if series else 0
+
+
+def chart_data(connection, table: str, column: str, start: str = None, end: str = None,
+               points: int = DEFAULT_POINTS, method: str = 'lttb') -> dict:
+    """
+    Read and downsample one column to at most `points` points.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the database.
+        table, column, start, end: See load_series().
+        points (int): Maximum number of points.
+        method (str): One of METHODS.
+
+    Returns:
+        dict: The result of downsample() with the table, column and method.
+    """
+    series = load_series(connection, table, column, start, end)
+    return {'table': table, 'column': column, 'method': method,
+            **downsample(series, zoom_level(_span(series), points, method), method)}
+
+
+class ChartCache:
+    """
+    Least recently used cache of downsampled series, shared by the threads of the API.
+
+    Entries are keyed by zoom level, so requests asking for a slightly different number of
+    points over the same range are answered by the same entry.
+
+    Args:
+        size (int): Maximum number of cached series.
+    """
+
+    def __init__(self, size: int = 256):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.version = None
+
+    def get(self, connection, version, table: str, column: str, start: str = None,
+            end: str = None, points: int = DEFAULT_POINTS, method: str = 'lttb') -> dict:
+        """
+        Return the downsampled series, computing it on a miss.
+
+        Args:
+            connection (sqlite3.Connection): Connection to the database.
+            version: Any value changing with the content of the database; a new value
+                empties the cache.
+            table, column, start, end, points, method: See chart_data().
+
+        Returns:
+            dict: The result of chart_data().
+
+        Raises:
+            ValueError: If the table, column, method or a date is not valid.
+        """
+        if method not in METHODS:
+            raise ValueError(f"Unsupported method: {method}")
+        if column not in TABLES.get(table, {}).get('columns', ()):
+            raise ValueError(f"Unknown column {table}.{column}")
+        with self.lock:
+            if version != self.version:
+                self.entries.clear()
+                self.version = version
+        # Open ranges are closed with the first and last day of the table, so the zoom level
+        # is known before reading any value
+        if not start or not end:
+            first, last = connection.execute(
+                f"SELECT MIN(date_value), MAX(date_value) FROM {table} "
+                f"INNER JOIN date ON date.date_id = {table}.date_id").fetchone()
+            start, end = start or first, end or last
+        hours = ((date.fromisoformat(end) - date.fromisoformat(start)).days + 1) * 24 \
+            if start and end else 0
+        width = zoom_level(hours, points, method)
+        key = (table, column, start, end, method, width)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        series = load_series(connection, table, column, start, end)
+        result = {'table': table, 'column': column, 'method': method,
+                  **downsample(series, width, method)}
+        with self.lock:
+            self.entries[key] = result
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return result
+
+
+CACHE = ChartCache()
@@ -1,17 +1,46 @@
 import sqlite3
+from contextlib import contextmanager
 
 
 class Database:
-    def __init__(self, database_name):
-        self.connection = sqlite3.connect(database_name)
+    def __init__(self, database_name, connection: sqlite3.Connection = None):
+        # An already open connection, e.g. to a read-only snapshot, is used as is
+        self.connection = connection or sqlite3.connect(database_name)
         self.cursor = self.connection.cursor()
+        self._transactions = 0
 
     def __del__(self):
         self.connection.close()
 
-    def insert_data(self, sql: str):
-        self.cursor.execute(sql)
-        self.connection.commit()
+    @contextmanager
+    def transaction(self):
+        """
+        Run the statements of the block in one transaction, committed when the block ends
+        and rolled back if it raises. insert_data() and insert_many() do not commit inside it.
+        """
+        self._transactions += 1
+        try:
+            yield self
+        except BaseException:
+            self._transactions -= 1
+            if not self._transactions:
+                self.connection.rollback()
+            raise
+        self._transactions -= 1
+        if not self._transactions:
+            self.connection.commit()
+
+    def _commit(self):
+        if not self._transactions:
+            self.connection.commit()
+
+    def insert_data(self, sql: str, params: tuple = ()):
+        self.cursor.execute(sql, params)
+        self._commit()
+
+    def insert_many(self, sql: str, rows: list):
+        self.cursor.executemany(sql, rows)
+        self._commit()
 
     def select_data(self, sql: str):
         self.cursor.execute(sql)
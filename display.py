@@ -1,21 +1,27 @@
+import sys
+
 import plotly.express as px
-from datetime import datetime
-from fetcher import DataFetcherFactory
 
-# Example usage:
-date = datetime.now()
-data_fetcher_factory = DataFetcherFactory()
+from chart_data import chart_data
+from database import Database
+
+# Example usage: python display.py [table] [column] [start] [end]
+# Plots a column saved by save.py, downsampled to at most 2000 points, without contacting TGE.
+table = sys.argv[1] if len(sys.argv) > 1 else 'day_ahead'
+column = sys.argv[2] if len(sys.argv) > 2 else 'price'
+start = sys.argv[3] if len(sys.argv) > 3 else None
+end = sys.argv[4] if len(sys.argv) > 4 else None
 
+db = Database('energy.db')
 try:
-    # Create a Day-Ahead data fetcher
-    pse_5_fetcher = data_fetcher_factory.create_data_fetcher("Day-Ahead", date)
-    df = pse_5_fetcher.fetch_data()
+    data = chart_data(db.connection, table, column, start, end, points=2000)
 except ValueError as ve:
-    # Handle other ValueErrors
     print(f"Error: {ve}")
+    sys.exit(1)
 
 # Create chart
-fig = px.scatter(df, x="hour", y="price", title=str(date))
+title = f"{table}.{column} ({data['resolution_hours']}h buckets, {data['method']})"
+fig = px.line(x=data['x'], y=data['y'], title=title, labels={'x': 'time', 'y': column})
 
 # Display chart
 fig.show()
@@ -0,0 +1,182 @@
+"""
+Data endpoints of the API, shared by the Flask app (app.py) and the ASGI app (asgi.py).
+
+Every table is served at /<path> (all rows), /<path>/<date> (the rows of one day) and
+/<path>/batch (the rows of a list of days, optionally of some hours only). The records of
+all of them are grouped by date under the "<name>_data" key.
+"""
+import json
+from datetime import date
+
+from schema import TABLES, select_query
+
+# Largest number of days of one batch request
+BATCH_MAX_DATES = 10000
+# Days bound as IN (...) parameters; longer lists are joined through a temporary table
+BATCH_IN_LIMIT = 500
+
+
+class TableEndpoint:
+    """
+    Routes and queries of one table described in schema.TABLES.
+
+    Args:
+        table (str): Name of the table.
+        path (str): URL path of the routes, without the leading slash.
+        name (str): JSON key prefix of the response of all rows.
+        date_name (str): JSON key prefix of the response of one day, `name` by default.
+        keys (dict): Record keys of the columns returned under another name; the other
+            columns keep their column name.
+    """
+
+    def __init__(self, table: str, path: str, name: str, date_name: str = None,
+                 keys: dict = None):
+        self.table = table
+        self.path = path
+        self.name = name
+        self.date_name = date_name or name
+        self.fields = [((keys or {}).get(column, column), column)
+                       for column in TABLES[table]['columns']]
+
+    @property
+    def key_names(self) -> list:
+        return ['id', 'date', 'hour'] + [key for key, _ in self.fields]
+
+    @property
+    def query(self) -> str:
+        return select_query(self.table)
+
+    @property
+    def query_by_date(self) -> str:
+        return f"{self.query} WHERE date_value = ?"
+
+    def query_by_dates(self, dates: int, hours: int = 0) -> str:
+        """
+        Query of the rows of a list of days, optionally restricted to some hours.
+
+        Args:
+            dates (int): Number of date parameters, 0 to join the temp.batch_date table.
+            hours (int): Number of hour parameters following the dates, 0 for all hours.
+
+        Returns:
+            str: The query, ordered by date and hour.
+        """
+        conditions, join = [], ""
+        if dates:
+            conditions.append(f"date_value IN ({', '.join('?' * dates)})")
+        else:
+            join = " INNER JOIN temp.batch_date ON batch_date.day = date.date_value"
+        if hours:
+            conditions.append(f"hour_of_day IN ({', '.join('?' * hours)})")
+        query = self.query + join
+        if conditions:
+            query += f" WHERE {' AND '.join(conditions)}"
+        return f"{query} ORDER BY date_value, hour_of_day"
+
+    @property
+    def view_name(self) -> str:
+        """
+        Name of the Flask view of all rows, also used as the metrics label.
+        """
+        return f"fetch_{self.path.replace('-', '_')}"
+
+
+ENDPOINTS = {endpoint.table: endpoint for endpoint in [
+    TableEndpoint('day_ahead', 'days-ahead', 'days_head', 'day_ahead'),
+    TableEndpoint('intra_day', 'intra-days', 'intra_day',
+                  keys={'intraday_avg_price': 'avg_price', 'intraday_min_price': 'min_price',
+                        'intraday_max_price': 'max_price'}),
+    TableEndpoint('current_daily_plan', 'current-daily-plans', 'current_daily_plan'),
+    TableEndpoint('balancing_market', 'balancing-markets', 'balancing_market'),
+    TableEndpoint('five_years_plan', 'five-years-plans', 'five_years_plan'),
+]}
+
+
+def parse_batch(dates, hours=None) -> tuple:
+    """
+    Validate the days and hours of a batch request.
+
+    Args:
+        dates (str | list): Days (YYYY-MM-DD) as a list or a comma separated string.
+        hours (str | list): Hours of the day as a list or a comma separated string, None for
+            all hours.
+
+    Returns:
+        tuple: The sorted distinct days and hours (an empty list for all hours).
+
+    Raises:
+        ValueError: If a day or an hour is not valid, or there are no or too many days.
+    """
+    if isinstance(dates, str):
+        dates = dates.split(',')
+    if isinstance(hours, str):
+        hours = hours.split(',')
+    if not isinstance(dates, list) or not isinstance(hours or [], list):
+        raise ValueError("dates and hours must be lists")
+    days = sorted({date.fromisoformat(str(value).strip()).isoformat() for value in dates if value})
+    if not days or len(days) > BATCH_MAX_DATES:
+        raise ValueError(f"Between 1 and {BATCH_MAX_DATES} dates are required")
+    return days, sorted({int(hour) for hour in hours or [] if hour != ''})
+
+
+def select_batch(connection, endpoint: TableEndpoint, days: list, hours: list = ()) -> list:
+    """
+    Run the query of a list of days in one statement.
+
+    Up to BATCH_IN_LIMIT days are bound as an IN (...) list on the indexed date_value; longer
+    lists are written to a temporary table of the connection and joined.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the database.
+        endpoint (TableEndpoint): Routes and queries of the table.
+        days (list): Days returned by parse_batch().
+        hours (list): Hours returned by parse_batch(), empty for all hours.
+
+    Returns:
+        list: Rows of (id, date, hour, values...) ordered by date and hour.
+    """
+    if len(days) <= BATCH_IN_LIMIT:
+        return connection.execute(endpoint.query_by_dates(len(days), len(hours)),
+                                  [*days, *hours]).fetchall()
+    connection.execute("CREATE TEMP TABLE IF NOT EXISTS batch_date (day DATE PRIMARY KEY)")
+    connection.executemany("INSERT INTO temp.batch_date (day) VALUES (?)",
+                           [(day,) for day in days])
+    try:
+        return connection.execute(endpoint.query_by_dates(0, len(hours)), hours).fetchall()
+    finally:
+        # Ends the implicit transaction, which would keep a shared lock on the database
+        connection.execute("DELETE FROM temp.batch_date")
+        connection.commit()
+
+
+def group_by_date(results: list, endpoint_name: str, key_names: list) -> dict:
+    """
+    Organize query rows by date.
+
+    Args:
+        results (list): Rows of (id, date, hour, values...).
+        endpoint_name (str): JSON key prefix of the response.
+        key_names (list): Record key of every column of the rows.
+
+    Returns:
+        dict: {"<endpoint_name>_data": [{"date": ..., "records": [...]}, ...]}
+    """
+    data_by_date = {}
+    for result in results:
+        record = {key: value for key, value in zip(key_names, result) if key != "date"}
+        data_by_date.setdefault(result[1], []).append(record)
+    data = [{'date': date, 'records': records} for date, records in data_by_date.items()]
+    return {f'{endpoint_name}_data': data}
+
+
+def render(results: list, endpoint_name: str, key_names: list) -> bytes:
+    """
+    Serialize query rows to the JSON body of a data endpoint, byte for byte as Flask's
+    jsonify() outside of debug mode.
+
+    Returns:
+        bytes: The JSON document.
+    """
+    body = json.dumps(group_by_date(results, endpoint_name, key_names), sort_keys=True,
+                      separators=(',', ':'))
+    return f"{body}\n".encode()
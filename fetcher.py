@@ -2,46 +2,253 @@
 Main module for data fetching.
 """
 from abc import ABC, abstractmethod
+import json
+import os
 from datetime import datetime, timedelta
-from urllib.error import HTTPError
+from io import BytesIO
 from contextlib import closing
 
-from requests import get
+from requests import get, RequestException
 import pandas as pd
-from bs4 import BeautifulSoup
 import numpy as np
 
+from archive import PayloadArchive
+from metrics import FETCH_BYTES, FETCH_ERRORS, FETCH_ROWS, FETCH_STAGE_SECONDS
+from profiling import profiled
+from rate_limit import LIMITERS
+# ServicesEnergy and DataFetcherFactory are re-exported for existing imports
+from registry import DataFetcherFactory, ServicesEnergy
+from resilience import CircuitOpenError, FetchError, ResiliencePolicy, TransientHTTPError, \
+    is_transient
+from timemodel import contract_name, hour_labels, hour_slots, hours_in_day
+
+# Failures of a request that remain after the retries of the resilience policy
+REQUEST_ERRORS = (RequestException, TransientHTTPError, CircuitOpenError)
+
+# Base URLs of the sources, overridden to target a local stand-in such as mock_server.py
+PSE_BASE_URL = os.environ.get('PSE_BASE_URL', 'https://www.pse.pl').rstrip('/')
+TGE_BASE_URL = os.environ.get('TGE_BASE_URL', 'https://www.tge.pl').rstrip('/')
+# Directory archiving every downloaded document for reprocessing (see archive.py), off if unset
+RAW_ARCHIVE_DIR = os.environ.get('RAW_ARCHIVE_DIR')
+# Storage of the parsed columns: "numpy" (default), "pyarrow" for compact Arrow buffers or
+# "numpy_nullable"
+DTYPE_BACKEND = os.environ.get('FETCH_DTYPE_BACKEND', 'numpy')
+
+
+def backend_options() -> dict:
+    """
+    Keyword arguments selecting DTYPE_BACKEND in read_csv() and to_numeric().
+    """
+    return {} if DTYPE_BACKEND == 'numpy' else {'dtype_backend': DTYPE_BACKEND}
 
-class ServicesEnergy:
-    DAY_AHEAD = 0
-    INTRA_DAY = 1
-    PSE_5_YEARS_PLAN = 2
-    PSE_BALANCING_MARKET = 3
-    PSE_CURRENT_DAILY_COORDINATION_PLAN = 4
+
+def with_backend(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert a DataFrame built from Python lists to DTYPE_BACKEND.
+    """
+    return data if DTYPE_BACKEND == 'numpy' else data.convert_dtypes(dtype_backend=DTYPE_BACKEND)
 
 
 class DataFetcher(ABC):
     """
         This is a base class for data fetching.
 
+        Fetching is split in two stages: download() returns the raw documents of the source
+        and parse() turns them into a DataFrame, so recorded documents can be parsed again
+        without network access.
+
         Args:
             factory_date (datetime): The date for data fetching.
 
         Methods:
-            fetch_data(): This method should be implemented by subclasses to fetch data.
+            fetch_data(): Downloads and parses the data of the date.
+            download(): This method should be implemented by subclasses to download the raw documents.
+            parse(payload): This method should be implemented by subclasses to parse the raw documents.
+            http_get(url): GET request within the rate limits of the host.
+            stage(name): Times a stage of the fetch (see metrics.py).
     """
 
+    # One of the ServicesEnergy constants
+    source = None
+    # Name of the source, also used for the directories of recorded documents
+    name = None
+    # Timeouts, retries and circuit breaker of the requests (see resilience.py)
+    policy = ResiliencePolicy()
+
     def __init__(self, factory_date: datetime):
         self.factory_date = factory_date
 
-    @abstractmethod
+    def http_get(self, url: str, **kwargs):
+        """
+        Send a GET request within the rate and concurrency limits of the host (see rate_limit.py),
+        with the timeouts, retries and circuit breaker of the policy of the fetcher.
+
+        Args:
+            url (str): URL of the request.
+            **kwargs: Arguments passed to requests.get.
+
+        Returns:
+            requests.Response: The response.
+
+        Raises:
+            requests.RequestException, TransientHTTPError, CircuitOpenError: If the request failed.
+        """
+        kwargs.setdefault('timeout', self.policy.timeout)
+
+        def send():
+            with LIMITERS.for_url(url).slot() as outcome:
+                response = get(url, **kwargs)
+                outcome(response.status_code)
+            return response
+
+        return self.policy.call(url, send)
+
+    def error(self, message: str, cause: Exception = None) -> FetchError:
+        """
+        Build the FetchError reported for the source and day of this fetcher.
+
+        Args:
+            message (str): Description of the failure.
+            cause (Exception): The underlying exception, used to tell transient failures.
+
+        Returns:
+            FetchError: The error to raise.
+        """
+        return FetchError(message, source=self.source, day=self.factory_date,
+                          transient=cause is not None and is_transient(cause),
+                          retry_after=getattr(cause, 'retry_after', None))
+
+    def stage(self, name: str):
+        """
+        Time a stage of the fetch: download, decode, parse or normalize.
+
+        Args:
+            name (str): Name of the stage.
+
+        Returns:
+            contextmanager: Observes the duration of the block.
+        """
+        return FETCH_STAGE_SECONDS.time(source=self.name, stage=name)
+
     def fetch_data(self):
         """
-            This method should be implemented by subclasses to fetch data.
+        Download and parse the data of the date.
+
+        Returns:
+            pd.DataFrame: The parsed data.
+
+        Raises:
+            FetchError: If the data cannot be downloaded or parsed.
+        """
+        with profiled(f"fetch-{self.name}-{self.factory_date:%Y-%m-%d}", 'fetch'):
+            try:
+                with self.stage('download'):
+                    payload = self.download()
+                FETCH_BYTES.inc(sum(len(content) for content in payload.values()),
+                                source=self.name)
+                if RAW_ARCHIVE_DIR:
+                    PayloadArchive(RAW_ARCHIVE_DIR).save(self.name, self.factory_date, payload)
+                data = self.parse_payload(payload)
+            except REQUEST_ERRORS as e:
+                FETCH_ERRORS.inc(source=self.name)
+                raise self.error(f"HTTP Error: {e}", e)
+            except FetchError:
+                FETCH_ERRORS.inc(source=self.name)
+                raise
+            FETCH_ROWS.inc(len(data), source=self.name)
+            return data
+
+    def parse_payload(self, payload: dict):
+        """
+        Parse downloaded documents, reporting failures as FetchError.
+
+        Args:
+            payload (dict): Document name -> content, as returned by download().
+
+        Returns:
+            pd.DataFrame: The parsed data.
+
+        Raises:
+            FetchError: If the documents cannot be parsed.
+        """
+        try:
+            return self.parse(payload)
+        except FetchError:
+            raise
+        except pd.errors.ParserError as e:
+            raise self.error(f"Error parsing CSV data: {e}", e)
+        except UnicodeDecodeError as e:
+            raise self.error(f"UnicodeDecodeError: {e}", e)
+        except Exception as e:
+            raise self.error(f"An unexpected error occurred: {e}", e)
+
+    @abstractmethod
+    def download(self) -> dict:
+        """
+            This method should be implemented by subclasses to download the raw documents.
+
+            Returns:
+                dict: Document name -> content (bytes).
+        """
+
+    @abstractmethod
+    def parse(self, payload: dict):
+        """
+            This method should be implemented by subclasses to parse the raw documents.
+
+            Args:
+                payload (dict): Document name -> content, as returned by download().
+
+            Returns:
+                pd.DataFrame: The parsed data.
+        """
+
+
+class PSEDataFetcher(DataFetcher, ABC):
+    """
+        Base class of the fetchers of the CSV exports of Polskie Sieci Energetyczne (PSE).
+    """
+
+    @abstractmethod
+    def url(self) -> str:
+        """
+            This method should be implemented by subclasses to return the URL of the CSV export.
+        """
+
+    def download(self) -> dict:
+        response = self.http_get(self.url())
+        response.raise_for_status()
+        return {'data.csv': response.content}
+
+    def read_csv(self, payload: dict) -> pd.DataFrame:
+        with self.stage('parse'):
+            # The parser decodes the export and converts the decimal commas and the "-" of
+            # missing values itself, so numeric columns are never materialized as strings.
+            return pd.read_csv(BytesIO(payload['data.csv']), sep=";", encoding="ISO-8859-11",
+                               decimal=",", na_values=["-"], **backend_options())
+
+    def parse(self, payload: dict):
+        data = self.read_csv(payload)
+        with self.stage('normalize'):
+            data = self.normalize(data)
+            # Hour labels ("1".."24", "2A" on the 25-hour day) become the slots of the day
+            data['Godzina'] = hour_slots(self.factory_date, data['Godzina'])
+            return data
+
+    @abstractmethod
+    def normalize(self, data: pd.DataFrame):
+        """
+            This method should be implemented by subclasses to clean up the parsed CSV export.
+
+            Args:
+                data (pd.DataFrame): The CSV export as read by read_csv().
+
+            Returns:
+                pd.DataFrame: The data indexed by date.
         """
 
 
-class PSE5YearsPlanDataFetcher(DataFetcher):
+class PSE5YearsPlanDataFetcher(PSEDataFetcher):
     """
         A data fetcher for retrieving data from Polskie Sieci Energetyczne (PSE) -
         Polish Power System Operation - Coordinated 5-years Plan - Basic data.
@@ -55,41 +262,29 @@ class PSE5YearsPlanDataFetcher(DataFetcher):
             fetch_data(): This method fetches data and returns a DataFrame.
 
         Raises:
-            HTTPError: If there is an HTTP error while requesting data.
-            pd.errors.ParserError: If there is an error parsing the CSV data.
+            FetchError: If the data cannot be downloaded or parsed.
     """
+    source = ServicesEnergy.PSE_5_YEARS_PLAN
+    name = 'five_years_plan'
 
-    def fetch_data(self):
+    def url(self) -> str:
         current_date = self.factory_date.strftime('%Y%m%d')
         next_date = (self.factory_date + timedelta(days=1)).strftime('%Y%m%d')
+        return f"{PSE_BASE_URL}/getcsv/-/export/csv/PL_PD_GO_BILANS/data_od/{current_date}/" \
+               f"data_do/{next_date}"
 
-        url = f"https://www.pse.pl/getcsv/-/export/csv/PL_PD_GO_BILANS/data_od/{current_date}/" \
-              f"data_do/{next_date}"
-        try:
-            data = pd.read_csv(url, encoding="ISO-8859-11", sep=";")
-            # print(data['Moc dyspozycyjna JW i magazyn๓w energii wiadczนcych usณugi bilansujนce w ramach RB'].head(24))
-            data[
-                "Moc dyspozycyjna JW i magazyn๓w energii wiadczนcych usณugi bilansujนce w ramach RB dost๊pna dla OSP"] = \
-                data[
-                    "Moc dyspozycyjna JW i magazyn๓w energii wiadczนcych usณugi bilansujนce w ramach RB dost๊pna dla OSP"].str.replace(
-                    '\xa0', '')
-            data[
-                "Moc dyspozycyjna JW i magazyn๓w energii wiadczนcych usณugi bilansujนce w ramach RB dost๊pna dla OSP"] = \
-                pd.to_numeric(data[
-                                  "Moc dyspozycyjna JW i magazyn๓w energii wiadczนcych usณugi bilansujนce w ramach RB dost๊pna dla OSP"],
-                              errors='coerce')
-            data['Doba'] = pd.to_datetime(data['Doba'])
-            data.set_index('Doba', inplace=True)
-            return data.head(24)
-        except HTTPError as e:
-            raise ValueError(f"HTTP Error {e.code}: {e.reason}")
-        except pd.errors.ParserError as e:
-            raise ValueError(f"Error parsing CSV data: {e}")
-        except UnicodeDecodeError as e:
-            raise ValueError(f"UnicodeDecodeError: {e}")
+    def normalize(self, data: pd.DataFrame):
+        # Thousands of this column are separated by non-breaking spaces
+        column = "Moc dyspozycyjna JW i magazyn๓w energii wiadczนcych usณugi bilansujนce w ramach RB dost๊pna dla OSP"
+        if pd.api.types.is_string_dtype(data[column]):
+            data[column] = pd.to_numeric(data[column].str.replace('\xa0', ''), errors='coerce',
+                                         **backend_options())
+        data['Doba'] = pd.to_datetime(data['Doba'])
+        # The export covers two days, the first hours are the ones of the requested day
+        return data.set_index('Doba').head(hours_in_day(self.factory_date))
 
 
-class PSEBalancingMarketFetcher(DataFetcher):
+class PSEBalancingMarketFetcher(PSEDataFetcher):
     """
         A data fetcher for retrieving data from Polskie Sieci Energetyczne (PSE) -
         Polish Power System Operation - Balancing Market Operation - Energy & Prices on Balancing Market data.
@@ -103,29 +298,21 @@ class PSEBalancingMarketFetcher(DataFetcher):
             fetch_data(): This method fetches data and returns a DataFrame.
 
         Raises:
-            HTTPError: If there is an HTTP error while requesting data.
-            pd.errors.ParserError: If there is an error parsing the CSV data.
+            FetchError: If the data cannot be downloaded or parsed.
     """
+    source = ServicesEnergy.PSE_BALANCING_MARKET
+    name = 'balancing_market'
 
-    def fetch_data(self):
+    def url(self) -> str:
         date = self.factory_date.strftime('%Y%m%d')
+        return f"{PSE_BASE_URL}/getcsv/-/export/csv/PL_CENY_NIEZB_RB/data/{date}"
 
-        url = f"https://www.pse.pl/getcsv/-/export/csv/PL_CENY_NIEZB_RB/data/{date}"
-        try:
-            data = pd.read_csv(url, encoding="ISO-8859-11", sep=";")
-            data['Data'] = pd.to_datetime(data['Data'], format='%Y%m%d', errors='coerce')
-            data.set_index('Data', inplace=True)
-            data = data.apply(lambda col: col.str.replace(',', '.') if col.dtype == 'O' else col)
-            return data
-        except HTTPError as e:
-            raise ValueError(f"HTTP Error {e.code}: {e.reason}")
-        except pd.errors.ParserError as e:
-            raise ValueError(f"Error parsing CSV data: {e}")
-        except UnicodeDecodeError as e:
-            raise ValueError(f"UnicodeDecodeError: {e}")
+    def normalize(self, data: pd.DataFrame):
+        data['Data'] = pd.to_datetime(data['Data'].astype(str), format='%Y%m%d', errors='coerce')
+        return data.set_index('Data')
 
 
-class PSECurrentDailyCoordinationPlanFetcher(DataFetcher):
+class PSECurrentDailyCoordinationPlanFetcher(PSEDataFetcher):
     """
         A data fetcher for retrieving data from Polskie Sieci Energetyczne (PSE) -
         Polish Power System Operation - Current Daily Coordination Plan - Basic data.
@@ -139,26 +326,18 @@ class PSECurrentDailyCoordinationPlanFetcher(DataFetcher):
             fetch_data(): This method fetches data and returns a DataFrame.
 
         Raises:
-            HTTPError: If there is an HTTP error while requesting data.
-            pd.errors.ParserError: If there is an error parsing the CSV data.
+            FetchError: If the data cannot be downloaded or parsed.
     """
+    source = ServicesEnergy.PSE_CURRENT_DAILY_COORDINATION_PLAN
+    name = 'current_daily_plan'
 
-    def fetch_data(self):
+    def url(self) -> str:
         date = self.factory_date.strftime('%Y%m%d')
+        return f"{PSE_BASE_URL}/getcsv/-/export/csv/PL_BPKD/data/{date}"
 
-        url = f"https://www.pse.pl/getcsv/-/export/csv/PL_BPKD/data/{date}"
-        try:
-            data = pd.read_csv(url, encoding="ISO-8859-11", sep=";")
-            data['Data'] = pd.to_datetime(data['Data'])
-            data.set_index('Data', inplace=True)
-            data = data.apply(lambda col: col.str.replace(',', '.') if col.dtype == 'O' else col)
-            return data
-        except HTTPError as e:
-            raise ValueError(f"HTTP Error {e.code}: {e.reason}")
-        except pd.errors.ParserError as e:
-            raise ValueError(f"Error parsing CSV data: {e}")
-        except UnicodeDecodeError as e:
-            raise ValueError(f"UnicodeDecodeError: {e}")
+    def normalize(self, data: pd.DataFrame):
+        data['Data'] = pd.to_datetime(data['Data'])
+        return data.set_index('Data')
 
 
 class DayAheadDataFetcher(DataFetcher):
@@ -174,54 +353,49 @@ class DayAheadDataFetcher(DataFetcher):
         Methods:
             fetch_data(): This method fetches electricity price data and returns it as a DataFrame.
     """
+    source = ServicesEnergy.DAY_AHEAD
+    name = 'day_ahead'
 
-    def fetch_data(self):
+    def download(self) -> dict:
         # Subtract 1 day from the date because the service provides data that is 1 day ahead."
-        self.factory_date = self.factory_date - timedelta(days=1)
-        url = f"https://www.tge.pl/energia-elektryczna-rdn?dateShosw=" \
-              f"{self.factory_date.strftime('%d-%m-%Y')}&dateAction=next"
-        # Recall the subtraction
-        self.factory_date = self.factory_date + timedelta(days=1)
-
-        def get_html(url):
-            try:
-                with closing(get(url, stream=False)) as resp:
-                    if resp.status_code == 200 and resp.headers['content-type'] is not None:
-                        return resp
-                    else:
-                        return None
-            except ConnectionError as ce:
-                raise ConnectionError(f"ConnectionError: {ce}")
-
-        try:
-            result = get_html(url)
-
-            if result is not None:
-                bs = BeautifulSoup(result.text, 'lxml')
-                prices = []
-                fixing = 1
-                for index, body in enumerate(bs.find_all('tbody')):
-                    if index == 2:
-                        for index2, price in enumerate(body.find_all('td', 'footable-visible')):
-                            if index2 == fixing:
-                                prices.append(
-                                    float([price.get_text().strip().replace(',', '.')][0]))
-                                fixing += 7
-                data = pd.DataFrame(data=prices, columns=['price'])
-                data['date'] = self.factory_date.strftime('%Y-%m-%d')
-                # Convert the 'date' column to datetime format
-                data['date'] = pd.to_datetime(data['date'])
-
-                # Set the 'date' column as the index
-                data.set_index('date', inplace=True)
-                data['hour'] = list(range(1, 25))
-                return data
-            else:
-                # Raise an exception when the response is None
-                raise ValueError("Error: Unable to retrieve data from the server.")
-        except Exception as e:
-            # Raise any other exceptions
-            raise ValueError(f"An unexpected error occurred: {e}")
+        previous_date = self.factory_date - timedelta(days=1)
+        url = f"{TGE_BASE_URL}/energia-elektryczna-rdn?dateShosw=" \
+              f"{previous_date.strftime('%d-%m-%Y')}&dateAction=next"
+
+        with closing(self.http_get(url, stream=False)) as resp:
+            if resp.status_code == 200 and resp.headers['content-type'] is not None:
+                return {'rdn.html': resp.content}
+        raise self.error("Error: Unable to retrieve data from the server.")
+
+    def parse(self, payload: dict):
+        # Imported here so that the PSE fetchers do not load BeautifulSoup
+        from bs4 import BeautifulSoup
+        with self.stage('decode'):
+            bs = BeautifulSoup(payload['rdn.html'], 'lxml')
+        with self.stage('parse'):
+            prices = []
+            fixing = 1
+            for index, body in enumerate(bs.find_all('tbody')):
+                if index == 2:
+                    for index2, price in enumerate(body.find_all('td', 'footable-visible')):
+                        if index2 == fixing:
+                            prices.append(
+                                float([price.get_text().strip().replace(',', '.')][0]))
+                            fixing += 7
+        with self.stage('normalize'):
+            if len(prices) != hours_in_day(self.factory_date):
+                # Not transient: fetching the same page again would not fix it
+                raise self.error(f"Expected {hours_in_day(self.factory_date)} hourly prices, "
+                                 f"found {len(prices)}")
+            data = pd.DataFrame(data=prices, columns=['price'])
+            data['date'] = self.factory_date.strftime('%Y-%m-%d')
+            # Convert the 'date' column to datetime format
+            data['date'] = pd.to_datetime(data['date'])
+
+            # Set the 'date' column as the index
+            data.set_index('date', inplace=True)
+            data['hour'] = list(range(1, len(data) + 1))
+            return with_backend(data)
 
 
 class IntraDayMarketFetcher(DataFetcher):
@@ -229,7 +403,8 @@ class IntraDayMarketFetcher(DataFetcher):
     A data fetcher for retrieving data from TGE (Polish Power Exchange) - Intra Day Market.
 
     This class fetches electricity price data from the TGE website for a specific date
-    and returns it as a pandas DataFrame.
+    and returns it as a pandas DataFrame. The trades of every hourly contract are kept in
+    the `trades` entry of DataFrame.attrs as a dict of hour -> DataFrame.
 
     Args:
         factory_date (datetime): The date for data fetching.
@@ -237,128 +412,96 @@ class IntraDayMarketFetcher(DataFetcher):
     Methods:
         fetch_data(): This method fetches electricity price data and returns it as a DataFrame.
     """
-
-    def fetch_data(self):
-        avg = []
-        for hour in range(1, 10):
-            try:
-                url = 'https://www.tge.pl/graph-days?targetId=IDM_{}_H0{}&dateStart={}&soapType=XBID&currency=pln&hour=max'.format(
-                    self.factory_date.strftime('%d-%m-%y'),
-                    hour,
-                    self.factory_date.strftime('%Y-%m-%d'))
-                r = get(url)
-                data = pd.DataFrame(r.json()['data'])
-                avg.append(np.average(data['kurs'], weights=data['volumen']))
-            except Exception as e:
-                avg.append(np.nan)
-        for hour in range(10, 25):
-            try:
-                url = 'https://www.tge.pl/graph-days?targetId=IDM_{}_H{}&dateStart={}&soapType=XBID&currency=pln&hour=max'.format(
-                    self.factory_date.strftime('%d-%m-%y'),
-                    hour,
-                    self.factory_date.strftime('%Y-%m-%d'))
-                r = get(url)
-                data = pd.DataFrame(r.json()['data'])
-                avg.append(np.average(data['kurs'], weights=data['volumen']))
-            except Exception as e:
-                avg.append(np.nan)
+    source = ServicesEnergy.INTRA_DAY
+    name = 'intra_day'
+    # 25 small documents per day: fail fast on a stalled socket and retry more often
+    policy = ResiliencePolicy(read_timeout=15, attempts=5)
+
+    def download(self) -> dict:
+        payload = {}
+        # One contract per delivery hour, named by its local end hour (H03A is the repeated
+        # hour of the 25-hour day, see timemodel.contract_name)
+        for label in hour_labels(self.factory_date):
+            contract = contract_name(label)
+            url = '{}/graph-days?targetId=IDM_{}_{}&dateStart={}&soapType=XBID&currency=pln&hour=max'.format(
+                TGE_BASE_URL,
+                self.factory_date.strftime('%d-%m-%y'),
+                contract,
+                self.factory_date.strftime('%Y-%m-%d'))
+            payload[f'{contract}.json'] = self.http_get(url).content
         # Pobieranie danych z strony Rynku Dnia Bieżącego
-        link = 'https://www.tge.pl/energia-elektryczna-rdb?dateShow={}&dateAction=prev'.format(
+        link = '{}/energia-elektryczna-rdb?dateShow={}&dateAction=prev'.format(
+            TGE_BASE_URL,
             self.factory_date.strftime('%d-%m-%Y'))
-
-        def gethtml(url):
-            try:
-                with closing(get(url, stream=False)) as resp:
-                    return resp
-                    if resp.status_code == 200 and resp.headers['content-type'] is not None:
-                        return resp
-                    return None
-            except Exception as e:
-                print(e)
-                # log_error('Error during requests to {0} : {1}'.format(url, str(e)))
-                return None
-
-        result = gethtml(link)
-
-        bs = BeautifulSoup(result.text, 'lxml')
-        body = []
-        for link in bs.find_all('tbody'):
-            body.append(link)
-
-        headings = []
-        for td in body[0].find_all('td'):
-            # remove any newlines and extra spaces from left and right
-            headings.append(td)
-
-        r = 2
-        temp = []
-        for i in range(24):
-            temp.append(str(headings[r]))
-            r += 11
-        rdb_min = []
-        for i in range(24):
-            rdb_min.append(temp[i].split('>')[2].split('<')[0].replace(',', '.'))
-
-        r = 3
-        temp = []
-        for i in range(24):
-            temp.append(str(headings[r]))
-            r += 11
-        rdb_max = []
-        for i in range(24):
-            rdb_max.append(temp[i].split('>')[2].split('<')[0].replace(',', '.'))
-        r = 4
-        temp = []
-        for i in range(24):
-            temp.append(str(headings[r]))
-            r += 11
-        rdb_avg = []
-        for i in range(24):
-            rdb_avg.append(temp[i].split('>')[2].split('<')[0].replace(',', '.'))
-
-        data = pd.DataFrame([rdb_min, rdb_max, rdb_avg], index=['min', 'max', 'last'])
-        data = data.transpose()
-        data['date'] = self.factory_date.strftime('%Y-%m-%d')
-        # Convert the 'date' column to datetime format
-        data['date'] = pd.to_datetime(data['date'])
-        data.set_index('date', inplace=True)
-        data.rename(columns={'min': 'cenaIntraMin', 'max': 'cenaIntraMax'}, inplace=True)
-        data['cenaIntraAvg'] = avg
-        data['hour'] = list(range(1, 25))
-        return data[['cenaIntraAvg', 'cenaIntraMin', 'cenaIntraMax', 'hour']]
-
-
-class DataFetcherFactory:
-    """
-    Factory for creating data fetchers for different sources and dates.
-    """
-
-    def create_data_fetcher(self, source: str, factory_date: datetime):
-        """
-        Create a data fetcher for the specified source and date.
-
-        Args:
-            source (str): The data source (e.g., "PSE" or "TGE").
-            factory_date (datetime): The date for data fetching.
-
-        Returns:
-            DataFetcher: An instance of the appropriate data fetcher class.
-
-        Raises:
-            ValueError: If an invalid source is specified.
-        """
-        if source == ServicesEnergy.PSE_5_YEARS_PLAN:
-            return PSE5YearsPlanDataFetcher(factory_date)
-        if source == ServicesEnergy.PSE_BALANCING_MARKET:
-            return PSEBalancingMarketFetcher(factory_date)
-        if source == ServicesEnergy.PSE_CURRENT_DAILY_COORDINATION_PLAN:
-            return PSECurrentDailyCoordinationPlanFetcher(factory_date)
-        if source == ServicesEnergy.DAY_AHEAD:
-            return DayAheadDataFetcher(factory_date)
-        if source == ServicesEnergy.INTRA_DAY:
-            return IntraDayMarketFetcher(factory_date)
-        else:
-            raise ValueError("Invalid source specified")
+        with closing(self.http_get(link, stream=False)) as resp:
+            payload['rdb.html'] = resp.content
+        return payload
+
+    def parse(self, payload: dict):
+        from bs4 import BeautifulSoup
+        with self.stage('parse'):
+            avg = []
+            # Every trade of each hourly contract, kept for the tick store (see tick_store.py)
+            trades = {}
+            hours = hours_in_day(self.factory_date)
+            for hour, label in enumerate(hour_labels(self.factory_date), start=1):
+                try:
+                    data = pd.DataFrame(json.loads(payload[f'{contract_name(label)}.json'])['data'])
+                    trades[hour] = data
+                    avg.append(np.average(data['kurs'], weights=data['volumen']))
+                except (KeyError, TypeError, ValueError, ZeroDivisionError):
+                    # No trades of this contract hour
+                    avg.append(np.nan)
+
+            bs = BeautifulSoup(payload['rdb.html'], 'lxml')
+            body = []
+            for link in bs.find_all('tbody'):
+                body.append(link)
+
+            headings = []
+            for td in body[0].find_all('td'):
+                # remove any newlines and extra spaces from left and right
+                headings.append(td)
+
+            r = 2
+            temp = []
+            for i in range(hours):
+                temp.append(str(headings[r]))
+                r += 11
+            rdb_min = []
+            for i in range(hours):
+                rdb_min.append(temp[i].split('>')[2].split('<')[0].replace(',', '.'))
+
+            r = 3
+            temp = []
+            for i in range(hours):
+                temp.append(str(headings[r]))
+                r += 11
+            rdb_max = []
+            for i in range(hours):
+                rdb_max.append(temp[i].split('>')[2].split('<')[0].replace(',', '.'))
+            r = 4
+            temp = []
+            for i in range(hours):
+                temp.append(str(headings[r]))
+                r += 11
+            rdb_avg = []
+            for i in range(hours):
+                rdb_avg.append(temp[i].split('>')[2].split('<')[0].replace(',', '.'))
+
+        with self.stage('normalize'):
+            data = pd.DataFrame([rdb_min, rdb_max, rdb_avg], index=['min', 'max', 'last'])
+            data = data.transpose()
+            data['date'] = self.factory_date.strftime('%Y-%m-%d')
+            # Convert the 'date' column to datetime format
+            data['date'] = pd.to_datetime(data['date'])
+            data.set_index('date', inplace=True)
+            data.rename(columns={'min': 'cenaIntraMin', 'max': 'cenaIntraMax'}, inplace=True)
+            data['cenaIntraAvg'] = avg
+            data['hour'] = list(range(1, hours + 1))
+            data = with_backend(data[['cenaIntraAvg', 'cenaIntraMin', 'cenaIntraMax', 'hour']])
+            data.attrs['trades'] = trades
+            return data
 
 
 if __name__ == "__main__":
@@ -0,0 +1,406 @@
+"""
+Memory-mapped time-series store for the API read path.
+
+Every table from schema.TABLES is kept as a fixed-shape float64 array of
+(day offset, hour slot, 1 + number of columns) stored in a plain file, with 25 hour
+slots so that the longest DST day fits; the unused slots of shorter days are NaN. The
+first value of each row is the primary key of the SQLite row, so the store can answer the
+same queries as the API without touching SQLite. Files are opened with numpy.memmap, which means that
+all gunicorn workers share the same pages of the OS cache instead of holding copies.
+
+Usage:
+    python hot_store.py build [energy.db] [store_dir]
+    python hot_store.py refresh [energy.db] [store_dir]
+"""
+import json
+import os
+import sqlite3
+import sys
+import time
+import warnings
+from datetime import date, timedelta
+
+import numpy as np
+
+from schema import HOURS_PER_DAY, TABLES
+
+META_FILE = 'meta.json'
+LOCK_FILE = '.lock'
+# Extra days allocated when the store grows, so that daily refreshes do not resize the arrays.
+GROWTH_DAYS = 366
+
+
+class HotStore:
+    """
+    Read side of the memory-mapped store.
+
+    Args:
+        store_dir (str): Directory containing meta.json and the array files.
+
+    Methods:
+        select_by_date(table, date_value): Rows for a single day.
+        select_range(table, start, end): Rows for an inclusive range of days.
+        aggregate(table, column, start, end, func, by): Aggregate a column with array slicing.
+        reload_if_changed(): Re-open the arrays when the store was refreshed.
+    """
+
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        self.meta = None
+        self.arrays = {}
+        self._meta_mtime = None
+        self._load()
+
+    def _load(self):
+        meta_path = os.path.join(self.store_dir, META_FILE)
+        self._meta_mtime = os.stat(meta_path).st_mtime_ns
+        with open(meta_path, encoding='utf-8') as file:
+            self.meta = json.load(file)
+        self.start = date.fromisoformat(self.meta['start'])
+        self.days = self.meta['days']
+        self.arrays = {}
+        for table, spec in self.meta['tables'].items():
+            # Stores built before the DST-aware day model have 24 hour slots
+            shape = (self.meta['capacity'], self.meta.get('hours', 24),
+                     len(spec['columns']) + 1)
+            self.arrays[table] = np.memmap(os.path.join(self.store_dir, spec['file']),
+                                           dtype=np.float64, mode='r', shape=shape)
+
+    def reload_if_changed(self) -> bool:
+        """
+        Re-open the store when meta.json was rewritten by a refresh.
+
+        Returns:
+            bool: True if the store was reloaded.
+        """
+        try:
+            mtime = os.stat(os.path.join(self.store_dir, META_FILE)).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime == self._meta_mtime:
+            return False
+        try:
+            self._load()
+        except FileNotFoundError:
+            # The files named by the meta.json just read were replaced by another refresh
+            self._load()
+        return True
+
+    def has_table(self, table: str) -> bool:
+        return table in self.arrays
+
+    def _offsets(self, start: str = None, end: str = None) -> tuple:
+        first = 0 if start is None else (date.fromisoformat(start) - self.start).days
+        last = self.days - 1 if end is None else (date.fromisoformat(end) - self.start).days
+        return max(first, 0), min(last, self.days - 1)
+
+    def _rows(self, table: str, first: int, last: int) -> list:
+        if first > last:
+            return []
+        block = self.arrays[table][first:last + 1]
+        present = ~np.isnan(block[:, :, 0])
+        day_index, hour_index = np.nonzero(present)
+        values = block[present]
+        ids = values[:, 0].astype(np.int64).tolist()
+        columns = values[:, 1:]
+        # The DECIMAL columns of SQLite return whole numbers as integers, so do the same
+        integral = np.isfinite(columns) & (columns == np.trunc(columns))
+        missing = np.isnan(columns)
+        if integral.any() or missing.any():
+            objects = columns.astype(object)
+            objects[integral] = columns[integral].astype(np.int64).tolist()
+            objects[missing] = None
+            columns = objects
+        dates = [(self.start + timedelta(days=first + day)).isoformat()
+                 for day in range(block.shape[0])]
+        return [(row_id, dates[day], hour + 1, *row)
+                for row_id, day, hour, row in zip(ids, day_index.tolist(),
+                                                  hour_index.tolist(),
+                                                  columns.tolist())]
+
+    def select_by_date(self, table: str, date_value: str) -> list:
+        """
+        Return the rows of a table for one day, shaped like the API SQL queries.
+
+        Args:
+            table (str): Name of the table.
+            date_value (str): Date in YYYY-MM-DD format.
+
+        Returns:
+            list: Tuples of (id, date_value, hour_of_day, *columns).
+        """
+        try:
+            first, last = self._offsets(date_value, date_value)
+        except ValueError:
+            return []
+        return self._rows(table, first, last)
+
+    def select_range(self, table: str, start: str = None, end: str = None) -> list:
+        """
+        Return the rows of a table for an inclusive range of days.
+
+        Args:
+            table (str): Name of the table.
+            start (str): First date in YYYY-MM-DD format, or None for the beginning.
+            end (str): Last date in YYYY-MM-DD format, or None for the end.
+
+        Returns:
+            list: Tuples of (id, date_value, hour_of_day, *columns).
+        """
+        first, last = self._offsets(start, end)
+        return self._rows(table, first, last)
+
+    def column(self, table: str, column: str, start: str = None, end: str = None) -> np.ndarray:
+        """
+        Return a (days, hours) view of a single column.
+
+        Args:
+            table (str): Name of the table.
+            column (str): Name of the column.
+            start (str): First date in YYYY-MM-DD format, or None for the beginning.
+            end (str): Last date in YYYY-MM-DD format, or None for the end.
+
+        Returns:
+            np.ndarray: Values with NaN for missing hours.
+        """
+        index = self.meta['tables'][table]['columns'].index(column) + 1
+        first, last = self._offsets(start, end)
+        return self.arrays[table][first:max(last + 1, first), :, index]
+
+    def aggregate(self, table: str, column: str, start: str = None, end: str = None,
+                  func: str = 'mean', by: str = None):
+        """
+        Aggregate a column over a range of days.
+
+        Args:
+            table (str): Name of the table.
+            column (str): Name of the column.
+            start (str): First date in YYYY-MM-DD format.
+            end (str): Last date in YYYY-MM-DD format.
+            func (str): One of "mean", "min", "max", "sum" or "count".
+            by (str): None for a single value, "day" for one value per day or "hour" for
+                one value per hour of the day.
+
+        Returns:
+            float | list: The aggregated value(s), None where there is no data.
+
+        Raises:
+            ValueError: If func or by is not supported.
+        """
+        functions = {'mean': np.nanmean, 'min': np.nanmin, 'max': np.nanmax,
+                     'sum': np.nansum,
+                     'count': lambda values, axis=None: np.sum(~np.isnan(values), axis=axis)}
+        if func not in functions:
+            raise ValueError(f"Unsupported aggregate: {func}")
+        axes = {None: None, 'day': 1, 'hour': 0}
+        if by not in axes:
+            raise ValueError(f"Unsupported grouping: {by}")
+        values = self.column(table, column, start, end)
+        if values.size == 0:
+            return None if by is None else []
+        with warnings.catch_warnings():
+            # All-NaN slices are reported as None below.
+            warnings.simplefilter('ignore', RuntimeWarning)
+            result = functions[func](values, axis=axes[by])
+        if by is None:
+            return None if np.isnan(result) else float(result)
+        return [None if np.isnan(value) else float(value) for value in np.asarray(result, dtype=float)]
+
+
+class HotStoreWriter:
+    """
+    Builds and incrementally refreshes the memory-mapped store from energy.db.
+
+    Args:
+        database_name (str): Path to the SQLite database.
+        store_dir (str): Directory of the store.
+    """
+
+    def __init__(self, database_name: str, store_dir: str):
+        self.database_name = database_name
+        self.store_dir = store_dir
+
+    def _read_meta(self):
+        try:
+            with open(os.path.join(self.store_dir, META_FILE), encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def _write_meta(self, meta: dict):
+        meta['version'] = meta.get('version', 0) + 1
+        meta_path = os.path.join(self.store_dir, META_FILE)
+        tmp_path = f"{meta_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(meta, file)
+        os.replace(tmp_path, meta_path)
+
+    def _fetch_rows(self, connection, table: str, since: str = None) -> list:
+        spec = TABLES[table]
+        query = f"SELECT date_value, hour_of_day, {spec['id']}, {', '.join(spec['columns'])} " \
+                f"FROM {table} INNER JOIN date ON date.date_id = {table}.date_id"
+        if since is None:
+            return connection.execute(query).fetchall()
+        return connection.execute(f"{query} WHERE date_value >= ?", (since,)).fetchall()
+
+    @staticmethod
+    def _to_float(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return np.nan
+
+    def _allocate(self, table: str, generation: int, capacity: int, columns: int, old=None):
+        file_name = f"{table}.{generation}.f8"
+        array = np.memmap(os.path.join(self.store_dir, file_name), dtype=np.float64, mode='w+',
+                          shape=(capacity, HOURS_PER_DAY, columns + 1))
+        array[:] = np.nan
+        if old is not None:
+            array[:old.shape[0]] = old
+        return file_name, array
+
+    def build(self) -> dict:
+        """
+        Build the store from scratch.
+
+        Returns:
+            dict: The metadata of the new store.
+        """
+        os.makedirs(self.store_dir, exist_ok=True)
+        old_meta = self._read_meta()
+        generation = old_meta['generation'] + 1 if old_meta else 1
+        with sqlite3.connect(self.database_name) as connection:
+            bounds = connection.execute("SELECT MIN(date_value), MAX(date_value) FROM date").fetchone()
+            start = date.fromisoformat(bounds[0]) if bounds[0] else date.today()
+            end = date.fromisoformat(bounds[1]) if bounds[1] else start
+            days = (end - start).days + 1
+            capacity = days + GROWTH_DAYS
+            meta = {'version': old_meta['version'] if old_meta else 0, 'generation': generation,
+                    'start': start.isoformat(), 'days': days, 'capacity': capacity,
+                    'hours': HOURS_PER_DAY, 'tables': {}}
+            for table, spec in TABLES.items():
+                file_name, array = self._allocate(table, generation, capacity, len(spec['columns']))
+                self._fill(array, start, self._fetch_rows(connection, table))
+                array.flush()
+                meta['tables'][table] = {'file': file_name, 'columns': spec['columns']}
+        self._write_meta(meta)
+        if old_meta:
+            self._remove_files(old_meta, meta)
+        return meta
+
+    def _fill(self, array: np.ndarray, start: date, rows: list) -> int:
+        last = -1
+        for row in rows:
+            day = (date.fromisoformat(row[0]) - start).days
+            hour = int(row[1]) - 1
+            if day < 0 or day >= array.shape[0] or not 0 <= hour < HOURS_PER_DAY:
+                continue
+            array[day, hour] = [self._to_float(value) for value in row[2:]]
+            last = max(last, day)
+        return last
+
+    def _remove_files(self, old_meta: dict, meta: dict):
+        current = {spec['file'] for spec in meta['tables'].values()}
+        for spec in old_meta['tables'].values():
+            if spec['file'] not in current:
+                try:
+                    os.remove(os.path.join(self.store_dir, spec['file']))
+                except OSError:
+                    pass
+
+    def refresh(self, since: str = None) -> dict:
+        """
+        Load the days starting at `since` into the store, growing it when needed.
+
+        Only rows with date_value >= since are read from SQLite, so a daily refresh costs
+        one day of data. Days that precede the start of the store force a full rebuild.
+        Like build(), the refreshed arrays are written to new files and published by the
+        atomic replace of meta.json, so readers never map a half-written day.
+
+        Args:
+            since (str): First date to reload in YYYY-MM-DD format, the earliest day that
+                was saved. Defaults to the last day already present in the store, which
+                misses any older day saved since the last refresh.
+
+        Returns:
+            dict: The metadata of the refreshed store.
+        """
+        meta = self._read_meta()
+        if meta is None or set(meta['tables']) != set(TABLES) \
+                or meta.get('hours', 24) != HOURS_PER_DAY:
+            return self.build()
+        start = date.fromisoformat(meta['start'])
+        if since is None:
+            since = (start + timedelta(days=max(meta['days'] - 1, 0))).isoformat()
+        with sqlite3.connect(self.database_name) as connection:
+            first = connection.execute("SELECT MIN(date_value), MAX(date_value) FROM date "
+                                        "WHERE date_value >= ?", (since,)).fetchone()
+            if first[0] is None:
+                return meta
+            if date.fromisoformat(first[0]) < start:
+                return self.build()
+            needed = (date.fromisoformat(first[1]) - start).days + 1
+            capacity = needed + GROWTH_DAYS if needed > meta['capacity'] else meta['capacity']
+            new_meta = dict(meta, generation=meta['generation'] + 1, tables={},
+                            capacity=capacity, days=max(meta['days'], needed))
+            for table, spec in TABLES.items():
+                shape = (meta['capacity'], HOURS_PER_DAY, len(spec['columns']) + 1)
+                path = os.path.join(self.store_dir, meta['tables'][table]['file'])
+                old = np.memmap(path, dtype=np.float64, mode='r', shape=shape)
+                file_name, array = self._allocate(table, new_meta['generation'], capacity,
+                                                  len(spec['columns']), old=old)
+                del old
+                self._fill(array, start, self._fetch_rows(connection, table, since))
+                array.flush()
+                new_meta['tables'][table] = {'file': file_name, 'columns': spec['columns']}
+        self._write_meta(new_meta)
+        self._remove_files(meta, new_meta)
+        return new_meta
+
+
+def open_or_build(store_dir: str, database_name: str, timeout: float = 60.0) -> HotStore:
+    """
+    Open the store, building it first if it does not exist yet.
+
+    A lock file makes sure that only one of several starting workers builds the store;
+    the others wait for it and then map the same files.
+
+    Args:
+        store_dir (str): Directory of the store.
+        database_name (str): Path to the SQLite database.
+        timeout (float): Seconds to wait for another process building the store.
+
+    Returns:
+        HotStore: The opened store.
+    """
+    meta_path = os.path.join(store_dir, META_FILE)
+    if not os.path.exists(meta_path):
+        os.makedirs(store_dir, exist_ok=True)
+        lock_path = os.path.join(store_dir, LOCK_FILE)
+        try:
+            descriptor = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            deadline = time.monotonic() + timeout
+            while not os.path.exists(meta_path) and time.monotonic() < deadline:
+                time.sleep(0.1)
+        else:
+            try:
+                HotStoreWriter(database_name, store_dir).build()
+            finally:
+                os.close(descriptor)
+                os.remove(lock_path)
+    return HotStore(store_dir)
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else 'build'
+    database = sys.argv[2] if len(sys.argv) > 2 else 'energy.db'
+    directory = sys.argv[3] if len(sys.argv) > 3 else 'hot_store'
+    writer = HotStoreWriter(database, directory)
+    if command == 'build':
+        result = writer.build()
+    elif command == 'refresh':
+        result = writer.refresh()
+    else:
+        raise SystemExit(f"Unknown command: {command}")
+    print(f"Hot store {directory} at version {result['version']} holds {result['days']} days")
@@ -0,0 +1,327 @@
+"""
+Counters, histograms and gauges of the fetch, ingest and API stages.
+
+Every observation is a lock, a bisect and two additions, cheap enough to leave on in
+production. The API exposes the metrics in the Prometheus text format on /metrics, and
+ingest runs print a summary when they finish.
+
+The counters and histograms live in the memory of each process. When the API runs with
+several workers (gunicorn, uvicorn --workers), set METRICS_MULTIPROC_DIR to a directory
+emptied before the server starts: every process then writes its values there every
+METRICS_FLUSH_SECONDS (default 5) and when it exits, and /metrics of any worker returns
+the sum over all processes, including workers that were restarted. Gauges always describe
+the process that renders them.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the histogram buckets, from a fast SQL query to a slow download
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _labels(names: tuple, values: tuple, extra: str = None) -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """
+    Monotonic counter, one value per combination of label values.
+
+    Args:
+        name (str): Metric name.
+        documentation (str): Help text.
+        labelnames (tuple): Names of the labels.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def state(self) -> dict:
+        with self.lock:
+            return dict(self.values)
+
+    @staticmethod
+    def merge(values: dict, key: tuple, value):
+        values[key] = values.get(key, 0) + value
+
+    def render(self, values: dict = None) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        values = self.state() if values is None else values
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+    def summary(self) -> list:
+        with self.lock:
+            return [f"{self.name}{_labels(self.labelnames, key)}: {value:g}"
+                    for key, value in sorted(self.values.items())]
+
+
+class Histogram:
+    """
+    Histogram of durations, one set of buckets per combination of label values.
+
+    Args:
+        name (str): Metric name.
+        documentation (str): Help text.
+        labelnames (tuple): Names of the labels.
+        buckets (tuple): Sorted upper bounds of the buckets.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (),
+                 buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Label values -> [count per bucket (last one is +Inf), sum]
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observe the duration of the block, also when it raises.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def state(self) -> dict:
+        with self.lock:
+            return {key: [list(counts), total] for key, (counts, total) in self.values.items()}
+
+    @staticmethod
+    def merge(values: dict, key: tuple, value):
+        counts, total = value
+        state = values.get(key)
+        if state is None:
+            values[key] = [list(counts), total]
+        else:
+            state[0] = [mine + other for mine, other in zip(state[0], counts)]
+            state[1] += total
+
+    def render(self, values: dict = None) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        values = self.state() if values is None else values
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} "
+                             f"{cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+    def summary(self) -> list:
+        with self.lock:
+            return [f"{self.name}{_labels(self.labelnames, key)}: {sum(counts)} x "
+                    f"{total / sum(counts) * 1000:.1f}ms = {total:.3f}s"
+                    for key, (counts, total) in sorted(self.values.items())]
+
+
+class Gauge:
+    """
+    Current values read from their owner whenever the metrics are rendered.
+
+    Args:
+        name (str): Metric name.
+        documentation (str): Help text.
+        labelnames (tuple): Names of the labels.
+        collect (callable): Returns {label values: value} of the current state.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple, collect):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def _values(self) -> list:
+        return sorted((tuple(map(str, key)), value) for key, value in self.collect().items())
+
+    def render(self, values: dict = None) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for key, value in self._values():
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+    def summary(self) -> list:
+        return [f"{self.name}{_labels(self.labelnames, key)}: {value:g}"
+                for key, value in self._values()]
+
+
+class MetricsRegistry:
+    """
+    All metrics of the process.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.directory = None
+        self.interval = None
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (),
+                  buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple, collect) -> Gauge:
+        metric = Gauge(name, documentation, labelnames, collect)
+        self.metrics.append(metric)
+        return metric
+
+    def share(self, directory: str, interval: float = 5.0):
+        """
+        Aggregate the counters and histograms of all processes through a directory.
+
+        Starts a thread writing the values of this process every `interval` seconds, also
+        in processes forked later (gunicorn workers), and once more when the process exits.
+
+        Args:
+            directory (str): Directory shared by the processes, emptied before they start.
+            interval (float): Seconds between two writes.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.interval = interval
+        self._start_flusher()
+        os.register_at_fork(after_in_child=self._start_flusher)
+        atexit.register(self.flush)
+
+    def _start_flusher(self):
+        threading.Thread(target=self._flush_forever, name='metrics-flush', daemon=True).start()
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def _shared(self) -> list:
+        return [metric for metric in self.metrics if not isinstance(metric, Gauge)]
+
+    def flush(self):
+        """
+        Write the counters and histograms of this process to the shared directory.
+        """
+        if self.directory is None:
+            return
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        values = {metric.name: [[list(key), value] for key, value in metric.state().items()]
+                  for metric in self._shared()}
+        with open(f"{path}.tmp", 'w', encoding='utf-8') as file:
+            json.dump(values, file)
+        os.replace(f"{path}.tmp", path)
+
+    def _aggregate(self) -> dict:
+        """
+        Values of this process plus the last values written by every other process.
+        """
+        merged = {metric.name: metric.state() for metric in self._shared()}
+        if self.directory is None:
+            return merged
+        metrics = {metric.name: metric for metric in self._shared()}
+        own = f"{os.getpid()}.json"
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith('.json') or file_name == own:
+                continue
+            try:
+                with open(os.path.join(self.directory, file_name), encoding='utf-8') as file:
+                    values = json.load(file)
+            except (OSError, ValueError):
+                continue
+            for name, entries in values.items():
+                if name in metrics:
+                    for key, value in entries:
+                        metrics[name].merge(merged[name], tuple(key), value)
+        return merged
+
+    def render(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format, summed over the
+        processes sharing METRICS_MULTIPROC_DIR when it is set.
+
+        Returns:
+            str: The exposition.
+        """
+        merged = self._aggregate()
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render(merged.get(metric.name)))
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """
+        Human-readable summary of the metrics that were observed.
+
+        Returns:
+            str: One line per metric and label values.
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.summary())
+        return "\n".join(lines)
+
+
+METRICS = MetricsRegistry()
+if os.environ.get('METRICS_MULTIPROC_DIR'):
+    METRICS.share(os.environ['METRICS_MULTIPROC_DIR'],
+                  float(os.environ.get('METRICS_FLUSH_SECONDS', '5')))
+
+FETCH_STAGE_SECONDS = METRICS.histogram(
+    'energy_fetch_stage_seconds', "Duration of the download, decode, parse and normalize stages.",
+    ('source', 'stage'))
+FETCH_BYTES = METRICS.counter(
+    'energy_fetch_bytes_total', "Bytes downloaded from the sources.", ('source',))
+FETCH_ROWS = METRICS.counter(
+    'energy_fetch_rows_total', "Rows parsed from the downloaded documents.", ('source',))
+FETCH_ERRORS = METRICS.counter(
+    'energy_fetch_errors_total', "Failed fetches.", ('source',))
+INGEST_BATCH_SECONDS = METRICS.histogram(
+    'energy_ingest_batch_seconds', "Duration of the saved batches of rows.", ('table',))
+INGEST_ROWS = METRICS.counter(
+    'energy_ingest_rows_total', "Rows inserted or updated.", ('table',))
+API_STAGE_SECONDS = METRICS.histogram(
+    'energy_api_stage_seconds', "Duration of the query and serialize stages of the API.",
+    ('endpoint', 'stage'))
+API_ROWS = METRICS.counter(
+    'energy_api_rows_total', "Rows returned by the API.", ('endpoint',))
+API_BYTES = METRICS.counter(
+    'energy_api_bytes_total', "Bytes of the API responses.", ('endpoint',))
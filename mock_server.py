@@ -0,0 +1,286 @@
+"""
+Local stand-in of the PSE and TGE endpoints used by the fetchers, for load tests.
+
+The server answers the same URL shapes as www.pse.pl and www.tge.pl with realistic data
+generated for any date. The data of a date is always the same, so runs can be compared.
+Latency, failures and throttling are configurable to exercise the concurrency limits,
+connection pooling and retries of the fetchers.
+
+Usage:
+    python mock_server.py [--port 8000] [--latency 0.2] [--jitter 0.1] [--error-rate 0.05]
+                          [--rate 20] [--burst 40]
+
+Point the fetchers at it with:
+    export PSE_BASE_URL=http://127.0.0.1:8000 TGE_BASE_URL=http://127.0.0.1:8000
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from flask import Flask, Response, abort, jsonify, request
+
+from rate_limit import TokenBucket
+from registry import ServicesEnergy
+from save import SOURCES
+from timemodel import contract_name, hour_labels, hour_slot, hours_in_day
+
+app = Flask(__name__)
+
+
+class MockConfig:
+    """
+    Fault injection settings of the mock server.
+
+    Args:
+        latency (float): Seconds added to every response.
+        jitter (float): Maximum random seconds added on top of the latency.
+        error_rate (float): Share of requests answered with 503.
+        rate (float): Requests per second served before answering 429, None for no limit.
+        burst (int): Burst of requests allowed by the rate limit.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 rate: float = None, burst: int = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.bucket = None if rate is None else TokenBucket(rate, burst or max(int(rate), 1))
+
+
+config = MockConfig()
+stats = {'requests': 0, 'throttled': 0, 'errors': 0}
+stats_lock = threading.Lock()
+
+
+def count(key: str):
+    with stats_lock:
+        stats[key] += 1
+
+
+@app.before_request
+def inject_faults():
+    if request.path == '/stats':
+        return None
+    count('requests')
+    if config.bucket is not None:
+        wait = config.bucket.try_acquire()
+        if wait:
+            count('throttled')
+            return Response("Too Many Requests", status=429,
+                            headers={'Retry-After': str(math.ceil(wait))})
+    if config.latency or config.jitter:
+        time.sleep(config.latency + random.uniform(0, config.jitter))
+    if config.error_rate and random.random() < config.error_rate:
+        count('errors')
+        return Response("Service Unavailable", status=503)
+    return None
+
+
+@app.route('/stats')
+def get_stats():
+    with stats_lock:
+        return jsonify(dict(stats))
+
+
+def generator(kind: str, day: date) -> random.Random:
+    # String seeds are hashed deterministically, unlike hash() of a tuple
+    return random.Random(f"{kind}:{day.isoformat()}")
+
+
+def daily_profile(hour: int) -> float:
+    """
+    Shape of the daily demand, about 0.8 at night and 1.2 in the evening peak.
+    """
+    return 1 + 0.2 * math.sin(math.pi * (hour - 8) / 12)
+
+
+def day_ahead_prices(day: date) -> list:
+    rng = generator('day_ahead', day)
+    base = rng.uniform(350, 650)
+    return [round(base * daily_profile(hour) + rng.gauss(0, 25), 2)
+            for hour in range(1, hours_in_day(day) + 1)]
+
+
+def intraday_trades(day: date, hour: int) -> list:
+    """
+    Trades of the intraday contract delivered in `hour` of `day`.
+
+    Returns:
+        list: Dicts with the time (czas), price (kurs) and volume (volumen) of each trade.
+    """
+    rng = generator(f'intra_day_H{hour:02d}', day)
+    if rng.random() < 0.02:
+        return []
+    delivery = datetime.combine(day, datetime.min.time()) + timedelta(hours=hour - 1)
+    price = day_ahead_prices(day)[hour - 1]
+    seconds = sorted(rng.uniform(30 * 60, 8 * 3600) for _ in range(rng.randint(5, 80)))
+    trades = []
+    for offset in reversed(seconds):
+        price = max(price + rng.gauss(0, 8), -500)
+        trades.append({'czas': (delivery - timedelta(seconds=offset)).isoformat(sep=' ',
+                                                                               timespec='seconds'),
+                       'kurs': round(price, 2), 'volumen': round(rng.uniform(0.1, 25), 1)})
+    return trades
+
+
+def decimal(value: float, digits: int = 2) -> str:
+    return f"{value:.{digits}f}".replace('.', ',')
+
+
+def pse_csv(date_column: str, rows: list) -> Response:
+    """
+    Render rows as a PSE CSV export: semicolon separated, encoded like the original exports.
+    """
+    lines = [";".join(rows[0].keys())]
+    lines += [";".join(str(value) for value in row.values()) for row in rows]
+    content = ("\r\n".join(lines) + "\r\n").encode('ISO-8859-11')
+    return Response(content, mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename="{date_column}.csv"'})
+
+
+def source_columns(source: int) -> list:
+    _, columns = SOURCES[source]
+    return [column for column, table_column in columns.items() if table_column != 'hour_of_day']
+
+
+def parse_day(value: str, fmt: str = '%Y%m%d') -> date:
+    try:
+        return datetime.strptime(value, fmt).date()
+    except ValueError:
+        abort(400)
+
+
+@app.route('/getcsv/-/export/csv/PL_PD_GO_BILANS/data_od/<start>/data_do/<end>')
+def five_years_plan(start: str, end: str):
+    first, last = parse_day(start), parse_day(end)
+    columns = source_columns(ServicesEnergy.PSE_5_YEARS_PLAN)
+    # The column with thousands separated by non-breaking spaces, as in the original export
+    spaced = next(column for column, table_column in SOURCES[ServicesEnergy.PSE_5_YEARS_PLAN][1].items()
+                  if table_column == 'AvailableForTSOCapacityBalancingMarketUnits')
+    rows = []
+    day = first
+    while day <= last:
+        rng = generator('five_years_plan', day)
+        for hour, label in enumerate(hour_labels(day), start=1):
+            row = {'Doba': day.isoformat(), 'Godzina': label}
+            for column in columns:
+                value = round(rng.uniform(500, 25000) * daily_profile(hour))
+                row[column] = f"{value:,}".replace(',', '\xa0') if column == spaced else value
+            rows.append(row)
+        day += timedelta(days=1)
+    return pse_csv('PL_PD_GO_BILANS', rows)
+
+
+@app.route('/getcsv/-/export/csv/PL_CENY_NIEZB_RB/data/<day>')
+def balancing_market(day: str):
+    day = parse_day(day)
+    rng = generator('balancing_market', day)
+    prices = day_ahead_prices(day)
+    rows = []
+    for hour, label in enumerate(hour_labels(day), start=1):
+        cro = prices[hour - 1] + rng.gauss(0, 40)
+        imbalance = rng.gauss(0, 400)
+        rows.append({'Data': day.strftime('%Y%m%d'), 'Godzina': label, 'CRO': decimal(cro),
+                     'CROs': decimal(cro + rng.uniform(0, 30)),
+                     'CROz': decimal(cro - rng.uniform(0, 30)),
+                     'Stan zakontraktowania': decimal(rng.uniform(14000, 22000) * daily_profile(hour), 3),
+                     'Niezbilansowanie': decimal(imbalance, 3)})
+    return pse_csv('PL_CENY_NIEZB_RB', rows)
+
+
+@app.route('/getcsv/-/export/csv/PL_BPKD/data/<day>')
+def current_daily_plan(day: str):
+    day = parse_day(day)
+    rng = generator('current_daily_plan', day)
+    columns = source_columns(ServicesEnergy.PSE_CURRENT_DAILY_COORDINATION_PLAN)
+    rows = []
+    for hour, label in enumerate(hour_labels(day), start=1):
+        row = {'Data': day.isoformat(), 'Godzina': label}
+        for column in columns:
+            row[column] = decimal(rng.uniform(100, 25000) * daily_profile(hour), 3)
+        rows.append(row)
+    return pse_csv('PL_BPKD', rows)
+
+
+def shown_day() -> date:
+    """
+    Day displayed by a TGE page, from its dateShow parameter (the fetchers also send the
+    misspelled dateShosw) and the dateAction=next navigation.
+    """
+    value = request.args.get('dateShow') or request.args.get('dateShosw')
+    if value is None:
+        abort(400)
+    day = parse_day(value, '%d-%m-%Y')
+    if request.args.get('dateAction') == 'next':
+        day += timedelta(days=1)
+    return day
+
+
+def html_table(rows: list, cell: str) -> str:
+    body = "".join("<tr>" + "".join(cell.format(value) for value in row) + "</tr>"
+                   for row in rows)
+    return f"<table class=\"footable table\"><tbody>{body}</tbody></table>"
+
+
+@app.route('/energia-elektryczna-rdn')
+def day_ahead_page():
+    day = shown_day()
+    rng = generator('day_ahead_volume', day)
+    summary = [["Fixing I", decimal(sum(day_ahead_prices(day)) / hours_in_day(day))]]
+    rows = [[f"{hour - 1}-{hour}", decimal(price), decimal(rng.uniform(8000, 20000), 1),
+             decimal(price * 0.95), decimal(rng.uniform(200, 900), 1), decimal(price * 0.22),
+             decimal(rng.uniform(50, 300), 1)]
+            for hour, price in enumerate(day_ahead_prices(day), start=1)]
+    tables = html_table(summary, "<td>{}</td>") + html_table(summary, "<td>{}</td>") + \
+        html_table(rows, "<td class=\"footable-visible\">{}</td>")
+    return f"<html><head><title>RDN {day:%d-%m-%Y}</title></head><body>{tables}</body></html>"
+
+
+@app.route('/energia-elektryczna-rdb')
+def intraday_page():
+    day = shown_day()
+    rows = []
+    for hour, label in enumerate(hour_labels(day), start=1):
+        prices = [trade['kurs'] for trade in intraday_trades(day, hour)] or [0.0]
+        volume = sum(trade['volumen'] for trade in intraday_trades(day, hour))
+        rows.append([f"{day:%d-%m-%y}_{contract_name(label)}", f"{hour - 1}-{hour}", decimal(min(prices)),
+                     decimal(max(prices)), decimal(prices[-1]), decimal(volume, 1), "-", "-",
+                     "-", "-", "-"])
+    # The fetcher reads the text of a tag nested in every cell
+    table = html_table(rows, "<td><span>{}</span></td>")
+    return f"<html><head><title>RDB {day:%d-%m-%Y}</title></head><body>{table}</body></html>"
+
+
+@app.route('/graph-days')
+def intraday_trades_document():
+    target = request.args.get('targetId', '')
+    try:
+        day = date.fromisoformat(request.args['dateStart'])
+        hour = hour_slot(day, target.rsplit('_H', 1)[1])
+    except (IndexError, KeyError, ValueError):
+        abort(400)
+    return Response(json.dumps({'data': intraday_trades(day, hour)}),
+                    mimetype='application/json')
+
+
+def parse_arguments(arguments: list = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Mock PSE and TGE server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds per response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="random extra seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of 503 responses")
+    parser.add_argument('--rate', type=float, default=None, help="requests/s before 429")
+    parser.add_argument('--burst', type=int, default=None, help="burst of the rate limit")
+    return parser.parse_args(arguments)
+
+
+if __name__ == "__main__":
+    options = parse_arguments()
+    config = MockConfig(options.latency, options.jitter, options.error_rate, options.rate,
+                        options.burst)
+    app.run(host=options.host, port=options.port, threaded=True)
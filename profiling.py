@@ -0,0 +1,223 @@
+"""
+Opt-in profiling of one save.py run, one fetcher invocation or one API request.
+
+Profiling is off unless ENERGY_PROFILE selects a profiler:
+    cprofile  Deterministic profile written as a .prof file (pstats, snakeviz, flameprof).
+    sample    Sampling profiler walking the stack every ENERGY_PROFILE_INTERVAL seconds
+              (default 0.005), written as folded stacks (.folded) for flamegraph.pl,
+              speedscope or inferno. Its overhead is low enough for production runs.
+
+ENERGY_PROFILE_SCOPE selects what is profiled: "save" (default) profiles a whole save.py
+run, "fetch" every fetcher invocation and "api" every API request. With
+ENERGY_PROFILE_REQUESTS=1 the API also profiles single requests that send the
+X-Energy-Profile header (cprofile or sample). Files are written to ENERGY_PROFILE_DIR
+(default "profiles").
+
+Usage:
+    ENERGY_PROFILE=sample python save.py
+    python profiling.py fetch 4 2023-12-27 [cprofile|sample]
+"""
+import cProfile
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+MODES = ('cprofile', 'sample')
+PROFILE_DIR = os.environ.get('ENERGY_PROFILE_DIR', 'profiles')
+SAMPLE_INTERVAL = float(os.environ.get('ENERGY_PROFILE_INTERVAL', '0.005'))
+# Only one deterministic profiler can be active at a time
+_cprofile_lock = threading.Lock()
+
+
+def enabled_mode(scope: str):
+    """
+    Profiler selected by the environment for a scope.
+
+    Args:
+        scope (str): "save", "fetch" or "api".
+
+    Returns:
+        str: "cprofile" or "sample", None if the scope is not profiled.
+    """
+    mode = os.environ.get('ENERGY_PROFILE')
+    scopes = os.environ.get('ENERGY_PROFILE_SCOPE', 'save').split(',')
+    if mode in MODES and scope in scopes:
+        return mode
+    return None
+
+
+def requests_allowed() -> bool:
+    return os.environ.get('ENERGY_PROFILE_REQUESTS', '') in ('1', 'true', 'yes')
+
+
+class StackSampler:
+    """
+    Sampling profiler counting the stacks of threads from a background thread.
+
+    Args:
+        interval (float): Seconds between two samples.
+        thread_id (int): Thread to sample, None for all threads but the sampler.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL, thread_id: int = None):
+        self.interval = interval
+        self.thread_id = thread_id
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    @staticmethod
+    def _label(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or (self.thread_id is not None
+                                           and thread_id != self.thread_id):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame))
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def write(self, path: str):
+        with open(path, 'w', encoding='utf-8') as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+
+class Profiler:
+    """
+    One profiling session of a save run, a fetcher invocation or an API request.
+
+    Args:
+        name (str): Name of the profiled operation, used in the file name.
+        mode (str): "cprofile" or "sample".
+        all_threads (bool): Sample every thread instead of the one starting the session.
+    """
+
+    def __init__(self, name: str, mode: str, all_threads: bool = False):
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiler {mode}, expected one of {', '.join(MODES)}")
+        self.name = name
+        self.mode = mode
+        self.all_threads = all_threads
+        self.profile = None
+        self.sampler = None
+        self.started = None
+
+    def start(self):
+        """
+        Raises:
+            RuntimeError: If another cProfile session is running.
+        """
+        self.started = time.perf_counter()
+        if self.mode == 'cprofile':
+            if not _cprofile_lock.acquire(blocking=False):
+                raise RuntimeError("Another cProfile session is running")
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        else:
+            self.sampler = StackSampler(thread_id=None if self.all_threads
+                                        else threading.get_ident())
+            self.sampler.start()
+        return self
+
+    def stop(self) -> str:
+        """
+        Stop profiling and write the profile.
+
+        Returns:
+            str: Path of the written file.
+        """
+        elapsed = time.perf_counter() - self.started
+        if self.profile is not None:
+            # Released before writing, so that a failed write does not disable profiling
+            self.profile.disable()
+            _cprofile_lock.release()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        safe_name = "".join(c if c.isalnum() or c in '-_' else '_' for c in self.name)
+        base = os.path.join(PROFILE_DIR, f"{safe_name}-{datetime.now():%Y%m%d-%H%M%S-%f}")
+        if self.profile is not None:
+            path = f"{base}.prof"
+            self.profile.dump_stats(path)
+        else:
+            self.sampler.stop()
+            path = f"{base}.folded"
+            self.sampler.write(path)
+        print(f"Profile of {self.name} ({elapsed:.3f}s) written to {path}")
+        return path
+
+
+@contextmanager
+def profiled(name: str, scope: str, all_threads: bool = False):
+    """
+    Profile the block if the environment enables profiling for the scope.
+
+    Args:
+        name (str): Name of the profiled operation.
+        scope (str): "save", "fetch" or "api".
+        all_threads (bool): Sample every thread instead of the current one.
+    """
+    profiler = start_session(name, scope, all_threads)
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.stop()
+
+
+def start_session(name: str, scope: str, all_threads: bool = False, mode: str = None):
+    """
+    Start profiling if the environment enables it for the scope, for code that cannot be
+    wrapped in profiled().
+
+    Args:
+        name (str): Name of the profiled operation.
+        scope (str): "save", "fetch" or "api".
+        all_threads (bool): Sample every thread instead of the current one.
+        mode (str): Profiler requested explicitly, e.g. by a request header.
+
+    Returns:
+        Profiler: The running profiler, to be stopped by the caller, or None if profiling is
+            disabled or another cProfile session is running.
+    """
+    mode = mode or enabled_mode(scope)
+    if mode is None:
+        return None
+    try:
+        return Profiler(name, mode, all_threads).start()
+    except RuntimeError as e:
+        print(f"Not profiling {name}: {e}")
+        return None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4 or sys.argv[1] != 'fetch':
+        print(__doc__)
+        sys.exit(1)
+    from registry import DataFetcherFactory
+
+    source, day = int(sys.argv[2]), datetime.strptime(sys.argv[3], '%Y-%m-%d')
+    mode = sys.argv[4] if len(sys.argv) > 4 else 'cprofile'
+    fetcher = DataFetcherFactory().create_data_fetcher(source, day)
+    profiler = Profiler(f"fetch-{fetcher.name}-{day:%Y-%m-%d}", mode).start()
+    try:
+        print(fetcher.fetch_data())
+    finally:
+        profiler.stop()
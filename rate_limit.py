@@ -0,0 +1,260 @@
+"""
+Per-host request budgets shared by all data fetchers.
+
+Every upstream host gets a token bucket, which limits the request rate, and an adaptive
+concurrency limit. The concurrency limit follows AIMD: it grows by one request per window of
+fast successful responses and is halved when the host answers slowly, throttles (429) or
+fails (5xx, connection errors), at most once per window: requests that were already in
+flight when the limit was cut do not cut it again. During backfills this keeps the fetchers at the highest
+throughput TGE and PSE tolerate without getting blocked.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from metrics import METRICS
+
+# Budgets of the known hosts; other hosts use DEFAULT_LIMITS.
+DEFAULT_LIMITS = {'rate': 2.0, 'burst': 4, 'initial_concurrency': 2, 'max_concurrency': 8,
+                  'target_latency': 5.0}
+HOST_LIMITS = {
+    'www.tge.pl': {'rate': 4.0, 'burst': 8, 'initial_concurrency': 4, 'max_concurrency': 12},
+    'www.pse.pl': {'rate': 2.0, 'burst': 4, 'initial_concurrency': 2, 'max_concurrency': 6},
+}
+
+
+class TokenBucket:
+    """
+    Token bucket limiting the request rate.
+
+    Args:
+        rate (float): Tokens added per second.
+        burst (int): Maximum number of tokens.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """
+        Take one token, sleeping until one is available.
+        """
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def try_acquire(self) -> float:
+        """
+        Take one token without waiting.
+
+        Returns:
+            float: 0 if a token was taken, otherwise the seconds until one is available.
+        """
+        with self.lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+
+class AdaptiveConcurrency:
+    """
+    Concurrency limit adjusted with additive increase / multiplicative decrease.
+
+    Args:
+        initial (int): Starting limit.
+        maximum (int): Upper bound of the limit.
+        target_latency (float): Responses slower than this (seconds) count as congestion.
+    """
+
+    def __init__(self, initial: int, maximum: int, target_latency: float):
+        self.limit = float(initial)
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.in_flight = 0
+        self.queued = 0
+        self.requests = 0
+        self.errors = 0
+        # Incremented by every decrease; a request only counts as congestion for the window
+        # it was started in
+        self.window = 0
+        self.condition = threading.Condition()
+
+    def acquire(self) -> int:
+        """
+        Wait for a free slot.
+
+        Returns:
+            int: The window the request starts in, to be passed to release().
+        """
+        with self.condition:
+            self.queued += 1
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.queued -= 1
+            self.in_flight += 1
+            return self.window
+
+    def release(self, latency: float, congested: bool, window: int = None):
+        """
+        Free a slot and adapt the limit to the outcome of the request.
+
+        Args:
+            latency (float): Duration of the request in seconds.
+            congested (bool): True if the host throttled or failed the request.
+            window (int): Value returned by acquire(); slow or failed requests started
+                before the last decrease leave the limit alone.
+        """
+        with self.condition:
+            self.in_flight -= 1
+            self.requests += 1
+            self.errors += congested
+            if congested or latency > self.target_latency:
+                if window is None or window == self.window:
+                    self.limit = max(1.0, self.limit / 2)
+                    self.window += 1
+            else:
+                self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+
+class HostLimiter:
+    """
+    Token bucket and adaptive concurrency limit of one host.
+
+    Args:
+        host (str): Host name.
+        rate (float): Requests per second.
+        burst (int): Maximum burst of requests.
+        initial_concurrency (int): Starting number of concurrent requests.
+        max_concurrency (int): Upper bound of concurrent requests.
+        target_latency (float): Latency (seconds) above which the concurrency is reduced.
+    """
+
+    def __init__(self, host: str, rate: float, burst: int, initial_concurrency: int,
+                 max_concurrency: int, target_latency: float):
+        self.host = host
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = AdaptiveConcurrency(initial_concurrency, max_concurrency,
+                                               target_latency)
+
+    @contextmanager
+    def slot(self):
+        """
+        Wait for a concurrency slot and a token, then time the request made in the block.
+
+        The block may call `outcome(status_code)` on the yielded object; an exception raised
+        in the block counts as a failure.
+        """
+        outcome = RequestOutcome()
+        window = self.concurrency.acquire()
+        self.bucket.acquire()
+        started = time.monotonic()
+        try:
+            yield outcome
+        except Exception:
+            outcome.failed = True
+            raise
+        finally:
+            self.concurrency.release(time.monotonic() - started, outcome.failed, window)
+
+    def report(self) -> dict:
+        with self.concurrency.condition:
+            return {
+                'rate': self.bucket.rate,
+                'burst': self.bucket.burst,
+                'concurrency_limit': int(self.concurrency.limit),
+                'in_flight': self.concurrency.in_flight,
+                'queued': self.concurrency.queued,
+                'requests': self.concurrency.requests,
+                'errors': self.concurrency.errors,
+            }
+
+
+class RequestOutcome:
+    """
+    Outcome of a request made inside HostLimiter.slot().
+    """
+
+    def __init__(self):
+        self.failed = False
+
+    def __call__(self, status_code: int):
+        self.failed = status_code == 429 or status_code >= 500
+
+
+class RateLimiterRegistry:
+    """
+    Registry of the limiters of all hosts.
+    """
+
+    def __init__(self, limits: dict = None):
+        self.limits = HOST_LIMITS if limits is None else limits
+        self.limiters = {}
+        self.lock = threading.Lock()
+
+    def for_url(self, url: str) -> HostLimiter:
+        """
+        Return the limiter of the host of the URL, creating it on first use.
+
+        Args:
+            url (str): URL of the request.
+
+        Returns:
+            HostLimiter: The limiter of the host.
+        """
+        host = urlsplit(url).netloc
+        with self.lock:
+            if host not in self.limiters:
+                self.limiters[host] = HostLimiter(host, **{**DEFAULT_LIMITS,
+                                                           **self.limits.get(host, {})})
+            return self.limiters[host]
+
+    def report(self) -> dict:
+        """
+        Current limits and queue depth of every host.
+
+        Returns:
+            dict: Host -> limits and counters.
+        """
+        with self.lock:
+            limiters = list(self.limiters.values())
+        return {limiter.host: limiter.report() for limiter in limiters}
+
+
+LIMITERS = RateLimiterRegistry()
+
+
+def _gauge(field: str):
+    return lambda: {(host,): report[field] for host, report in LIMITERS.report().items()}
+
+
+# Current limits and queue depth of every host, on /metrics and in the ingest summaries
+LIMITER_RATE = METRICS.gauge(
+    'energy_limiter_rate', "Requests per second allowed by the token bucket of the host.",
+    ('host',), _gauge('rate'))
+LIMITER_CONCURRENCY = METRICS.gauge(
+    'energy_limiter_concurrency_limit', "Current adaptive concurrency limit of the host.",
+    ('host',), _gauge('concurrency_limit'))
+LIMITER_IN_FLIGHT = METRICS.gauge(
+    'energy_limiter_in_flight', "Requests to the host in progress.", ('host',),
+    _gauge('in_flight'))
+LIMITER_QUEUED = METRICS.gauge(
+    'energy_limiter_queued', "Requests waiting for a concurrency slot of the host.", ('host',),
+    _gauge('queued'))
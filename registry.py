@@ -0,0 +1,147 @@
+"""
+Registry of the data sources and their fetchers.
+
+Fetchers are registered as "module:Class" paths and imported on first use, so processes
+that never fetch, like the API, do not load pandas, requests or BeautifulSoup. Other
+packages can add sources through the "energygrid.fetchers" entry point group, named by the
+source number:
+
+    [project.entry-points."energygrid.fetchers"]
+    5 = "my_package.fetchers:MyFetcher"
+"""
+import importlib
+import threading
+from datetime import datetime
+
+ENTRY_POINT_GROUP = 'energygrid.fetchers'
+
+
+class ServicesEnergy:
+    DAY_AHEAD = 0
+    INTRA_DAY = 1
+    PSE_5_YEARS_PLAN = 2
+    PSE_BALANCING_MARKET = 3
+    PSE_CURRENT_DAILY_COORDINATION_PLAN = 4
+
+
+# Fetcher of every built-in source
+DEFAULT_FETCHERS = {
+    ServicesEnergy.DAY_AHEAD: 'fetcher:DayAheadDataFetcher',
+    ServicesEnergy.INTRA_DAY: 'fetcher:IntraDayMarketFetcher',
+    ServicesEnergy.PSE_5_YEARS_PLAN: 'fetcher:PSE5YearsPlanDataFetcher',
+    ServicesEnergy.PSE_BALANCING_MARKET: 'fetcher:PSEBalancingMarketFetcher',
+    ServicesEnergy.PSE_CURRENT_DAILY_COORDINATION_PLAN: 'fetcher:PSECurrentDailyCoordinationPlanFetcher',
+}
+
+
+def _entry_points() -> list:
+    from importlib.metadata import entry_points
+    points = entry_points()
+    # Python 3.9 returns a dict of group -> entry points
+    if hasattr(points, 'select'):
+        return list(points.select(group=ENTRY_POINT_GROUP))
+    return list(points.get(ENTRY_POINT_GROUP, []))
+
+
+class SourceRegistry:
+    """
+    Source number -> fetcher class, imported lazily.
+
+    Args:
+        targets (dict): Source number -> "module:Class" path or class.
+    """
+
+    def __init__(self, targets: dict = None):
+        self.targets = dict(targets or {})
+        self.classes = {}
+        self.entry_points_loaded = False
+        self.lock = threading.Lock()
+
+    def register(self, source: int, target):
+        """
+        Register the fetcher of a source, replacing the previous one.
+
+        Args:
+            source (int): Source number.
+            target (str | type): "module:Class" path or the fetcher class.
+        """
+        with self.lock:
+            self.targets[source] = target
+            self.classes.pop(source, None)
+
+    def _load_entry_points(self):
+        if self.entry_points_loaded:
+            return
+        self.entry_points_loaded = True
+        for point in _entry_points():
+            try:
+                self.targets.setdefault(int(point.name), point.value)
+            except ValueError:
+                print(f"Ignoring fetcher entry point {point.name}: not a source number")
+
+    def sources(self) -> list:
+        """
+        Returns:
+            list: Numbers of all registered sources.
+        """
+        with self.lock:
+            self._load_entry_points()
+            return sorted(self.targets)
+
+    def load(self, source: int) -> type:
+        """
+        Import the fetcher class of a source.
+
+        Args:
+            source (int): Source number.
+
+        Returns:
+            type: The DataFetcher subclass.
+
+        Raises:
+            ValueError: If no fetcher is registered for the source.
+        """
+        with self.lock:
+            if source in self.classes:
+                return self.classes[source]
+            if source not in self.targets:
+                self._load_entry_points()
+            target = self.targets.get(source)
+            if target is None:
+                raise ValueError("Invalid source specified")
+            if isinstance(target, str):
+                module_name, _, class_name = target.partition(':')
+                target = getattr(importlib.import_module(module_name), class_name)
+            self.classes[source] = target
+            return target
+
+
+FETCHERS = SourceRegistry(DEFAULT_FETCHERS)
+
+
+class DataFetcherFactory:
+    """
+    Factory for creating data fetchers for different sources and dates.
+
+    Args:
+        registry (SourceRegistry): Registry of the fetchers, FETCHERS by default.
+    """
+
+    def __init__(self, registry: SourceRegistry = None):
+        self.registry = registry or FETCHERS
+
+    def create_data_fetcher(self, source: int, factory_date: datetime):
+        """
+        Create a data fetcher for the specified source and date.
+
+        Args:
+            source (int): One of the ServicesEnergy constants or a registered source number.
+            factory_date (datetime): The date for data fetching.
+
+        Returns:
+            DataFetcher: An instance of the appropriate data fetcher class.
+
+        Raises:
+            ValueError: If an invalid source is specified.
+        """
+        return self.registry.load(source)(factory_date)
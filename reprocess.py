@@ -0,0 +1,216 @@
+"""
+Rebuild the database from the raw document archive, parsing on all cores.
+
+Parsing is CPU-bound (BeautifulSoup for the TGE pages, read_csv and the column clean-up for
+the PSE exports), so every (source, day) of the archive is parsed in a process pool. Workers
+read the documents from the archive themselves and stream the typed rows through a bounded
+queue to a single writer process, which owns the only SQLite connection and commits in
+large transactions.
+
+Usage:
+    python reprocess.py [--database energy.db] [--archive raw] [--sources 0,1]
+                        [--start 2023-01-01] [--end 2023-12-31] [--workers 8]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import queue as queues
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from analytics import RollingAnalytics
+from archive import PayloadArchive
+from database import Database
+from registry import FETCHERS, DataFetcherFactory, ServicesEnergy
+from resilience import FetchError
+from save import SOURCES, frame_rows, upsert_query
+from setup_sqlite import migrate_command, setup_command
+from tick_store import TickStore, trades_to_records
+
+# Batches written per transaction by the writer
+COMMIT_EVERY = 100
+# Seconds a worker waits for room in the queue before giving up on the writer
+WRITER_TIMEOUT = 600
+
+# Set in every worker process by _init_worker
+_batches = None
+_archive = None
+
+
+def _init_worker(batches, archive_root: str):
+    global _batches, _archive
+    _batches = batches
+    _archive = PayloadArchive(archive_root)
+
+
+def parse_job(source: int, day: datetime) -> tuple:
+    """
+    Parse one archived (source, day) and send its rows to the writer.
+
+    Runs in a worker process.
+
+    Args:
+        source (int): One of the ServicesEnergy constants.
+        day (datetime): Day to parse.
+
+    Returns:
+        tuple: (source, day, number of rows, error message or None).
+    """
+    fetcher = DataFetcherFactory().create_data_fetcher(source, day)
+    try:
+        data = fetcher.parse_payload(_archive.load(fetcher.name, day))
+    except FetchError as e:
+        return source, day, 0, str(e)
+    table, columns = SOURCES[source]
+    try:
+        trades = {}
+        if source == ServicesEnergy.INTRA_DAY:
+            trades = {hour: trades_to_records(hour_trades)
+                      for hour, hour_trades in data.attrs.get('trades', {}).items()}
+        rows = frame_rows(columns, data)
+    except (KeyError, TypeError, ValueError) as e:
+        return source, day, 0, f"Cannot convert the parsed data: {e!r}"
+    try:
+        _batches.put((table, data.index[0].strftime('%Y-%m-%d'), rows, trades),
+                     timeout=WRITER_TIMEOUT)
+    except queues.Full:
+        return source, day, 0, "the writer did not accept the rows"
+    return source, day, len(rows), None
+
+
+def write_batches(batches, database_name: str, tick_dir: str, done):
+    """
+    Save the batches sent by the workers until a None batch arrives.
+
+    Runs in the writer process.
+
+    Args:
+        batches (multiprocessing.Queue): Batches of (table, date_value, rows, trades).
+        database_name (str): Path to the SQLite database.
+        tick_dir (str): Directory of the tick store, None to skip the intraday trades.
+        done (multiprocessing.Queue): Receives the number of written rows at the end.
+    """
+    db = Database(database_name)
+    ticks = TickStore(tick_dir) if tick_dir else None
+    queries = {table: upsert_query(table, columns) for table, columns in SOURCES.values()}
+    written = pending = 0
+    while True:
+        batch = batches.get()
+        if batch is None:
+            break
+        table, date_value, rows, trades = batch
+        db.cursor.execute("INSERT OR IGNORE INTO date (date_value) VALUES (?)", (date_value,))
+        db.cursor.execute("SELECT date_id FROM date WHERE date_value = ?", (date_value,))
+        date_id = db.cursor.fetchone()[0]
+        db.cursor.executemany(queries[table], [(date_id, *row) for row in rows])
+        if ticks is not None and trades:
+            ticks.append_day(datetime.strptime(date_value, '%Y-%m-%d'), trades)
+        written += len(rows)
+        pending += 1
+        if pending >= COMMIT_EVERY:
+            db.connection.commit()
+            pending = 0
+    db.connection.commit()
+    done.put(written)
+
+
+def archived_jobs(archive: PayloadArchive, sources: list = None, start: datetime = None,
+                  end: datetime = None) -> list:
+    """
+    List the archived (source, day) pairs to reprocess.
+
+    Returns:
+        list: Tuples of (source, day).
+    """
+    jobs = []
+    for source in sources or FETCHERS.sources():
+        name = FETCHERS.load(source).name
+        jobs.extend((source, day) for day in archive.days(name)
+                    if (start is None or day >= start) and (end is None or day <= end))
+    return jobs
+
+
+def reprocess(database_name: str, archive_root: str, sources: list = None,
+              start: datetime = None, end: datetime = None, workers: int = None,
+              tick_dir: str = None) -> dict:
+    """
+    Parse every archived (source, day) in a process pool and save it through one writer.
+
+    Args:
+        database_name (str): Path to the SQLite database, created if it does not exist.
+        archive_root (str): Directory of the raw document archive.
+        sources (list): Sources to reprocess, all registered sources by default.
+        start (datetime): First day to reprocess.
+        end (datetime): Last day to reprocess.
+        workers (int): Parsing processes, the number of CPUs by default.
+        tick_dir (str): Directory of the tick store, None to skip the intraday trades.
+
+    Returns:
+        dict: Report with the number of jobs, failures, written rows and the duration.
+
+    Raises:
+        RuntimeError: If the writer process died.
+    """
+    if not os.path.exists(database_name):
+        setup_command(database_name)
+    else:
+        migrate_command(database_name)
+    jobs = archived_jobs(PayloadArchive(archive_root), sources, start, end)
+    workers = workers or os.cpu_count()
+    batches = multiprocessing.Queue(maxsize=workers * 8)
+    done = multiprocessing.Queue()
+    writer = multiprocessing.Process(target=write_batches, name='reprocess-writer',
+                                     args=(batches, database_name, tick_dir, done))
+    writer.start()
+    started = time.perf_counter()
+    failed = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(batches, archive_root)) as pool:
+            futures = [pool.submit(parse_job, source, day) for source, day in jobs]
+            for future in as_completed(futures):
+                source, day, rows, error = future.result()
+                if error is not None:
+                    failed.append({'source': source, 'day': day.strftime('%Y-%m-%d'),
+                                   'error': error})
+                    print(f"{FETCHERS.load(source).name} {day:%Y-%m-%d}: {error}")
+                if not writer.is_alive():
+                    pool.shutdown(cancel_futures=True)
+                    raise RuntimeError(f"The writer exited with code {writer.exitcode}")
+    finally:
+        if writer.is_alive():
+            batches.put(None)
+        writer.join()
+    if writer.exitcode != 0:
+        raise RuntimeError(f"The writer exited with code {writer.exitcode}")
+    return {'jobs': len(jobs), 'failed': failed, 'rows': done.get(),
+            'workers': workers, 'seconds': round(time.perf_counter() - started, 3)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the database from the raw archive")
+    parser.add_argument('--database', default='energy.db')
+    parser.add_argument('--archive', default=os.environ.get('RAW_ARCHIVE_DIR', 'raw'))
+    parser.add_argument('--sources', help="comma separated source numbers")
+    parser.add_argument('--start', type=lambda value: datetime.strptime(value, '%Y-%m-%d'))
+    parser.add_argument('--end', type=lambda value: datetime.strptime(value, '%Y-%m-%d'))
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--ticks', default=os.environ.get('TICK_STORE_DIR', 'ticks'))
+    options = parser.parse_args()
+    report = reprocess(options.database, options.archive,
+                       [int(source) for source in options.sources.split(',')]
+                       if options.sources else None,
+                       options.start, options.end, options.workers, options.ticks)
+    print(json.dumps(report, indent=2))
+    db = Database(options.database)
+    RollingAnalytics(db.connection).rebuild()
+    print("Analytics rebuilt.")
+    if os.environ.get('HOT_STORE_DIR'):
+        from hot_store import HotStoreWriter
+        HotStoreWriter(options.database, os.environ['HOT_STORE_DIR']).build()
+        print("Hot store rebuilt.")
+    if os.environ.get('SNAPSHOT_DIR'):
+        from snapshot import publish
+        print(f"Snapshot {publish(options.database, os.environ['SNAPSHOT_DIR'])} published.")
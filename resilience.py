@@ -0,0 +1,271 @@
+"""
+Timeouts, retries and circuit breakers for upstream requests.
+
+Every data fetcher has a ResiliencePolicy. Requests get connect and read timeouts, transient
+failures (timeouts, connection errors, 429 and 5xx responses) are retried with jittered
+exponential backoff, and a circuit breaker per host fails fast while the host keeps failing.
+Fetchers raise FetchError, which tells the caller whether the (source, day) is worth
+retrying later.
+"""
+import threading
+import time
+from urllib.parse import urlsplit
+
+from requests import ConnectionError as RequestsConnectionError, Timeout
+from tenacity import Retrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+
+class TransientHTTPError(Exception):
+    """
+    Response with a status code that is worth retrying (429 or 5xx).
+    """
+
+    def __init__(self, status_code: int, url: str):
+        super().__init__(f"HTTP {status_code} from {url}")
+        self.status_code = status_code
+
+
+class CircuitOpenError(Exception):
+    """
+    Request refused because the circuit breaker of the host is open.
+    """
+
+    def __init__(self, host: str, retry_after: float):
+        super().__init__(f"Circuit breaker for {host} is open, retry in {retry_after:.0f}s")
+        self.host = host
+        self.retry_after = retry_after
+
+
+class FetchError(ValueError):
+    """
+    Failure of a fetcher for one (source, day).
+
+    Args:
+        message (str): Description of the failure.
+        source (int): One of the ServicesEnergy constants.
+        day (datetime): Day that was fetched.
+        transient (bool): True if fetching the same day again later may succeed.
+        retry_after (float): Seconds to wait before retrying, if known.
+    """
+
+    def __init__(self, message: str, source: int = None, day=None, transient: bool = False,
+                 retry_after: float = None):
+        super().__init__(message)
+        self.source = source
+        self.day = day
+        self.transient = transient
+        self.retry_after = retry_after
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Whether a request should be retried immediately (with backoff).
+    """
+    return isinstance(error, (Timeout, RequestsConnectionError, TransientHTTPError))
+
+
+def is_transient(error: BaseException) -> bool:
+    """
+    Whether the same request may succeed later, including when the circuit is open.
+    """
+    return is_retryable(error) or isinstance(error, CircuitOpenError)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of one host.
+
+    After `failure_threshold` consecutive transient failures the circuit opens and requests
+    fail immediately for `reset_timeout` seconds. Then a single trial request is let through
+    (half-open); its success closes the circuit and its failure opens it again.
+
+    Args:
+        host (str): Host name.
+        failure_threshold (int): Consecutive failures that open the circuit.
+        reset_timeout (float): Seconds the circuit stays open.
+    """
+
+    def __init__(self, host: str, failure_threshold: int = 5, reset_timeout: float = 60):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return 'open'
+        return 'half-open'
+
+    def before_call(self):
+        """
+        Raises:
+            CircuitOpenError: If the circuit is open or a half-open trial is running.
+        """
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return
+            if state == 'half-open' and not self.trial_running:
+                self.trial_running = True
+                return
+            retry_after = max(self.reset_timeout - (time.monotonic() - self.opened_at), 0)
+            raise CircuitOpenError(self.host, retry_after)
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def release_trial(self):
+        with self.lock:
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+
+
+class CircuitBreakerRegistry:
+    """
+    Registry of the circuit breakers of all hosts.
+    """
+
+    def __init__(self):
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def for_url(self, url: str, failure_threshold: int, reset_timeout: float) -> CircuitBreaker:
+        host = urlsplit(url).netloc
+        with self.lock:
+            if host not in self.breakers:
+                self.breakers[host] = CircuitBreaker(host, failure_threshold, reset_timeout)
+            return self.breakers[host]
+
+    def report(self) -> dict:
+        with self.lock:
+            return {host: {'state': breaker.state, 'failures': breaker.failures}
+                    for host, breaker in self.breakers.items()}
+
+
+BREAKERS = CircuitBreakerRegistry()
+
+
+class ResiliencePolicy:
+    """
+    Timeouts, retries and circuit breaker settings of a source.
+
+    Args:
+        connect_timeout (float): Seconds to wait for the connection.
+        read_timeout (float): Seconds to wait between bytes of the response.
+        attempts (int): Maximum number of attempts of a request.
+        backoff (float): Base of the jittered exponential backoff in seconds.
+        max_backoff (float): Upper bound of a single backoff.
+        failure_threshold (int): Consecutive failures that open the circuit of the host.
+        reset_timeout (float): Seconds the circuit stays open.
+    """
+
+    def __init__(self, connect_timeout: float = 5, read_timeout: float = 30, attempts: int = 4,
+                 backoff: float = 1, max_backoff: float = 30, failure_threshold: int = 5,
+                 reset_timeout: float = 60):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+    @property
+    def timeout(self) -> tuple:
+        return self.connect_timeout, self.read_timeout
+
+    def call(self, url: str, send):
+        """
+        Call `send()` for the URL with retries and the circuit breaker of its host.
+
+        Args:
+            url (str): URL of the request, used to select the circuit breaker.
+            send (callable): Function sending the request and returning the response.
+
+        Returns:
+            requests.Response: The first response that is not transient.
+
+        Raises:
+            CircuitOpenError: If the circuit of the host is open.
+            TransientHTTPError, requests.Timeout, requests.ConnectionError: If all attempts
+                failed.
+        """
+        breaker = BREAKERS.for_url(url, self.failure_threshold, self.reset_timeout)
+
+        def attempt():
+            breaker.before_call()
+            try:
+                response = send()
+                if response.status_code == 429 or response.status_code >= 500:
+                    raise TransientHTTPError(response.status_code, url)
+            except Exception as e:
+                if is_retryable(e):
+                    breaker.record_failure()
+                else:
+                    breaker.release_trial()
+                raise
+            breaker.record_success()
+            return response
+
+        retrying = Retrying(stop=stop_after_attempt(self.attempts),
+                            wait=wait_random_exponential(multiplier=self.backoff,
+                                                         max=self.max_backoff),
+                            retry=retry_if_exception(is_retryable), reraise=True)
+        return retrying(attempt)
+
+
+class FetchResult:
+    """
+    Outcome of fetching one (source, day), used by the orchestrators to plan retries.
+
+    Args:
+        source (int): One of the ServicesEnergy constants.
+        day (datetime): Day that was fetched.
+        data (pd.DataFrame): The fetched data, None on failure.
+        error (Exception): The failure, None on success.
+    """
+
+    def __init__(self, source: int, day, data=None, error: Exception = None):
+        self.source = source
+        self.day = day
+        self.data = data
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    @property
+    def retry_later(self) -> bool:
+        """
+        True if the failure is transient and the (source, day) should be fetched again later.
+        """
+        if self.error is None:
+            return False
+        if isinstance(self.error, FetchError):
+            return self.error.transient
+        return is_transient(self.error)
+
+    @property
+    def retry_after(self):
+        return getattr(self.error, 'retry_after', None)
+
+    def to_dict(self) -> dict:
+        return {'source': self.source, 'day': self.day.strftime('%Y-%m-%d'), 'ok': self.ok,
+                'error': None if self.error is None else str(self.error),
+                'retry_later': self.retry_later, 'retry_after': self.retry_after}
@@ -1,314 +1,323 @@
-from datetime import datetime, timedelta
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+import json
+import os
 import sqlite3
+import sys
+import time
 
-import numpy as np
 import pandas as pd
 
+from analytics import ensure_schema, refresh_saved
 from database import Database
-from fetcher import DataFetcherFactory, ServicesEnergy
-
-
-def fetch_data(date: datetime, name: str) -> DataFetcherFactory:
+from metrics import INGEST_BATCH_SECONDS, INGEST_ROWS, METRICS
+from profiling import start_session
+from registry import DataFetcherFactory, ServicesEnergy
+from resilience import FetchError, FetchResult
+from setup_sqlite import migrate_command
+from timemodel import utc_timestamp
+
+# Mapping of the columns returned by each fetcher to the columns of its table
+DAY_AHEAD_COLUMNS = {
+    'hour': 'hour_of_day',
+    'price': 'price',
+}
+
+INTRA_DAY_COLUMNS = {
+    'hour': 'hour_of_day',
+    'cenaIntraAvg': 'intraday_avg_price',
+    'cenaIntraMin': 'intraday_min_price',
+    'cenaIntraMax': 'intraday_max_price',
+}
+
+PSE_5_YEARS_PLAN_COLUMNS = {
+    'Godzina': 'hour_of_day',
+    'Prognozowane zapotrzebowanie sieci': 'GridDemandForecast',
+    'Wymagana rezerwa mocy OSP': 'RequiredPowerReserve',
+    'Nadwyฟka mocy dost๊pna dla OSP (8) + (10) - [(3)-(13)]-(14)': 'SurplusCapacityAvailableForTSO',
+    'Nadwyฟka mocy dost๊pna dla OSP ponad wymaganน rezerw๊ moc (5) - (4)': 'GenerationCapacitySurplusForTSO',
+    'Moc dyspozycyjna JW i magazyn๓w energii wiadczนcych usณugi bilansujนce w ramach RB': 'AvailableCapacityBalancingMarketUnits',
+    'Moc dyspozycyjna JW i magazyn๓w energii wiadczนcych usณugi bilansujนce w ramach RB dost๊pna dla OSP': 'AvailableForTSOCapacityBalancingMarketUnits',
+    'Przewidywana generacja JW i magazyn๓w energii wiadczนcych usณugi bilansujนce w ramach RB (3) - (10) - (13)': 'PredictedGenerationBalancingMarket',
+    'Prognozowana generacja JW i magazyn๓w energii nie wiadczนcych usณug bilansujนcych w ramach RB': 'ForecastedGenerationNonBalancingMarket',
+    'Prognozowana sumaryczna generacja r๓deณ wiatrowych': 'WindTotalGenerationForecast',
+    'Prognozowana sumaryczna generacja r๓deณ fotowoltaicznych': 'PhotovoltaicTotalGenerationForecast',
+    'Planowane saldo wymiany mi๊dzysystemowej': 'PlannedCrossBorderElectricityExchange',
+    'Prognozowana wielkoๆ niedyspozycyjnoci wynikajนca z ogranicze๑ sieciowych wyst๊pujนcych w sieci przesyณowej oraz sieci dystrybucyjnej w zakresie dostarczania energii elektrycznej': 'ForecastedUnavailabilityTransmissionAndDistribution',
+    'Prognozowana wielkoๆ niedyspozycyjnoci wynikajนcych z warunk๓w eksploatacyjnych JW wiadczนcych usณugi bilansujนce w ramach RB': 'GenerationCapacityUnavailabilityThermalUnitsBalancingMarket',
+    'Przewidywana generacja zasob๓w wytw๓rczych nieobj๊tych obowiนzkami mocowymi': 'PredictedGenerationNonCoveredByCapacityMarketObligation',
+    'Obowiนzki mocowe wszystkich jednostek rynku mocy': 'CapacityMarketObligationAllUnits',
+}
+
+PSE_BALANCING_MARKET_COLUMNS = {
+    'Godzina': 'hour_of_day',
+    'CRO': 'CRO',
+    'CROs': 'CROs',
+    'CROz': 'CROz',
+    'Stan zakontraktowania': 'AggregatedMarketParticipantsContractingStatus',
+    'Niezbilansowanie': 'Imbalance',
+}
+
+PSE_CURRENT_DAILY_COORDINATION_PLAN_COLUMNS = {
+    'Godzina': 'hour_of_day',
+    'Krajowe zapotrzebowanie na moc': 'NationalPowerDemand',
+    'Suma zdolnoci wytw๓rczych jednostek wytw๓rczych w KSE': 'TotalProductionCapacity_KSE',
+    'Suma zdolnoci wytw๓rczych JGWa': 'TotalProductionCapacity_JGWa',
+    'Suma zdolnoci wytw๓rczych JGFWa': 'TotalProductionCapacity_JGFWa',
+    'Suma zdolnoci wytw๓rczych JGMa': 'TotalProductionCapacity_JGMa',
+    'Suma zdolnoci wytw๓rczych JGPVa': 'TotalProductionCapacity_JGPVa',
+    'Sumaryczna generacja JG aktywnych: JGWa, JGFWa, JGMa i JGPVa': 'TotalGeneration_ActiveJG',
+    'Sumaryczna generacja JGWa': 'TotalGeneration_JGWa',
+    'Sumaryczna generacja JGFWa': 'TotalGeneration_JGFWa',
+    'Sumaryczna generacja JGMa': 'TotalGeneration_JGMa',
+    'Sumaryczna generacja JGPVa': 'TotalGeneration_JGPVa',
+    'Sumaryczna generacja jednostek wytw๓rczych nieuczestniczนcych aktywnie w Rynku Bilansujนcym': 'TotalGeneration_NonParticipatingUnits',
+    'Generacja r๓deณ wiatrowych': 'WindPowerGeneration',
+    'Generacja r๓deณ fotowoltaicznych': 'PVPowerGeneration',
+    'Sumaryczna moc ณadowania JGMa': 'TotalChargingCapacity_JGMa',
+    'Krajowe saldo wymiany mi๊dzysystemowej r๓wnolegณej': 'NationalParallelExchangeBalance',
+    'Krajowe saldo wymiany mi๊dzysystemowej nier๓wnolegณej': 'NationalNonParallelExchangeBalance',
+    'Rezerwa mocy ponad zapotrzebowanie': 'ExcessCapacityAboveDemand',
+    'Rezerwa mocy poniฟej zapotrzebowania': 'ExcessCapacityBelowDemand',
+    'Suma mocy z wykorzystanych Ofert Redukcji Obciนฟenia JGOa': 'TotalCapacityFromUtilizedLoadReductionOffers_JGOa',
+}
+
+# Table and column mapping of each source
+SOURCES = {
+    ServicesEnergy.DAY_AHEAD: ('day_ahead', DAY_AHEAD_COLUMNS),
+    ServicesEnergy.INTRA_DAY: ('intra_day', INTRA_DAY_COLUMNS),
+    ServicesEnergy.PSE_5_YEARS_PLAN: ('five_years_plan', PSE_5_YEARS_PLAN_COLUMNS),
+    ServicesEnergy.PSE_BALANCING_MARKET: ('balancing_market', PSE_BALANCING_MARKET_COLUMNS),
+    ServicesEnergy.PSE_CURRENT_DAILY_COORDINATION_PLAN: (
+        'current_daily_plan', PSE_CURRENT_DAILY_COORDINATION_PLAN_COLUMNS),
+}
+
+
+def fetch_result(date: datetime, source: int) -> FetchResult:
     """
-    Fetches data using a DataFetcherFactory based on the specified date and name.
+    Fetches one (source, day) and reports the outcome instead of raising.
 
     Args:
         date (datetime): The date for which to fetch the data.
-        name (str): The name of the data source.
+        source (int): One of the ServicesEnergy constants.
 
     Returns:
-        pd.DataFrame: A DataFrame containing data from the specified source and date.
-
-    Raises:
-        ValueError: If there is an error creating the data fetcher.
+        FetchResult: The data, or the failure and whether to retry the day later.
     """
     try:
-        data_fetcher_factory = DataFetcherFactory()
-        fetcher = data_fetcher_factory.create_data_fetcher(name, date)
-        return fetcher.fetch_data()
-    except ValueError as ve:
-        # Handle other ValueErrors
-        print(f"Error: {ve}")
+        fetcher = DataFetcherFactory().create_data_fetcher(source, date)
+        data = fetcher.fetch_data()
+        if data is None or data.empty:
+            raise FetchError("No data returned", source=source, day=date, transient=True)
+        return FetchResult(source, date, data)
+    except Exception as e:
+        return FetchResult(source, date, error=e)
 
 
-def insert_date(db: Database, data: pd.DataFrame):
+def upsert_query(table: str, columns: dict) -> str:
     """
-   Inserts date information into the database.
+    Builds the statement inserting a row, or updating the row of the same date and hour.
 
-   Args:
-       db (Database): The database instance.
-       data (pd.DataFrame): The DataFrame containing date information.
+    Args:
+        table (str): Name of the table.
+        columns (dict): Mapping of DataFrame columns to table columns, including hour_of_day.
 
-   Prints:
-       Status messages regarding the success or failure of the operation.
-   """
-    query = insert_date_query = f"INSERT INTO date (date_value) " \
-                                f"VALUES ('{data.index[0].strftime('%Y-%m-%d')}')"
+    Returns:
+        str: The statement, with date_id followed by the table columns and utc_timestamp as
+        parameters.
+    """
+    table_columns = list(columns.values()) + ['utc_timestamp']
+    placeholders = ", ".join("?" * (len(table_columns) + 1))
+    updates = ", ".join(f"{column} = excluded.{column}" for column in table_columns
+                        if column != 'hour_of_day')
+    return f"INSERT INTO {table} (date_id, {', '.join(table_columns)}) " \
+           f"VALUES ({placeholders}) " \
+           f"ON CONFLICT (date_id, hour_of_day) DO UPDATE SET {updates}"
 
-    try:
-        db.insert_data(query)
-        print(f"Date {data.index[0].strftime('%Y-%m-%d')} save correctly")
-    except sqlite3.IntegrityError:
-        print(f"Date: {data.index[0].strftime('%Y-%m-%d')} already exist in Date table")
 
+def frame_rows(columns: dict, data: pd.DataFrame) -> list:
+    """
+    Converts a fetched DataFrame to the parameter rows of upsert_query, without the date_id.
 
-def insert_day_ahead(db: Database, data: pd.DataFrame):
+    Args:
+        columns (dict): Mapping of DataFrame columns to table columns, including hour_of_day.
+        data (pd.DataFrame): The DataFrame returned by a fetcher.
+
+    Returns:
+        list: One tuple per hour, with None for missing values, ending with the UTC start of
+        the hour.
+    """
+    values = []
+    # Column by column, so numpy and Arrow-backed columns are copied to Python objects once
+    # and no intermediate DataFrame of the whole day is built
+    for name in columns:
+        column = data[name].to_numpy(dtype=object, na_value=None)
+        if data[name].dtype.kind not in 'biuf':
+            column[column == '-'] = None
+        values.append(column.tolist())
+    day = data.index[0]
+    hours = values[list(columns.values()).index('hour_of_day')]
+    values.append([utc_timestamp(day, hour) for hour in hours])
+    return list(zip(*values))
+
+
+def insert_rows(db: Database, table: str, columns: dict, data: pd.DataFrame) -> int:
     """
-    Inserts Day Ahead data into the database.
+    Inserts or updates the hourly rows of a DataFrame in one batch.
+
+    Rows that already exist for the same date and hour are updated in place, so fetching a
+    revised version of a day keeps the primary keys stable.
 
     Args:
         db (Database): The database instance.
-        data (pd.DataFrame): The DataFrame containing Day Ahead data.
+        table (str): Name of the table.
+        columns (dict): Mapping of DataFrame columns to table columns, including hour_of_day.
+        data (pd.DataFrame): The DataFrame indexed by date.
 
-    Prints:
-        Status messages regarding the success or failure of the operation.
+    Returns:
+        int: The number of saved rows.
+
+    Raises:
+        sqlite3.DatabaseError: If the rows cannot be saved.
     """
-    query = f"SELECT date_id " \
-            f"FROM date " \
-            f"WHERE date_value = '{df_da.index[0].strftime('%Y-%m-%d')}'"
-    date = db.select_data(query)
+    date_value = data.index[0].strftime('%Y-%m-%d')
+    date = db.select_data_by_date("SELECT date_id FROM date WHERE date_value = ?", date_value)
     date_id = date[0][0]
-    try:
-        for index, row in data.iterrows():
-            insert_query = f"INSERT INTO day_ahead (hour_of_day, date_id, price) " \
-                           f"VALUES ('{row['hour']}', {date_id}, {row['price']})"
-            db.insert_data(insert_query)
-        print("Data from Day Ahead saved correctly.")
-    except sqlite3.IntegrityError:
-        print(f"Date: {data.index[0].strftime('%Y-%m-%d')} already exist in Day Ahead table")
+    rows = [(date_id, *row) for row in frame_rows(columns, data)]
+    with INGEST_BATCH_SECONDS.time(table=table):
+        db.insert_many(upsert_query(table, columns), rows)
+    INGEST_ROWS.inc(len(rows), table=table)
+    return len(rows)
 
 
-def insert_intra(db: Database, data: pd.DataFrame):
+def ingest(db: Database, source: int, data: pd.DataFrame) -> int:
     """
-    Inserts Intra Day data into the database.
+    Saves the data fetched from a source together with its date.
+
+    The date, the rows and the rolling analytics computed from the table are saved in one
+    transaction, so a failure leaves no part of the day behind. Intraday trades kept by the
+    fetcher are appended to the tick store once the transaction is committed.
 
     Args:
         db (Database): The database instance.
-        data (pd.DataFrame): The DataFrame containing Intra Day data.
+        source (int): One of the ServicesEnergy constants.
+        data (pd.DataFrame): The DataFrame returned by the fetcher of the source.
 
-    Prints:
-        Status messages regarding the success or failure of the operation.
+    Returns:
+        int: The number of saved rows.
+
+    Raises:
+        sqlite3.DatabaseError: If the rows cannot be saved.
     """
-    query = f"SELECT date_id " \
-            f"FROM date " \
-            f"WHERE date_value = '{data.index[0].strftime('%Y-%m-%d')}'"
-    date = db.select_data(query)
-    date_id = date[0][0]
-    data.replace('-', "Null", inplace=True)
-    data.replace(np.nan, "Null", inplace=True)
-    try:
-        for index, row in data.iterrows():
-            insert_query = f"INSERT OR REPLACE INTO intra_day " \
-                           f"(hour_of_day, " \
-                           f"date_id, " \
-                           f"intraday_avg_price, " \
-                           f"intraday_min_price, " \
-                           f"intraday_max_price) " \
-                           f"VALUES ('{row['hour']}', " \
-                           f"{date_id}, " \
-                           f"{row['cenaIntraAvg']}, " \
-                           f"{row['cenaIntraMin']}, " \
-                           f"{row['cenaIntraMax']})"
-            DB.insert_data(insert_query)
-        print("Data from Intra Day saved correctly.")
-    except sqlite3.IntegrityError:
-        print(f"Date: {data.index[0].strftime('%Y-%m-%d')} already exist in Intra Day table")
-
-
-def insert_pse_5(db: Database, data: pd.DataFrame):
+    table, columns = SOURCES[source]
+    date_value = data.index[0].strftime('%Y-%m-%d')
+    with db.transaction():
+        ensure_schema(db.connection)
+        db.insert_data("INSERT OR IGNORE INTO date (date_value) VALUES (?)", (date_value,))
+        saved = insert_rows(db, table, columns, data)
+        refresh_saved(db.connection, table, date_value, commit=False)
+    if source == ServicesEnergy.INTRA_DAY and data.attrs.get('trades'):
+        from tick_store import TickStore
+        TickStore(os.environ.get('TICK_STORE_DIR', 'ticks')).append_day(
+            data.index[0].to_pydatetime(), data.attrs['trades'])
+    return saved
+
+
+def _timed_fetch(date: datetime, source: int) -> tuple:
+    started = time.perf_counter()
+    result = fetch_result(date, source)
+    return result, time.perf_counter() - started
+
+
+def run_daily(date: datetime, database_name: str = 'energy.db', sources: list = None) -> dict:
     """
-        Inserts PSE (Polish Power Exchange) five-years plan data into the database.
-
-        Args:
-            db (Database): The database instance.
-            data (pd.DataFrame): The DataFrame containing PSE five-years plan data.
-
-        Prints:
-            Status messages regarding the success or failure of the operation.
-        """
-    query = f"SELECT date_id " \
-            f"FROM date " \
-            f"WHERE date_value = '{data.index[0].strftime('%Y-%m-%d')}'"
-    date = db.select_data(query)
-    date_id = date[0][0]
-    data.replace('-', "Null", inplace=True)
-    data.replace(np.nan, "Null", inplace=True)
-    try:
-        for index, row in data.iterrows():
-            insert_query = f"INSERT INTO five_years_plan (hour_of_day, " \
-                           f"date_id, GridDemandForecast, " \
-                           f"RequiredPowerReserve, " \
-                           f"SurplusCapacityAvailableForTSO, " \
-                           f"GenerationCapacitySurplusForTSO, " \
-                           f"AvailableCapacityBalancingMarketUnits, " \
-                           f"AvailableForTSOCapacityBalancingMarketUnits, " \
-                           f"PredictedGenerationBalancingMarket, " \
-                           f"ForecastedGenerationNonBalancingMarket, " \
-                           f"WindTotalGenerationForecast, " \
-                           f"PhotovoltaicTotalGenerationForecast, " \
-                           f"PlannedCrossBorderElectricityExchange, " \
-                           f"ForecastedUnavailabilityTransmissionAndDistribution, " \
-                           f"GenerationCapacityUnavailabilityThermalUnitsBalancingMarket, " \
-                           f"PredictedGenerationNonCoveredByCapacityMarketObligation, " \
-                           f"CapacityMarketObligationAllUnits) " \
-                           f"VALUES ('{row['Godzina']}', " \
-                           f"{date_id}, " \
-                           f"{row['Prognozowane zapotrzebowanie sieci']}, " \
-                           f"{row['Wymagana rezerwa mocy OSP']}, " \
-                           f"{row['Nadwyฟka mocy dost๊pna dla OSP (8) + (10) - [(3)-(13)]-(14)']}, " \
-                           f"{row['Nadwyฟka mocy dost๊pna dla OSP ponad wymaganน rezerw๊ moc (5) - (4)']}, " \
-                           f"{row['Moc dyspozycyjna JW i magazyn๓w energii wiadczนcych usณugi bilansujนce w ramach RB']}, " \
-                           f"{row['Moc dyspozycyjna JW i magazyn๓w energii wiadczนcych usณugi bilansujนce w ramach RB dost๊pna dla OSP']}, " \
-                           f"{row['Przewidywana generacja JW i magazyn๓w energii wiadczนcych usณugi bilansujนce w ramach RB (3) - (10) - (13)']}, " \
-                           f"{row['Prognozowana generacja JW i magazyn๓w energii nie wiadczนcych usณug bilansujนcych w ramach RB']}, " \
-                           f"{row['Prognozowana sumaryczna generacja r๓deณ wiatrowych']}, " \
-                           f"{row['Prognozowana sumaryczna generacja r๓deณ fotowoltaicznych']}, " \
-                           f"{row['Planowane saldo wymiany mi๊dzysystemowej']}, " \
-                           f"{row['Prognozowana wielkoๆ niedyspozycyjnoci wynikajนca z ogranicze๑ sieciowych wyst๊pujนcych w sieci przesyณowej oraz sieci dystrybucyjnej w zakresie dostarczania energii elektrycznej']}, " \
-                           f"{row['Prognozowana wielkoๆ niedyspozycyjnoci wynikajนcych z warunk๓w eksploatacyjnych JW wiadczนcych usณugi bilansujนce w ramach RB']}, " \
-                           f"{row['Przewidywana generacja zasob๓w wytw๓rczych nieobj๊tych obowiนzkami mocowymi']}, " \
-                           f"{row['Obowiนzki mocowe wszystkich jednostek rynku mocy']})"
-            DB.insert_data(insert_query)
-        print("Data from PSE five-years plan saved correctly.")
-    except sqlite3.IntegrityError:
-        print(
-            f"Date: {data.index[0].strftime('%Y-%m-%d')} already exist in PSE five-years plan table")
-
-
-def insert_pse_bal(db: Database, data: pd.DataFrame):
-    query = f"SELECT date_id " \
-            f"FROM date " \
-            f"WHERE date_value = '{data.index[0].strftime('%Y-%m-%d')}'"
-    date = db.select_data(query)
-    date_id = date[0][0]
-    data.replace('-', "Null", inplace=True)
-    data.replace(np.nan, "Null", inplace=True)
-    try:
-        for index, row in data.iterrows():
-            insert_query = f"INSERT OR REPLACE INTO balancing_market (hour_of_day, " \
-                           f"date_id, " \
-                           f"CRO, " \
-                           f"CROs, " \
-                           f"CROz, " \
-                           f"AggregatedMarketParticipantsContractingStatus, " \
-                           f"Imbalance) " \
-                           f"VALUES ({row['Godzina']}, " \
-                           f"{date_id}, " \
-                           f"{row['CRO']}, " \
-                           f"{row['CROs']}, " \
-                           f"{row['CROz']}, " \
-                           f"{row['Stan zakontraktowania']}, " \
-                           f"{row['Niezbilansowanie']})"
-            DB.insert_data(insert_query)
-        print("Data from PSE Balancing Market saved correctly.")
-    except sqlite3.DatabaseError as e:
-        print(e)
-
-
-def insert_pse_current(db: Database, data: pd.DataFrame):
-    query = f"SELECT date_id " \
-            f"FROM date " \
-            f"WHERE date_value = '{data.index[0].strftime('%Y-%m-%d')}'"
-    date = db.select_data(query)
-    date_id = date[0][0]
-    data.replace('-', "Null", inplace=True)
-    data.replace(np.nan, "Null", inplace=True)
-    # print(data.columns)
-    try:
-        for index, row in data.iterrows():
-            insert_query = f"INSERT OR REPLACE INTO current_daily_plan " \
-                           f"(hour_of_day, " \
-                           f"date_id, " \
-                           f"NationalPowerDemand," \
-                           f"TotalProductionCapacity_KSE," \
-                           f"TotalProductionCapacity_JGWa," \
-                           f"TotalProductionCapacity_JGFWa," \
-                           f"TotalProductionCapacity_JGMa," \
-                           f"TotalProductionCapacity_JGPVa," \
-                           f"TotalGeneration_ActiveJG," \
-                           f"TotalGeneration_JGWa," \
-                           f"TotalGeneration_JGFWa," \
-                           f"TotalGeneration_JGMa," \
-                           f"TotalGeneration_JGPVa," \
-                           f"TotalGeneration_NonParticipatingUnits," \
-                           f"WindPowerGeneration," \
-                           f"PVPowerGeneration," \
-                           f"TotalChargingCapacity_JGMa," \
-                           f"NationalParallelExchangeBalance," \
-                           f"NationalNonParallelExchangeBalance," \
-                           f"ExcessCapacityAboveDemand," \
-                           f"ExcessCapacityBelowDemand," \
-                           f"TotalCapacityFromUtilizedLoadReductionOffers_JGOa)" \
-                           f"VALUES ({row['Godzina']}, " \
-                           f"{date_id}, " \
-                           f"{row['Krajowe zapotrzebowanie na moc']}, " \
-                           f"{row['Suma zdolnoci wytw๓rczych jednostek wytw๓rczych w KSE']}, " \
-                           f"{row['Suma zdolnoci wytw๓rczych JGWa']}, " \
-                           f"{row['Suma zdolnoci wytw๓rczych JGFWa']}, " \
-                           f"{row['Suma zdolnoci wytw๓rczych JGMa']}, " \
-                           f"{row['Suma zdolnoci wytw๓rczych JGPVa']}, " \
-                           f"{row['Sumaryczna generacja JG aktywnych: JGWa, JGFWa, JGMa i JGPVa']}, " \
-                           f"{row['Sumaryczna generacja JGWa']}," \
-                           f"{row['Sumaryczna generacja JGFWa']}, " \
-                           f"{row['Sumaryczna generacja JGMa']}, " \
-                           f"{row['Sumaryczna generacja JGPVa']}, " \
-                           f"{row['Sumaryczna generacja jednostek wytw๓rczych nieuczestniczนcych aktywnie w Rynku Bilansujนcym']}, " \
-                           f"{row['Generacja r๓deณ wiatrowych']}, " \
-                           f"{row['Generacja r๓deณ fotowoltaicznych']}, " \
-                           f"{row['Sumaryczna moc ณadowania JGMa']}, " \
-                           f"{row['Krajowe saldo wymiany mi๊dzysystemowej r๓wnolegณej']}, " \
-                           f"{row['Krajowe saldo wymiany mi๊dzysystemowej nier๓wnolegณej']}, " \
-                           f"{row['Rezerwa mocy ponad zapotrzebowanie']}, " \
-                           f"{row['Rezerwa mocy poniฟej zapotrzebowania']}, " \
-                           f"{row['Suma mocy z wykorzystanych Ofert Redukcji Obciนฟenia JGOa']})"
-            # print(insert_query)
-            DB.insert_data(insert_query)
-        print("Data from PSE Current Daily Coordination Plan saved correctly.")
-    except sqlite3.DatabaseError as e:
-        print(e)
+    Fetches the sources of a day concurrently and saves each one as soon as it arrives.
+
+    Every source is fetched in its own thread, so the run takes as long as the slowest source
+    instead of the sum of all of them. Only the calling thread writes to the database, and each
+    source is saved in its own transaction by ingest(): a source that fails to download or to
+    save does not affect the others.
+
+    Args:
+        date (datetime): The date for which to fetch the data.
+        database_name (str): Path to the SQLite database.
+        sources (list): ServicesEnergy constants to fetch, all sources by default.
+
+    Returns:
+        dict: Run report with the outcome, row count and timings of every source.
+    """
+    started = time.perf_counter()
+    sources = list(SOURCES) if sources is None else sources
+    db = Database(database_name)
+    reports = []
+    with ThreadPoolExecutor(max_workers=max(len(sources), 1),
+                            thread_name_prefix='fetch') as executor:
+        futures = [executor.submit(_timed_fetch, date, source) for source in sources]
+        for future in as_completed(futures):
+            result, fetch_seconds = future.result()
+            report = {**result.to_dict(), 'table': SOURCES[result.source][0], 'rows': 0,
+                      'fetch_seconds': round(fetch_seconds, 3)}
+            if result.ok:
+                saved = time.perf_counter()
+                try:
+                    report['rows'] = ingest(db, result.source, result.data)
+                    # Day the rows were stored under, as set by the fetcher
+                    report['saved_day'] = result.data.index[0].strftime('%Y-%m-%d')
+                except Exception as e:
+                    # The failure stays with its source; a locked database is worth retrying,
+                    # a schema mismatch or a renamed column of the source is not
+                    report.update(ok=False, error=f"{type(e).__name__}: {e}",
+                                  retry_later=isinstance(e, sqlite3.OperationalError))
+                report['save_seconds'] = round(time.perf_counter() - saved, 3)
+            print(f"{report['table']}: " + (f"saved {report['rows']} rows" if report['ok']
+                                            else f"failed ({report['error']})"),
+                  file=sys.stderr)
+            reports.append(report)
+    reports.sort(key=lambda report: report['source'])
+    return {'day': date.strftime('%Y-%m-%d'), 'ok': all(report['ok'] for report in reports),
+            'rows': sum(report['rows'] for report in reports),
+            'seconds': round(time.perf_counter() - started, 3), 'sources': reports}
 
 
 if __name__ == "__main__":
-    DATE = datetime.now()
-    DB = Database("energy.db")
-    SQLITE_PATH = 'energy.db'
-
-    # Day Ahead
-    print("Day Ahead is being fetched...")
-    df_da = fetch_data(DATE, ServicesEnergy.DAY_AHEAD)
-    # Save date which was fetched from Day Ahead
-    insert_date(DB, df_da)
-    # Save data which was fetched from Day Ahead
-    insert_day_ahead(DB, df_da)
-
-    # Intra Day
-    print("Intra Day is being fetched...")
-    df_intra = fetch_data(DATE, ServicesEnergy.INTRA_DAY)
-    # Save date which was fetched from Intra Day
-    insert_date(DB, df_intra)
-    # Save data which was fetched from Intra Day
-    insert_intra(DB, df_intra)
-
-    # PSE 5-years Plan
-    print("PSE 5-years Plan is being fetched...")
-    df_pse_5 = fetch_data(DATE, ServicesEnergy.PSE_5_YEARS_PLAN)
-    # Save date which was fetched from PSE 5-years Plan
-    insert_date(DB, df_pse_5)
-    # Save data which was fetched from PSE 5-years Plan
-    insert_pse_5(DB, df_pse_5)
-
-    # PSE PSE Balancing Market
-    print("PSE Balancing Market is being fetched...")
-    df_bal = fetch_data(DATE, ServicesEnergy.PSE_BALANCING_MARKET)
-    # Save date which was fetched from PSE Balancing Market
-    insert_date(DB, df_bal)
-    # Save data which was fetched from PSE Balancing Market
-    insert_pse_bal(DB, df_bal)
-
-    # PSE Current Daily
-    print("PSE Current Daily Coordination Plan is being fetched...")
-    df_curr = fetch_data(DATE, ServicesEnergy.PSE_CURRENT_DAILY_COORDINATION_PLAN)
-    # Save date which was fetched from PSE Balancing Market
-    insert_date(DB, df_curr)
-    # Save data which was fetched from PSE Balancing Market
-    insert_pse_current(DB, df_curr)
+    parser = argparse.ArgumentParser(
+        description="Fetch and save one day of every source. Prints a JSON run report and "
+                    "exits with 1 if a source failed.")
+    parser.add_argument('--date', type=lambda value: datetime.strptime(value, '%Y-%m-%d'),
+                        default=datetime.now(), help="day to fetch (YYYY-MM-DD), today by default")
+    parser.add_argument('--database', default='energy.db')
+    parser.add_argument('--sources', help="comma separated source numbers, all by default")
+    parser.add_argument('--report', help="also write the run report to this file")
+    options = parser.parse_args()
+
+    # Databases created by older versions get the utc_timestamp columns
+    migrate_command(options.database)
+    # Opt-in profile of the whole run (see profiling.py)
+    profiler = start_session('save', 'save')
+    run = run_daily(options.date, options.database,
+                    [int(source) for source in options.sources.split(',')]
+                    if options.sources else None)
+
+    # Hot store used by the API read path, reloaded from the earliest saved day
+    saved_days = [report['saved_day'] for report in run['sources'] if report.get('saved_day')]
+    if os.environ.get('HOT_STORE_DIR') and saved_days:
+        from hot_store import HotStoreWriter
+        HotStoreWriter(options.database, os.environ['HOT_STORE_DIR']).refresh(min(saved_days))
+        print("Hot store refreshed.", file=sys.stderr)
+    # Read-only snapshot served by the API replicas
+    if os.environ.get('SNAPSHOT_DIR'):
+        from snapshot import publish
+        print(f"Snapshot {publish(options.database, os.environ['SNAPSHOT_DIR'])} published.",
+              file=sys.stderr)
+
+    print("Ingest metrics:", file=sys.stderr)
+    print(METRICS.summary(), file=sys.stderr)
+    if profiler is not None:
+        profiler.stop()
+    report = json.dumps(run, indent=2)
+    if options.report:
+        with open(options.report, 'w', encoding='utf-8') as file:
+            file.write(report)
+    print(report)
+    sys.exit(0 if run['ok'] else 1)
@@ -0,0 +1,274 @@
+"""
+Long-running ingestion scheduler aligned with the publication times of the sources.
+
+Instead of polling all sources at a fixed cron time, every source has a publication window:
+the scheduler starts polling when the window opens, backs off exponentially while the data is
+not published yet and gives up when the window closes. Sources that publish revisions are
+fetched again at their revision cadence. Independent sources run concurrently and the state of
+every (source, day) job is persisted, so a restart continues where the previous run stopped.
+
+Usage:
+    python scheduler.py [energy.db] [scheduler_state.json]
+"""
+import json
+import os
+import random
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time as clock, timedelta
+
+from database import Database
+from metrics import METRICS
+from registry import ServicesEnergy
+from save import fetch_result, ingest
+from setup_sqlite import migrate_command
+from timemodel import MARKET_TIMEZONE
+
+
+class SourceSchedule:
+    """
+    Publication window and revision cadence of one source.
+
+    Args:
+        source (int): One of the ServicesEnergy constants.
+        name (str): Name used in the logs and in the state file.
+        day_offset (int): Day fetched relative to the local calendar day, e.g. 1 for
+            day-ahead prices of tomorrow or -1 for data that is complete the day after.
+        publish_after (datetime.time): Local time at which the data is usually published.
+        window (timedelta): How long after publish_after to keep polling before giving up.
+        revision_interval (timedelta): Interval between re-fetches of published data.
+        revise_for (timedelta): How long after the first successful fetch to keep revising.
+        min_backoff (float): First delay in seconds between polls of unpublished data.
+        max_backoff (float): Upper bound of the delay between polls.
+    """
+
+    def __init__(self, source: int, name: str, day_offset: int, publish_after: clock,
+                 window: timedelta, revision_interval: timedelta = None,
+                 revise_for: timedelta = timedelta(0), min_backoff: float = 60,
+                 max_backoff: float = 1800):
+        self.source = source
+        self.name = name
+        self.day_offset = day_offset
+        self.publish_after = publish_after
+        self.window = window
+        self.revision_interval = revision_interval
+        self.revise_for = revise_for
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+
+    def target_day(self, now: datetime) -> date:
+        return now.date() + timedelta(days=self.day_offset)
+
+    def window_opens(self, target: date) -> datetime:
+        local_day = target - timedelta(days=self.day_offset)
+        return datetime.combine(local_day, self.publish_after, tzinfo=MARKET_TIMEZONE)
+
+    def backoff(self, attempts: int) -> float:
+        delay = min(self.max_backoff, self.min_backoff * 2 ** max(attempts - 1, 0))
+        return delay * random.uniform(0.8, 1.2)
+
+
+# Default windows. TGE publishes the day-ahead fixing after 12:00 for the next day, intraday
+# trading of a day ends during that day, PSE publishes balancing prices the next day and
+# revises them, and the current daily coordination plan is updated throughout the day.
+DEFAULT_SCHEDULES = [
+    SourceSchedule(ServicesEnergy.DAY_AHEAD, 'day_ahead', 1, clock(12, 45), timedelta(hours=6)),
+    SourceSchedule(ServicesEnergy.INTRA_DAY, 'intra_day', -1, clock(1, 0), timedelta(hours=12)),
+    SourceSchedule(ServicesEnergy.PSE_5_YEARS_PLAN, 'five_years_plan', 1, clock(17, 0),
+                   timedelta(hours=6)),
+    SourceSchedule(ServicesEnergy.PSE_BALANCING_MARKET, 'balancing_market', -1, clock(10, 0),
+                   timedelta(hours=12), revision_interval=timedelta(days=1),
+                   revise_for=timedelta(days=3)),
+    SourceSchedule(ServicesEnergy.PSE_CURRENT_DAILY_COORDINATION_PLAN, 'current_daily_plan', 0,
+                   clock(0, 30), timedelta(hours=12), revision_interval=timedelta(hours=1),
+                   revise_for=timedelta(hours=23)),
+]
+
+
+class SchedulerState:
+    """
+    State of the (source, day) jobs, persisted as JSON after every change.
+
+    Each job holds its status ("pending", "done" or "missed"), the number of attempts, the
+    time of the next attempt and the time of the first successful fetch.
+
+    Args:
+        path (str): Path of the state file.
+        keep_days (int): Jobs older than this are dropped from the state.
+    """
+
+    def __init__(self, path: str, keep_days: int = 14):
+        self.path = path
+        self.keep_days = keep_days
+        self.lock = threading.Lock()
+        try:
+            with open(path, encoding='utf-8') as file:
+                self.jobs = json.load(file)
+        except FileNotFoundError:
+            self.jobs = {}
+
+    def get(self, name: str, target: date) -> dict:
+        with self.lock:
+            return dict(self.jobs.get(name, {}).get(target.isoformat(), {}))
+
+    def update(self, name: str, target: date, **values):
+        with self.lock:
+            job = self.jobs.setdefault(name, {}).setdefault(target.isoformat(), {})
+            job.update(values)
+            self._save()
+
+    def _save(self):
+        horizon = (date.today() - timedelta(days=self.keep_days)).isoformat()
+        for jobs in self.jobs.values():
+            for day in [day for day in jobs if day < horizon]:
+                del jobs[day]
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.jobs, file, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+class IngestScheduler:
+    """
+    Runs the fetch jobs of all schedules concurrently and saves their results.
+
+    Args:
+        database_name (str): Path to the SQLite database.
+        state_path (str): Path of the state file.
+        schedules (list[SourceSchedule]): Schedules of the sources.
+        tick (float): Seconds between two checks for due jobs.
+    """
+
+    def __init__(self, database_name: str = 'energy.db',
+                 state_path: str = 'scheduler_state.json', schedules: list = None,
+                 tick: float = 30):
+        self.database_name = database_name
+        self.state = SchedulerState(state_path)
+        self.schedules = schedules or DEFAULT_SCHEDULES
+        self.tick = tick
+        self.running = set()
+        self.write_lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def due_jobs(self, now: datetime) -> list:
+        """
+        List the (schedule, day) jobs that should run now.
+
+        Args:
+            now (datetime): Current time, timezone aware.
+
+        Returns:
+            list: Tuples of (SourceSchedule, date).
+        """
+        due = []
+        for schedule in self.schedules:
+            # Earlier targets are kept so that late publications and revisions still run.
+            lookback = 1 + schedule.revise_for.days + (1 if schedule.revise_for.seconds else 0)
+            for days_back in range(lookback, -1, -1):
+                target = schedule.target_day(now) - timedelta(days=days_back)
+                if (schedule.name, target) in self.running:
+                    continue
+                opens = schedule.window_opens(target)
+                if now < opens:
+                    continue
+                job = self.state.get(schedule.name, target)
+                status = job.get('status', 'pending')
+                if status == 'missed':
+                    continue
+                if status == 'pending' and now > opens + schedule.window:
+                    self.state.update(schedule.name, target, status='missed')
+                    print(f"{schedule.name} {target}: not published within its window")
+                    continue
+                if status == 'done':
+                    if schedule.revision_interval is None:
+                        continue
+                    first_success = datetime.fromisoformat(job['first_success'])
+                    if now > first_success + schedule.revise_for:
+                        continue
+                next_attempt = job.get('next_attempt')
+                if next_attempt and now < datetime.fromisoformat(next_attempt):
+                    continue
+                due.append((schedule, target))
+        return due
+
+    def run_job(self, schedule: SourceSchedule, target: date):
+        """
+        Fetch one (source, day) and save it, scheduling the next attempt or revision.
+
+        Args:
+            schedule (SourceSchedule): Schedule of the source.
+            target (date): Day to fetch.
+        """
+        job = self.state.get(schedule.name, target)
+        attempts = job.get('attempts', 0) + 1
+        try:
+            result = fetch_result(datetime.combine(target, clock()), schedule.source)
+            if not result.ok:
+                raise result.error
+            with self.write_lock:
+                db = Database(self.database_name)
+                saved = ingest(db, schedule.source, result.data)
+                del db
+                self._refresh_hot_store(result.data.index[0].strftime('%Y-%m-%d'))
+                self._publish_snapshot()
+        except Exception as e:
+            # An open circuit breaker tells exactly when the host may be called again
+            delay = getattr(e, 'retry_after', None) or schedule.backoff(attempts)
+            print(f"{schedule.name} {target}: attempt {attempts} failed ({e}), "
+                  f"retrying in {delay:.0f}s")
+            next_attempt = datetime.now(MARKET_TIMEZONE) + timedelta(seconds=delay)
+            self.state.update(schedule.name, target, attempts=attempts,
+                              next_attempt=next_attempt.isoformat(), last_error=str(e))
+            return
+        now = datetime.now(MARKET_TIMEZONE)
+        values = {'status': 'done', 'attempts': 0, 'last_success': now.isoformat(),
+                  'first_success': job.get('first_success', now.isoformat())}
+        if schedule.revision_interval is not None:
+            values['next_attempt'] = (now + schedule.revision_interval).isoformat()
+        self.state.update(schedule.name, target, **values)
+        print(f"{schedule.name} {target}: saved {saved} rows")
+
+    def _refresh_hot_store(self, saved_day: str):
+        # Jobs of earlier days than the newest stored one (intraday, balancing market,
+        # revisions) must reload that day, not only the last day of the store
+        if os.environ.get('HOT_STORE_DIR'):
+            from hot_store import HotStoreWriter
+            HotStoreWriter(self.database_name, os.environ['HOT_STORE_DIR']).refresh(saved_day)
+
+    def _publish_snapshot(self):
+        if os.environ.get('SNAPSHOT_DIR'):
+            from snapshot import publish
+            publish(self.database_name, os.environ['SNAPSHOT_DIR'])
+
+    def _run_and_release(self, schedule: SourceSchedule, target: date):
+        try:
+            self.run_job(schedule, target)
+        finally:
+            self.running.discard((schedule.name, target))
+
+    def run_forever(self):
+        """
+        Check for due jobs every `tick` seconds until stop() is called.
+        """
+        with ThreadPoolExecutor(max_workers=len(self.schedules)) as executor:
+            while not self.stopped.is_set():
+                for schedule, target in self.due_jobs(datetime.now(MARKET_TIMEZONE)):
+                    self.running.add((schedule.name, target))
+                    executor.submit(self._run_and_release, schedule, target)
+                self.stopped.wait(self.tick)
+
+    def stop(self):
+        self.stopped.set()
+
+
+if __name__ == "__main__":
+    migrate_command(sys.argv[1] if len(sys.argv) > 1 else 'energy.db')
+    scheduler = IngestScheduler(sys.argv[1] if len(sys.argv) > 1 else 'energy.db',
+                                sys.argv[2] if len(sys.argv) > 2 else 'scheduler_state.json')
+    print(f"Scheduler started for {', '.join(s.name for s in scheduler.schedules)}")
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        scheduler.stop()
+        print(METRICS.summary())
@@ -0,0 +1,71 @@
+"""
+Description of the tables created by setup_sqlite.py.
+
+Kept free of heavy imports so that it can be used by the API as well as by the ingest scripts.
+"""
+from timemodel import MAX_HOURS_PER_DAY
+
+TABLES = {
+    'day_ahead': {
+        'id': 'day_ahead_id',
+        'columns': ['price'],
+    },
+    'intra_day': {
+        'id': 'intra_day_id',
+        'columns': ['intraday_avg_price', 'intraday_min_price', 'intraday_max_price'],
+    },
+    'current_daily_plan': {
+        'id': 'current_daily_plan_id',
+        'columns': ['NationalPowerDemand', 'TotalProductionCapacity_KSE',
+                    'TotalProductionCapacity_JGWa', 'TotalProductionCapacity_JGFWa',
+                    'TotalProductionCapacity_JGMa', 'TotalProductionCapacity_JGPVa',
+                    'TotalGeneration_ActiveJG', 'TotalGeneration_JGWa', 'TotalGeneration_JGFWa',
+                    'TotalGeneration_JGMa', 'TotalGeneration_JGPVa',
+                    'TotalGeneration_NonParticipatingUnits', 'WindPowerGeneration',
+                    'PVPowerGeneration', 'TotalChargingCapacity_JGMa',
+                    'NationalParallelExchangeBalance', 'NationalNonParallelExchangeBalance',
+                    'ExcessCapacityAboveDemand', 'ExcessCapacityBelowDemand',
+                    'TotalCapacityFromUtilizedLoadReductionOffers_JGOa'],
+    },
+    'balancing_market': {
+        'id': 'balancing_market_id',
+        'columns': ['CRO', 'CROs', 'CROz', 'AggregatedMarketParticipantsContractingStatus',
+                    'Imbalance'],
+    },
+    'five_years_plan': {
+        'id': 'five_years_plan_id',
+        'columns': ['GridDemandForecast', 'RequiredPowerReserve',
+                    'SurplusCapacityAvailableForTSO', 'GenerationCapacitySurplusForTSO',
+                    'AvailableCapacityBalancingMarketUnits',
+                    'AvailableForTSOCapacityBalancingMarketUnits',
+                    'PredictedGenerationBalancingMarket',
+                    'ForecastedGenerationNonBalancingMarket', 'WindTotalGenerationForecast',
+                    'PhotovoltaicTotalGenerationForecast',
+                    'PlannedCrossBorderElectricityExchange',
+                    'ForecastedUnavailabilityTransmissionAndDistribution',
+                    'GenerationCapacityUnavailabilityThermalUnitsBalancingMarket',
+                    'PredictedGenerationNonCoveredByCapacityMarketObligation',
+                    'CapacityMarketObligationAllUnits'],
+    },
+}
+
+# Hour slots per day of arrays indexed by hour: 23 are used on the spring DST day, 25 on the
+# autumn one (see timemodel.py)
+HOURS_PER_DAY = MAX_HOURS_PER_DAY
+
+
+def select_query(table: str) -> str:
+    """
+    Build the query used by the API for the given table.
+
+    Args:
+        table (str): Name of the table.
+
+    Returns:
+        str: SELECT statement returning id, date_value, hour_of_day and the value columns.
+    """
+    spec = TABLES[table]
+    columns = ", ".join(spec['columns'])
+    return f"SELECT {spec['id']}, date_value, hour_of_day, {columns} " \
+           f"FROM {table} " \
+           f"INNER JOIN date ON date.date_id = {table}.date_id"
@@ -1,10 +1,14 @@
+from analytics import ensure_schema
 from database import Database
 import sqlite3
+import sys
+from schema import TABLES
+from timemodel import utc_timestamp
 
 
-def setup_command():
+def setup_command(database_name: str = "energy.db"):
     try:
-        db = Database("energy.db")
+        db = Database(database_name)
         db.insert_data('CREATE TABLE date '
                         '(date_id INTEGER PRIMARY KEY AUTOINCREMENT, '
                         'date_value DATE UNIQUE)')
@@ -12,12 +16,14 @@ def setup_command():
                         '(day_ahead_id INTEGER PRIMARY KEY AUTOINCREMENT, '
                         'date_id INTEGER REFERENCES date(data_id),'
                         'hour_of_day INTEGER,'
+                        'utc_timestamp TEXT,'  # UTC start of the delivery hour (see timemodel.py)
                         'price DECIMAL(10, 2),'
                         'UNIQUE (date_id, hour_of_day))')
         db.insert_data('CREATE TABLE intra_day '
                         '(intra_day_id INTEGER PRIMARY KEY AUTOINCREMENT, '
                         'date_id INTEGER REFERENCES date(data_id),'
                         'hour_of_day INTEGER,'
+                        'utc_timestamp TEXT,'  # UTC start of the delivery hour (see timemodel.py)
                         'intraday_avg_price DECIMAL(10, 2),'
                         'intraday_min_price DECIMAL(10, 2),'
                         'intraday_max_price DECIMAL(10, 2),'
@@ -26,6 +32,7 @@ def setup_command():
                         '(current_daily_plan_id INTEGER PRIMARY KEY AUTOINCREMENT, '
                         'date_id INTEGER REFERENCES date(data_id),'
                         'hour_of_day INTEGER,'
+                        'utc_timestamp TEXT,'  # UTC start of the delivery hour (see timemodel.py)
                         'NationalPowerDemand DECIMAL(10, 2),'  # Krajowe zapotrzebowanie na moc
                         'TotalProductionCapacity_KSE DECIMAL(10, 2),'  # Suma zdolności wytwórczych jednostek wytwórczych w KSE
                         'TotalProductionCapacity_JGWa DECIMAL(10, 2),'  # Suma zdolności wytwórczych JGWa
@@ -51,6 +58,7 @@ def setup_command():
                         '(balancing_market_id INTEGER PRIMARY KEY AUTOINCREMENT, '
                         'date_id INTEGER REFERENCES date(data_id),'
                         'hour_of_day INTEGER,'
+                        'utc_timestamp TEXT,'  # UTC start of the delivery hour (see timemodel.py)
                         'CRO DECIMAL(10, 2),'
                         'CROs DECIMAL(10, 2),'
                         'CROz DECIMAL(10, 2),'
@@ -61,6 +69,7 @@ def setup_command():
                         '(five_years_plan_id INTEGER PRIMARY KEY AUTOINCREMENT, '
                         'date_id INTEGER REFERENCES date(data_id),'
                         'hour_of_day INTEGER,'
+                        'utc_timestamp TEXT,'  # UTC start of the delivery hour (see timemodel.py)
                         'GridDemandForecast DECIMAL(10, 2),'  # Prognozowane zapotrzebowanie sieci
                         'RequiredPowerReserve DECIMAL(10, 2),'  # Wymagana rezerwa mocy OSP
                         'SurplusCapacityAvailableForTSO DECIMAL(10, 2),'  # Nadwyżka mocy dostępna dla OSP (7) + (9) - [(3) - (12)] - (13)
@@ -77,11 +86,42 @@ def setup_command():
                         'PredictedGenerationNonCoveredByCapacityMarketObligation DECIMAL(10, 2),'  # Przewidywana generacja zasobów wytwórczych nieobjętych obowiązkami mocowymi
                         'CapacityMarketObligationAllUnits DECIMAL(10, 2),'  # Obowiązki mocowe wszystkich jednostek rynku mocy
                         'UNIQUE (date_id, hour_of_day))')
+        ensure_schema(db.connection)
     except sqlite3.Error as e:
         print(f"Error creating table: {e}")
     finally:
         print("Table created successfully!")
 
 
+def migrate_command(database_name: str = "energy.db"):
+    """
+    Bring a database created by an older version up to date; does nothing if it already is.
+
+    Adds the utc_timestamp column to the data tables and fills it from date_value and
+    hour_of_day, and creates the analytics tables. Hours of DST days saved before the hours were numbered per day keep their
+    old numbering; reprocess.py re-parses them from the raw archive.
+
+    Args:
+        database_name (str): Path to the SQLite database.
+    """
+    db = Database(database_name)
+    db.connection.create_function('market_utc', 2, utc_timestamp, deterministic=True)
+    with db.transaction():
+        for table in TABLES:
+            columns = [row[1] for row in db.select_data(f"PRAGMA table_info({table})")]
+            if not columns or 'utc_timestamp' in columns:
+                continue
+            db.insert_data(f"ALTER TABLE {table} ADD COLUMN utc_timestamp TEXT")
+            db.insert_data(f"UPDATE {table} SET utc_timestamp = market_utc("
+                           f"(SELECT date_value FROM date WHERE date.date_id = {table}.date_id), "
+                           f"hour_of_day)")
+            print(f"Added utc_timestamp to {table}")
+        # Tables of the rolling analytics (see analytics.py)
+        ensure_schema(db.connection)
+
+
 if __name__ == "__main__":
-    setup_command()
+    if len(sys.argv) > 1 and sys.argv[1] == 'migrate':
+        migrate_command(*sys.argv[2:3])
+    else:
+        setup_command()
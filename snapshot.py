@@ -0,0 +1,171 @@
+"""
+Read-only snapshots of the database for the API replicas.
+
+After every ingest a compact copy of the database is published as a new, never modified
+file snapshot-<UTC time>.db (VACUUM INTO, then ANALYZE so that the query planner has fresh
+statistics) and the CURRENT file is atomically replaced with its name. API processes
+started with SNAPSHOT_DIR open the file named in CURRENT read-only and immutable, with
+memory-mapped I/O, so their reads take no locks, never wait for the writer and share the
+pages of the OS cache. A new snapshot is picked up by the next request; requests already
+running finish on the version they started with.
+
+Snapshots are plain files, so replicas on other hosts can read a synced copy of the
+directory as long as each file is in place before CURRENT names it.
+
+Settings (environment):
+    SNAPSHOT_DIR          Directory of the snapshots; the API reads energy.db if unset.
+    SNAPSHOT_KEEP         Number of versions kept by publish (default 3).
+    SNAPSHOT_MMAP_SIZE    Bytes of each snapshot mapped into memory (default 1 GiB).
+
+Usage:
+    python snapshot.py publish [--database energy.db] [--dir snapshots] [--keep 3]
+    python snapshot.py current [--dir snapshots]
+"""
+import argparse
+import os
+import sqlite3
+import stat
+import threading
+import time
+from datetime import datetime, timezone
+
+from analytics import ensure_schema
+
+CURRENT_FILE = 'CURRENT'
+PREFIX = 'snapshot-'
+KEEP = int(os.environ.get('SNAPSHOT_KEEP', '3'))
+MMAP_SIZE = int(os.environ.get('SNAPSHOT_MMAP_SIZE', str(1 << 30)))
+
+
+def publish(database_name: str, snapshot_dir: str, keep: int = KEEP) -> str:
+    """
+    Publish the current content of the database as a new snapshot.
+
+    The copy is written under a temporary name, analyzed, made read-only and renamed, and
+    only then named in CURRENT, so readers never see a partial file.
+
+    Args:
+        database_name (str): Path to the SQLite database.
+        snapshot_dir (str): Directory of the snapshots, created if needed.
+        keep (int): Number of versions to keep, the new one included; at least 2, so that
+            a replica that has just read CURRENT can still open the file it names.
+
+    Returns:
+        str: Path to the new snapshot.
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+    name = f"{PREFIX}{datetime.now(timezone.utc):%Y%m%dT%H%M%S%fZ}.db"
+    path = os.path.join(snapshot_dir, name)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    source = sqlite3.connect(database_name)
+    try:
+        # One read transaction of the source: a consistent copy without blocking the writer
+        source.execute("VACUUM INTO ?", (tmp_path,))
+    finally:
+        source.close()
+    copy = sqlite3.connect(tmp_path)
+    try:
+        # The API reads the analytics tables even when they were never refreshed
+        ensure_schema(copy)
+        copy.execute("ANALYZE")
+        copy.commit()
+    finally:
+        copy.close()
+    os.chmod(tmp_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+    os.replace(tmp_path, path)
+
+    current_path = os.path.join(snapshot_dir, CURRENT_FILE)
+    with open(f"{current_path}.tmp", 'w', encoding='utf-8') as file:
+        file.write(name)
+    os.replace(f"{current_path}.tmp", current_path)
+    prune(snapshot_dir, max(keep, 2))
+    return path
+
+
+def versions(snapshot_dir: str) -> list:
+    """
+    File names of the published snapshots, oldest first.
+    """
+    return sorted(name for name in os.listdir(snapshot_dir)
+                  if name.startswith(PREFIX) and name.endswith('.db'))
+
+
+def prune(snapshot_dir: str, keep: int):
+    """
+    Delete all but the newest `keep` snapshots. Replicas still reading a deleted file keep
+    their open connection to it until they switch to a newer version.
+    """
+    for name in versions(snapshot_dir)[:-keep]:
+        os.remove(os.path.join(snapshot_dir, name))
+
+
+def connect(path: str, mmap_size: int = MMAP_SIZE) -> sqlite3.Connection:
+    """
+    Open a snapshot read-only and immutable, with memory-mapped I/O.
+
+    Args:
+        path (str): Path to the snapshot file.
+        mmap_size (int): Bytes of the file mapped into memory.
+
+    Returns:
+        sqlite3.Connection: The connection; writes fail, temporary tables work.
+    """
+    connection = sqlite3.connect(f"file:{path}?mode=ro&immutable=1", uri=True)
+    connection.execute(f"PRAGMA mmap_size = {int(mmap_size)}")
+    return connection
+
+
+class SnapshotDirectory:
+    """
+    The newest snapshot of a directory, as seen by one API process.
+
+    Args:
+        snapshot_dir (str): Directory written by publish().
+
+    Methods:
+        current(): Path to the newest snapshot, None before the first publish.
+    """
+
+    def __init__(self, snapshot_dir: str):
+        self.snapshot_dir = snapshot_dir
+        self.lock = threading.Lock()
+        self._version = None
+        self._path = None
+
+    def current(self) -> str:
+        """
+        Path to the snapshot named in CURRENT, re-read only when the file was replaced.
+
+        Returns:
+            str: Path to the snapshot, None if nothing was published yet.
+        """
+        current_path = os.path.join(self.snapshot_dir, CURRENT_FILE)
+        try:
+            status = os.stat(current_path)
+        except FileNotFoundError:
+            return None
+        # os.replace() gives CURRENT a new inode on every publish
+        version = (status.st_ino, status.st_mtime_ns)
+        with self.lock:
+            if version != self._version:
+                with open(current_path, encoding='utf-8') as file:
+                    self._path = os.path.join(self.snapshot_dir, file.read().strip())
+                self._version = version
+            return self._path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read-only snapshots for the API replicas")
+    parser.add_argument('command', choices=['publish', 'current'])
+    parser.add_argument('--database', default='energy.db')
+    parser.add_argument('--dir', default=os.environ.get('SNAPSHOT_DIR', 'snapshots'))
+    parser.add_argument('--keep', type=int, default=KEEP)
+    options = parser.parse_args()
+
+    if options.command == 'publish':
+        started = time.perf_counter()
+        snapshot = publish(options.database, options.dir, options.keep)
+        print(f"Published {snapshot} ({os.path.getsize(snapshot) / 1e6:.1f} MB) "
+              f"in {time.perf_counter() - started:.2f}s")
+    else:
+        print(SnapshotDirectory(options.dir).current() or "No snapshot published")
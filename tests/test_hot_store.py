@@ -0,0 +1,55 @@
+"""
+Refreshes of the hot store after days are saved out of order.
+
+Run with: python -m unittest discover tests
+"""
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from datetime import date
+
+from benchmarks.synthetic import synthetic_frame
+from database import Database
+from hot_store import HotStore, HotStoreWriter
+from registry import ServicesEnergy
+from save import ingest
+from setup_sqlite import setup_command
+
+
+class HotStoreRefreshTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.database_name = os.path.join(self.directory, 'energy.db')
+        self.store_dir = os.path.join(self.directory, 'hot_store')
+        setup_command(self.database_name)
+        self.generator = random.Random(0)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def ingest_day(self, source: int, day: date) -> str:
+        db = Database(self.database_name)
+        ingest(db, source, synthetic_frame(source, day, self.generator))
+        del db
+        return day.isoformat()
+
+    def test_older_day_saved_after_newer_one(self):
+        # Day-ahead data of the next day is saved before the balancing market of the day before
+        writer = HotStoreWriter(self.database_name, self.store_dir)
+        self.ingest_day(ServicesEnergy.DAY_AHEAD, date(2024, 1, 10))
+        writer.build()
+        writer.refresh(self.ingest_day(ServicesEnergy.DAY_AHEAD, date(2024, 1, 12)))
+        older = self.ingest_day(ServicesEnergy.PSE_BALANCING_MARKET, date(2024, 1, 11))
+        writer.refresh(older)
+
+        store = HotStore(self.store_dir)
+        self.assertEqual(len(store.select_by_date('balancing_market', older)), 24)
+        self.assertEqual(len(store.select_by_date('day_ahead', '2024-01-12')), 24)
+        self.assertEqual(len(store.select_by_date('day_ahead', '2024-01-10')), 24)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+"""
+Per-request profiles of the API when the view fails.
+
+Run with: python -m unittest discover tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import app
+import profiling
+
+
+class RequestProfileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        patches = [mock.patch.dict(os.environ, {'ENERGY_PROFILE_REQUESTS': '1'}),
+                   mock.patch.object(profiling, 'PROFILE_DIR', self.directory),
+                   mock.patch.dict(app.app.config, {'TESTING': True})]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.client = app.app.test_client()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_profile_of_failed_request_is_stopped(self):
+        headers = {'X-Energy-Profile': 'cprofile'}
+        # The test client re-raises the error of the view, so after_request is skipped
+        with mock.patch.object(app, 'get_db', side_effect=RuntimeError("database gone")):
+            with self.assertRaises(RuntimeError):
+                self.client.get('/days-ahead/2024-01-10', headers=headers)
+
+        self.assertFalse(profiling._cprofile_lock.locked())
+        self.assertIsNone(sys.getprofile())
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+        # The next request is profiled again
+        response = self.client.get('/metrics', headers=headers)
+        self.assertIn('X-Energy-Profile-File', response.headers)
+        self.assertFalse(profiling._cprofile_lock.locked())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,267 @@
+"""
+Append-only storage of intraday (TGE RDB) trades and vectorized analytics on top of it.
+
+Trades of every hourly contract are stored in their own binary file of fixed-size records
+(time, price, volume), e.g. ticks/2023-12-27/H07.bin. Files are only ever appended to and
+are read back with numpy.memmap, so metrics such as VWAP over an arbitrary window can be
+re-derived without downloading the graph-days documents from TGE again.
+
+Usage:
+    python tick_store.py 2023-12-27 [ticks_dir]
+"""
+import os
+import sys
+import warnings
+from collections import Counter
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from timemodel import hours_in_day
+
+TICK_DTYPE = np.dtype([('time', '<i8'), ('price', '<f8'), ('volume', '<f8')])
+# Sentinel stored in the time field when the trade has no timestamp.
+NO_TIME = np.iinfo(np.int64).min
+# Trade time field of the graph-days documents, e.g. {"czas": "2024-01-09 17:23:08", ...}
+TICK_TIME_FIELD = 'czas'
+
+
+def trades_to_records(trades: pd.DataFrame) -> np.ndarray:
+    """
+    Convert the trades of one graph-days document to tick records.
+
+    Args:
+        trades (pd.DataFrame): Trades with `czas` (time), `kurs` (price) and `volumen`
+            (volume) columns.
+
+    Returns:
+        np.ndarray: Records of TICK_DTYPE ordered by trade time, empty with a warning when
+        the document has no time field, since untimed ticks cannot be windowed nor
+        deduplicated.
+    """
+    if not {'kurs', 'volumen'} <= set(trades.columns):
+        # Contract hour without trades
+        return np.empty(0, dtype=TICK_DTYPE)
+    if TICK_TIME_FIELD not in trades.columns:
+        warnings.warn(f"graph-days trades without a {TICK_TIME_FIELD!r} field "
+                      f"(columns: {', '.join(map(str, trades.columns))}); not stored")
+        return np.empty(0, dtype=TICK_DTYPE)
+    records = np.empty(len(trades), dtype=TICK_DTYPE)
+    records['price'] = pd.to_numeric(trades['kurs'], errors='coerce').to_numpy(dtype=float)
+    records['volume'] = pd.to_numeric(trades['volumen'], errors='coerce').to_numpy(dtype=float)
+    times = pd.to_datetime(trades[TICK_TIME_FIELD], errors='coerce')
+    values = times.to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    values[times.isna().to_numpy()] = NO_TIME
+    records['time'] = values
+    # Stable, so trades sharing a timestamp keep the order of the document
+    return records[np.argsort(records['time'], kind='stable')]
+
+
+class TickStore:
+    """
+    Append-only columnar store of intraday trades, one file per contract hour.
+
+    Args:
+        root (str): Directory of the store.
+
+    Methods:
+        append(day, hour, trades): Store the trades not stored yet.
+        load(day, hour): Read the trades of one contract hour.
+        vwap(day, hour, start, end): Volume weighted average price within a time window.
+        daily_vwap(day): VWAP of every contract hour of a day.
+        volume_profile(day, hour, bins): Traded volume per price bucket.
+        last_minutes_vwap(day, hour, minutes): VWAP of the last N minutes of trading.
+    """
+
+    def __init__(self, root: str = 'ticks'):
+        self.root = root
+
+    def path(self, day: datetime, hour: int) -> str:
+        return os.path.join(self.root, day.strftime('%Y-%m-%d'), f"H{hour:02d}.bin")
+
+    def count(self, day: datetime, hour: int) -> int:
+        try:
+            return os.path.getsize(self.path(day, hour)) // TICK_DTYPE.itemsize
+        except FileNotFoundError:
+            return 0
+
+    def append(self, day: datetime, hour: int, trades) -> int:
+        """
+        Append the trades that are not stored yet.
+
+        graph-days always returns the full list of trades of a contract, in either order, so
+        the stored (time, price, volume) records are taken out of it once each and the rest
+        is appended in time order. New trades sharing the last stored timestamp are kept.
+
+        Args:
+            day (datetime): Delivery day of the contract.
+            hour (int): Contract hour, 1-based.
+            trades (pd.DataFrame | np.ndarray): Trades from graph-days or TICK_DTYPE records.
+
+        Returns:
+            int: The number of appended records.
+        """
+        if isinstance(trades, np.ndarray):
+            records = trades[np.argsort(trades['time'], kind='stable')]
+        else:
+            records = trades_to_records(trades)
+        stored = self.load(day, hour)
+        if len(stored):
+            # NaN never equals itself, so compare the raw bytes of the records
+            seen = Counter(stored.tobytes()[offset:offset + TICK_DTYPE.itemsize]
+                           for offset in range(0, stored.nbytes, TICK_DTYPE.itemsize))
+            new = np.ones(len(records), dtype=bool)
+            for index, record in enumerate(records):
+                key = record.tobytes()
+                if seen[key]:
+                    seen[key] -= 1
+                    new[index] = False
+            records = records[new]
+        if not len(records):
+            return 0
+        path = self.path(day, hour)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'ab') as file:
+            file.write(records.tobytes())
+        return len(records)
+
+    def append_day(self, day: datetime, trades: dict) -> int:
+        """
+        Append the trades of all contract hours of a day.
+
+        Args:
+            day (datetime): Delivery day.
+            trades (dict): Hour -> trades, as kept by IntraDayMarketFetcher.
+
+        Returns:
+            int: The number of appended records.
+        """
+        return sum(self.append(day, hour, hour_trades) for hour, hour_trades in trades.items())
+
+    def load(self, day: datetime, hour: int) -> np.ndarray:
+        """
+        Read the trades of one contract hour.
+
+        Args:
+            day (datetime): Delivery day of the contract.
+            hour (int): Contract hour, 1-based.
+
+        Returns:
+            np.ndarray: Read-only records of TICK_DTYPE, empty if nothing was stored.
+        """
+        count = self.count(day, hour)
+        if not count:
+            return np.empty(0, dtype=TICK_DTYPE)
+        return np.memmap(self.path(day, hour), dtype=TICK_DTYPE, mode='r', shape=(count,))
+
+    @staticmethod
+    def _vwap(records: np.ndarray) -> float:
+        mask = ~np.isnan(records['price']) & ~np.isnan(records['volume'])
+        volume = records['volume'][mask].sum()
+        if volume == 0:
+            return np.nan
+        return float(np.dot(records['price'][mask], records['volume'][mask]) / volume)
+
+    @staticmethod
+    def _window(records: np.ndarray, start: datetime = None, end: datetime = None) -> np.ndarray:
+        if start is None and end is None:
+            return records
+        times = records['time']
+        mask = times != NO_TIME
+        if start is not None:
+            mask &= times >= np.datetime64(start, 'ns').astype(np.int64)
+        if end is not None:
+            mask &= times < np.datetime64(end, 'ns').astype(np.int64)
+        return records[mask]
+
+    def vwap(self, day: datetime, hour: int, start: datetime = None,
+             end: datetime = None) -> float:
+        """
+        Volume weighted average price of the trades in [start, end).
+
+        Args:
+            day (datetime): Delivery day of the contract.
+            hour (int): Contract hour, 1-based.
+            start (datetime): Beginning of the window, None for the first trade.
+            end (datetime): End of the window, None for the last trade.
+
+        Returns:
+            float: The VWAP, NaN if there were no trades.
+        """
+        return self._vwap(self._window(self.load(day, hour), start, end))
+
+    def daily_vwap(self, day: datetime, hours=None) -> np.ndarray:
+        """
+        VWAP of every contract hour of a day in a single pass over the stored records.
+
+        Args:
+            day (datetime): Delivery day.
+            hours (iterable): Contract hours, 1-based; all 23, 24 or 25 hours of the day by
+                default.
+
+        Returns:
+            np.ndarray: One VWAP per hour, NaN for hours without trades.
+        """
+        hours = list(range(1, hours_in_day(day) + 1) if hours is None else hours)
+        chunks = [self.load(day, hour) for hour in hours]
+        if not any(len(chunk) for chunk in chunks):
+            return np.full(len(hours), np.nan)
+        records = np.concatenate(chunks)
+        owner = np.repeat(np.arange(len(hours)), [len(chunk) for chunk in chunks])
+        valid = ~np.isnan(records['price']) & ~np.isnan(records['volume'])
+        volume = np.bincount(owner[valid], weights=records['volume'][valid], minlength=len(hours))
+        turnover = np.bincount(owner[valid], weights=(records['price'] * records['volume'])[valid],
+                               minlength=len(hours))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(volume > 0, turnover / volume, np.nan)
+
+    def volume_profile(self, day: datetime, hour: int, bins: int = 20) -> pd.DataFrame:
+        """
+        Traded volume per price bucket.
+
+        Args:
+            day (datetime): Delivery day of the contract.
+            hour (int): Contract hour, 1-based.
+            bins (int): Number of price buckets.
+
+        Returns:
+            pd.DataFrame: Columns price_from, price_to and volume.
+        """
+        records = self.load(day, hour)
+        valid = ~np.isnan(records['price']) & ~np.isnan(records['volume'])
+        if not valid.any():
+            return pd.DataFrame(columns=['price_from', 'price_to', 'volume'])
+        volume, edges = np.histogram(records['price'][valid], bins=bins,
+                                     weights=records['volume'][valid])
+        return pd.DataFrame({'price_from': edges[:-1], 'price_to': edges[1:], 'volume': volume})
+
+    def last_minutes_vwap(self, day: datetime, hour: int, minutes: int) -> float:
+        """
+        VWAP of the trades of the last `minutes` minutes before the last stored trade.
+
+        Args:
+            day (datetime): Delivery day of the contract.
+            hour (int): Contract hour, 1-based.
+            minutes (int): Length of the window.
+
+        Returns:
+            float: The VWAP, NaN if there were no timestamped trades.
+        """
+        records = self.load(day, hour)
+        times = records['time'][records['time'] != NO_TIME]
+        if not len(times):
+            return np.nan
+        end = times.max()
+        mask = (records['time'] != NO_TIME) & \
+               (records['time'] > end - np.int64(timedelta(minutes=minutes).total_seconds() * 1e9))
+        return self._vwap(records[mask])
+
+
+if __name__ == "__main__":
+    store = TickStore(sys.argv[2] if len(sys.argv) > 2 else 'ticks')
+    delivery_day = datetime.strptime(sys.argv[1], '%Y-%m-%d') if len(sys.argv) > 1 \
+        else datetime.now()
+    for contract_hour, price in enumerate(store.daily_vwap(delivery_day), start=1):
+        print(f"H{contract_hour:02d}: trades={store.count(delivery_day, contract_hour)} "
+              f"vwap={price:.2f} last 30 min={store.last_minutes_vwap(delivery_day, contract_hour, 30):.2f}")
@@ -0,0 +1,155 @@
+"""
+Delivery hours of a market day, shared by the fetchers, save.py and the storage.
+
+The Polish market day runs from local midnight to local midnight in Europe/Warsaw, so it
+has 23 delivery hours on the last Sunday of March and 25 on the last Sunday of October.
+Every hour is stored in the slot hour_of_day = 1..hours_in_day(day), in delivery order,
+together with the UTC timestamp of its start. The sources label hours by the local hour
+at which they end ("1" is 00:00-01:00); the repeated autumn hour is labelled with an "A"
+suffix ("3" and "3A" are the two 02:00-03:00 hours).
+
+Kept free of heavy imports so that it can be used by the API as well as by the ingest scripts.
+"""
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+MARKET_TIMEZONE = ZoneInfo('Europe/Warsaw')
+# Hour slots of the longest (autumn DST) day; arrays indexed by hour use this size
+MAX_HOURS_PER_DAY = 25
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _as_date(day) -> date:
+    return day.date() if isinstance(day, datetime) else day
+
+
+@lru_cache(maxsize=4096)
+def _slots(day: date) -> tuple:
+    start = datetime.combine(day, time(), MARKET_TIMEZONE).astimezone(timezone.utc)
+    end = datetime.combine(day + timedelta(days=1), time(), MARKET_TIMEZONE).astimezone(
+        timezone.utc)
+    starts = []
+    moment = start
+    while moment < end:
+        starts.append(moment)
+        moment += timedelta(hours=1)
+    return tuple(starts)
+
+
+def hours_in_day(day) -> int:
+    """
+    Number of delivery hours of a day: 23, 24 or 25.
+
+    Args:
+        day (date | datetime): The market day.
+    """
+    return len(_slots(_as_date(day)))
+
+
+def utc_starts(day) -> list:
+    """
+    UTC start of every delivery hour of a day, in slot order.
+
+    Returns:
+        list: Timezone-aware datetimes.
+    """
+    return list(_slots(_as_date(day)))
+
+
+def utc_timestamp(day, hour_of_day: int) -> str:
+    """
+    UTC start of a delivery hour as stored in the utc_timestamp columns.
+
+    Args:
+        day (date | datetime | str): The market day, or its YYYY-MM-DD value.
+        hour_of_day (int): Slot of the hour, 1..hours_in_day(day).
+
+    Returns:
+        str: ISO 8601 timestamp, for example "2023-10-29T01:00:00Z"; None for a slot that
+        the day does not have.
+    """
+    if isinstance(day, str):
+        day = date.fromisoformat(day)
+    slots = _slots(_as_date(day))
+    hour_of_day = int(hour_of_day)
+    if not 1 <= hour_of_day <= len(slots):
+        return None
+    return slots[hour_of_day - 1].strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def epoch_hour(day, hour_of_day: int = 1) -> int:
+    """
+    Hours since 1970-01-01 00:00 UTC at the start of a delivery hour, a monotonic x axis.
+    """
+    if isinstance(day, str):
+        day = date.fromisoformat(day)
+    first = _slots(_as_date(day))[0]
+    return int((first - _EPOCH).total_seconds()) // 3600 + int(hour_of_day) - 1
+
+
+def hour_labels(day) -> list:
+    """
+    Labels of the delivery hours of a day as used by the sources, in slot order.
+
+    Returns:
+        list: For example ["1", "2", "4", ...] on a 23-hour day and
+        ["1", "2", "3", "3A", "4", ...] on a 25-hour day.
+    """
+    labels = []
+    for start in _slots(_as_date(day)):
+        label = str(start.astimezone(MARKET_TIMEZONE).hour + 1)
+        labels.append(label + 'A' if label in labels else label)
+    return labels
+
+
+def contract_name(label) -> str:
+    """
+    Name of the TGE intraday contract of a delivery hour: "H" and the two-digit local end
+    hour, with the "A" suffix of the repeated autumn hour kept after the digits.
+
+    Args:
+        label (int | str): Label of the hour, as returned by hour_labels().
+
+    Returns:
+        str: For example "H07", or "H03A" for the repeated hour of a 25-hour day.
+    """
+    text = str(label).strip().upper()
+    suffix = 'A' if text.endswith('A') else ''
+    return f"H{int(text.rstrip('A')):02d}{suffix}"
+
+
+def hour_slot(day, label) -> int:
+    """
+    Slot of an hour labelled by a source.
+
+    Args:
+        day (date | datetime): The market day.
+        label (int | str): Local end hour ("1".."24", or 3 for 02:00-03:00), with an "A"
+            suffix for the repeated autumn hour. Any "A" label is the repeated hour, so
+            sources numbering it "2A" are understood too.
+
+    Returns:
+        int: The slot, 1..hours_in_day(day).
+
+    Raises:
+        ValueError: If the label does not name an hour of the day.
+    """
+    labels = hour_labels(day)
+    text = str(label).strip().upper()
+    if text.endswith('.0'):
+        text = text[:-2]
+    if text.endswith('A'):
+        repeated = [index for index, value in enumerate(labels, start=1) if value.endswith('A')]
+        if repeated:
+            return repeated[0]
+    elif text.lstrip('0') in labels:
+        return labels.index(text.lstrip('0')) + 1
+    raise ValueError(f"No hour {label} on {_as_date(day)}")
+
+
+def hour_slots(day, labels) -> list:
+    """
+    Slots of a sequence of labels, see hour_slot().
+    """
+    return [hour_slot(day, label) for label in labels]
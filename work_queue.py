@@ -0,0 +1,449 @@
+"""
+Durable queue of (source, day) backfill tasks shared by several worker processes.
+
+The queue is a small SQLite database, separate from energy.db, so workers on several hosts
+can share it through a common filesystem (SQLite needs working POSIX locks there, e.g. NFSv4;
+WAL mode is not used because it needs shared memory on one host). A worker claims tasks by
+taking a lease, extends it with heartbeats while it works and marks the task done when the
+rows are saved. A worker that crashes simply stops heartbeating: its leases expire and
+another worker claims the tasks again. Saving is idempotent (rows are upserted by date and
+hour, trades already stored for the day are skipped record by record), so a task that is run
+twice after a crash does not duplicate data, and completing a task is fenced by the lease
+owner. Leases use the wall clock, so the hosts should be synchronized (NTP).
+
+Failed tasks are retried with exponential backoff; tasks that fail permanently, or too often,
+are moved to the dead letter state and can be requeued by hand.
+
+Usage:
+    python work_queue.py enqueue --start 2023-01-01 --end 2023-12-31 [--sources 0,1]
+    python work_queue.py work [--database energy.db] [--batch 4] [--rate-share 4]
+    python work_queue.py stats
+    python work_queue.py requeue-dead
+"""
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from registry import FETCHERS
+
+QUEUE_PATH = os.environ.get('WORK_QUEUE_PATH', 'work_queue.db')
+
+STATUSES = ('pending', 'leased', 'done', 'dead')
+
+
+class Task:
+    """
+    One claimed (source, day) task.
+
+    Args:
+        source (int): One of the ServicesEnergy constants.
+        day (datetime): Day to fetch.
+        attempts (int): Number of claims so far, including this one.
+    """
+
+    def __init__(self, source: int, day: datetime, attempts: int):
+        self.source = source
+        self.day = day
+        self.attempts = attempts
+
+    @property
+    def key(self) -> tuple:
+        return self.source, self.day.strftime('%Y-%m-%d')
+
+    def __repr__(self):
+        return f"Task({self.source}, {self.day:%Y-%m-%d}, attempt {self.attempts})"
+
+
+class WorkQueue:
+    """
+    Lease-based queue of (source, day) tasks stored in SQLite.
+
+    Every method uses its own short transaction, so the queue can be shared by threads and
+    processes. Claiming runs in an IMMEDIATE transaction, which serializes concurrent claims.
+
+    Args:
+        path (str): Path of the queue database, created if it does not exist.
+        lease_seconds (float): How long a claim is valid without a heartbeat.
+        max_attempts (int): Claims after which a failing task is dead-lettered.
+        backoff (float): Delay in seconds before the first retry, doubled on every attempt.
+        max_backoff (float): Upper bound of the retry delay.
+    """
+
+    def __init__(self, path: str = QUEUE_PATH, lease_seconds: float = 120,
+                 max_attempts: int = 5, backoff: float = 30, max_backoff: float = 3600):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.local = threading.local()
+        with self._transaction() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS task '
+                '(source INTEGER NOT NULL,'
+                'day DATE NOT NULL,'
+                "status TEXT NOT NULL DEFAULT 'pending',"
+                'attempts INTEGER NOT NULL DEFAULT 0,'
+                'not_before REAL NOT NULL DEFAULT 0,'
+                'lease_owner TEXT,'
+                'lease_expires REAL,'
+                'rows INTEGER,'
+                'last_error TEXT,'
+                'updated REAL,'
+                'PRIMARY KEY (source, day))')
+            connection.execute('CREATE INDEX IF NOT EXISTS task_status '
+                               'ON task (status, not_before)')
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            # Autocommit mode, transactions are opened explicitly
+            connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            self.local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def enqueue(self, tasks: list) -> int:
+        """
+        Add (source, day) tasks, ignoring the ones already queued.
+
+        Args:
+            tasks (list): Tuples of (source, day).
+
+        Returns:
+            int: The number of added tasks.
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            before = connection.total_changes
+            connection.executemany(
+                'INSERT OR IGNORE INTO task (source, day, updated) VALUES (?, ?, ?)',
+                [(source, day.strftime('%Y-%m-%d'), now) for source, day in tasks])
+            return connection.total_changes - before
+
+    def claim(self, owner: str, limit: int = 1) -> list:
+        """
+        Lease up to `limit` tasks that are due, including tasks whose lease expired.
+
+        An expired task that already used all its attempts is dead-lettered instead, so a
+        task that keeps crashing its workers does not block the queue.
+
+        Args:
+            owner (str): Identifier of the worker.
+            limit (int): Maximum number of tasks to claim.
+
+        Returns:
+            list[Task]: The claimed tasks, empty if none is due.
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE task SET status = 'dead', lease_owner = NULL, updated = ?,"
+                "last_error = 'lease expired on the last attempt' "
+                "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, now, self.max_attempts))
+            rows = connection.execute(
+                "SELECT source, day, attempts FROM task "
+                "WHERE (status = 'pending' AND not_before <= ?) "
+                "OR (status = 'leased' AND lease_expires < ?) "
+                "ORDER BY day, source LIMIT ?", (now, now, limit)).fetchall()
+            connection.executemany(
+                "UPDATE task SET status = 'leased', attempts = attempts + 1, lease_owner = ?,"
+                "lease_expires = ?, updated = ? WHERE source = ? AND day = ?",
+                [(owner, now + self.lease_seconds, now, source, day) for source, day, _ in rows])
+        return [Task(source, datetime.strptime(day, '%Y-%m-%d'), attempts + 1)
+                for source, day, attempts in rows]
+
+    def heartbeat(self, owner: str, tasks: list) -> list:
+        """
+        Extend the leases of tasks still held by the worker.
+
+        Args:
+            owner (str): Identifier of the worker.
+            tasks (list[Task]): Tasks being worked on.
+
+        Returns:
+            list[Task]: The tasks whose lease was lost, e.g. after a long pause.
+        """
+        now = time.time()
+        lost = []
+        with self._transaction() as connection:
+            for task in tasks:
+                cursor = connection.execute(
+                    "UPDATE task SET lease_expires = ?, updated = ? WHERE source = ? AND day = ? "
+                    "AND status = 'leased' AND lease_owner = ?",
+                    (now + self.lease_seconds, now, *task.key, owner))
+                if cursor.rowcount == 0:
+                    lost.append(task)
+        return lost
+
+    def complete(self, owner: str, task: Task, rows: int) -> bool:
+        """
+        Mark a task done if the worker still holds its lease.
+
+        Returns:
+            bool: False if the lease was lost and another worker owns the task.
+        """
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE task SET status = 'done', rows = ?, lease_owner = NULL,"
+                "lease_expires = NULL, last_error = NULL, updated = ? "
+                "WHERE source = ? AND day = ? AND status = 'leased' AND lease_owner = ?",
+                (rows, time.time(), *task.key, owner))
+            return cursor.rowcount == 1
+
+    def fail(self, owner: str, task: Task, error: str, transient: bool = True,
+             retry_after: float = None) -> str:
+        """
+        Release a failed task for a later retry, or dead-letter it.
+
+        Args:
+            owner (str): Identifier of the worker.
+            task (Task): The failed task.
+            error (str): Description of the failure.
+            transient (bool): False if retrying the same day cannot succeed.
+            retry_after (float): Seconds to wait before the retry, if known.
+
+        Returns:
+            str: The new status ("pending" or "dead"), None if the lease was lost.
+        """
+        now = time.time()
+        if transient and task.attempts < self.max_attempts:
+            status = 'pending'
+            delay = retry_after or min(self.max_backoff, self.backoff * 2 ** (task.attempts - 1))
+        else:
+            status, delay = 'dead', 0
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE task SET status = ?, not_before = ?, last_error = ?, lease_owner = NULL,"
+                "lease_expires = NULL, updated = ? "
+                "WHERE source = ? AND day = ? AND status = 'leased' AND lease_owner = ?",
+                (status, now + delay, error, now, *task.key, owner))
+        return status if cursor.rowcount == 1 else None
+
+    def requeue_dead(self) -> int:
+        """
+        Give every dead-lettered task a new set of attempts.
+
+        Returns:
+            int: The number of requeued tasks.
+        """
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE task SET status = 'pending', attempts = 0, not_before = 0, updated = ? "
+                "WHERE status = 'dead'", (time.time(),))
+            return cursor.rowcount
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Number of tasks per status, and the errors of the dead-lettered tasks.
+        """
+        connection = self._connection()
+        counts = dict(connection.execute('SELECT status, COUNT(*) FROM task GROUP BY status'))
+        dead = connection.execute(
+            "SELECT source, day, attempts, last_error FROM task WHERE status = 'dead' "
+            "ORDER BY day, source LIMIT 100").fetchall()
+        return {**{status: counts.get(status, 0) for status in STATUSES},
+                'dead_tasks': [{'source': source, 'day': day, 'attempts': attempts,
+                                'error': error} for source, day, attempts, error in dead]}
+
+
+def share_limits(limits: dict, workers: int) -> dict:
+    """
+    Split the per-host request budgets between the workers of a backfill.
+
+    Every process has its own rate limiter, so N workers would together send N times the
+    budget of a host. Dividing the budgets keeps all of them within the upstream limits.
+
+    Args:
+        limits (dict): Host -> budgets, as rate_limit.HOST_LIMITS.
+        workers (int): Number of worker processes sharing the hosts.
+
+    Returns:
+        dict: Host -> budgets of one worker.
+    """
+    shared = {}
+    for host, budget in limits.items():
+        shared[host] = dict(budget)
+        if 'rate' in budget:
+            shared[host]['rate'] = budget['rate'] / workers
+        for name in ('burst', 'initial_concurrency', 'max_concurrency'):
+            if name in budget:
+                shared[host][name] = max(1, budget[name] // workers)
+    return shared
+
+
+class QueueWorker:
+    """
+    Claims tasks from the queue, fetches them with the registered fetchers and saves them.
+
+    Args:
+        queue (WorkQueue): The shared queue.
+        database_name (str): Path to the SQLite database receiving the rows.
+        batch (int): Tasks claimed at once; their rows are saved over one connection.
+        idle_sleep (float): Seconds to wait when no task is due.
+    """
+
+    def __init__(self, queue: WorkQueue, database_name: str = 'energy.db', batch: int = 4,
+                 idle_sleep: float = 5):
+        self.queue = queue
+        self.database_name = database_name
+        self.batch = batch
+        self.idle_sleep = idle_sleep
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.held = []
+        self.held_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.counts = {'done': 0, 'retried': 0, 'dead': 0, 'lost': 0, 'rows': 0}
+
+    def _heartbeat(self):
+        while not self.stopped.wait(self.queue.lease_seconds / 3):
+            with self.held_lock:
+                held = list(self.held)
+            if not held:
+                continue
+            for task in self.queue.heartbeat(self.owner, held):
+                print(f"{task}: lease lost, another worker will run it")
+
+    def run_task(self, db, task: Task):
+        """
+        Fetch and save one task, then report the outcome to the queue.
+
+        Args:
+            db (Database): Connection to the database receiving the rows.
+            task (Task): The claimed task.
+        """
+        # Imported here so that enqueueing and the stats do not load pandas
+        from save import fetch_result, ingest
+
+        name = FETCHERS.load(task.source).name
+        result = fetch_result(task.day, task.source)
+        error, transient = result.error, result.retry_later
+        if result.ok:
+            try:
+                rows = ingest(db, task.source, result.data)
+            except Exception as e:
+                # The task fails on its own and the worker goes on with the rest of its leases;
+                # a locked database is worth retrying, a schema mismatch or a parse error is not
+                error = f"{type(e).__name__}: {e}"
+                transient = isinstance(e, sqlite3.OperationalError)
+        if error is not None:
+            status = self.queue.fail(self.owner, task, str(error), transient, result.retry_after)
+            self.counts['retried' if status == 'pending' else 'dead' if status else 'lost'] += 1
+            print(f"{name} {task.day:%Y-%m-%d}: attempt {task.attempts} failed ({error}), "
+                  f"{status or 'lease lost'}")
+            return
+        if self.queue.complete(self.owner, task, rows):
+            self.counts['done'] += 1
+            self.counts['rows'] += rows
+            print(f"{name} {task.day:%Y-%m-%d}: saved {rows} rows")
+        else:
+            self.counts['lost'] += 1
+            print(f"{name} {task.day:%Y-%m-%d}: saved, but the lease was lost")
+
+    def run(self, drain: bool = False) -> dict:
+        """
+        Work on the queue until stop() is called, or until no task is due if `drain` is set.
+
+        Args:
+            drain (bool): Exit when the queue has no due task instead of waiting.
+
+        Returns:
+            dict: Numbers of done, retried, dead-lettered and lost tasks and saved rows.
+        """
+        from database import Database
+
+        db = Database(self.database_name)
+        heartbeat = threading.Thread(target=self._heartbeat, name='queue-heartbeat',
+                                     daemon=True)
+        heartbeat.start()
+        try:
+            while not self.stopped.is_set():
+                tasks = self.queue.claim(self.owner, self.batch)
+                if not tasks:
+                    if drain:
+                        break
+                    self.stopped.wait(self.idle_sleep)
+                    continue
+                with self.held_lock:
+                    self.held = list(tasks)
+                for task in tasks:
+                    self.run_task(db, task)
+                    with self.held_lock:
+                        self.held.remove(task)
+        finally:
+            self.stopped.set()
+            heartbeat.join()
+        return self.counts
+
+    def stop(self):
+        self.stopped.set()
+
+
+def day_range(start: datetime, end: datetime) -> list:
+    return [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distributed backfill work queue")
+    parser.add_argument('command', choices=('enqueue', 'work', 'stats', 'requeue-dead'))
+    parser.add_argument('--queue', default=QUEUE_PATH)
+    parser.add_argument('--sources', help="comma separated source numbers")
+    parser.add_argument('--start', type=lambda value: datetime.strptime(value, '%Y-%m-%d'))
+    parser.add_argument('--end', type=lambda value: datetime.strptime(value, '%Y-%m-%d'))
+    parser.add_argument('--database', default='energy.db')
+    parser.add_argument('--batch', type=int, default=4)
+    parser.add_argument('--lease', type=float, default=120, help="lease in seconds")
+    parser.add_argument('--max-attempts', type=int, default=5)
+    parser.add_argument('--rate-share', type=int, default=1,
+                        help="number of workers sharing the upstream request budgets")
+    parser.add_argument('--drain', action='store_true', help="exit when no task is due")
+    options = parser.parse_args()
+
+    work_queue = WorkQueue(options.queue, options.lease, options.max_attempts)
+    if options.command == 'enqueue':
+        if options.start is None:
+            parser.error("enqueue needs --start")
+        sources = ([int(source) for source in options.sources.split(',')]
+                   if options.sources else FETCHERS.sources())
+        days = day_range(options.start, options.end or options.start)
+        added = work_queue.enqueue([(source, day) for day in days for source in sources])
+        print(f"Enqueued {added} tasks.")
+    elif options.command == 'work':
+        if options.rate_share > 1:
+            from rate_limit import LIMITERS
+            LIMITERS.limits = share_limits(LIMITERS.limits, options.rate_share)
+        worker = QueueWorker(work_queue, options.database, options.batch)
+        from setup_sqlite import migrate_command, setup_command
+        if not os.path.exists(options.database):
+            setup_command(options.database)
+        else:
+            migrate_command(options.database)
+        try:
+            print(json.dumps(worker.run(drain=options.drain), indent=2))
+        except KeyboardInterrupt:
+            worker.stop()
+        # Fetch and ingest metrics, with the final limits and queue depth of every host
+        from metrics import METRICS
+        print(METRICS.summary())
+    elif options.command == 'requeue-dead':
+        print(f"Requeued {work_queue.requeue_dead()} tasks.")
+    print(json.dumps(work_queue.stats(), indent=2))